@@ -0,0 +1,236 @@
+"""
+Análisis histórico de consultas para el menú Reportes.
+Lee las consultas por bloques con pandas y acumula los agregados de cada bloque,
+de modo que la memoria depende del tamaño del bloque y no del período analizado.
+Los resultados se guardan en disco por rango de fechas.
+
+Si está instalado duckdb (opcional), los agregados se calculan en DuckDB sobre
+la misma base, con ejecución vectorizada; el Resumen que se devuelve es el mismo
+(MOTOR, y `python benchmarks/bench_analitica.py` para comparar los motores).
+"""
+import hashlib
+import os
+import pickle
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import db
+
+TAMANO_BLOQUE = 50_000
+DIRECTORIO_CACHE = '.cache_analitica'
+MAX_ARCHIVOS_CACHE = 50
+DIAS_SEMANA = ['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom']
+PRIORIDADES = ['Alta', 'Media', 'Baja']
+MOTOR = 'auto'  # 'sqlite', 'duckdb' o 'auto' (DuckDB si está instalado)
+# DuckDB descarga su extensión sqlite la primera vez; en un servidor sin internet,
+# ruta al archivo sqlite_scanner.duckdb_extension de la misma versión de duckdb
+EXTENSION_SQLITE_DUCKDB = None
+
+_error_duckdb = None  # con MOTOR 'auto', por qué no se puede usar DuckDB (no instalado o sin la extensión sqlite)
+
+
+class Resumen:
+    """Agregados de un período de consultas."""
+    def __init__(self, desde, hasta):
+        self.desde = desde
+        self.hasta = hasta
+        self.total = 0
+        self.mapa_calor = np.zeros((7, 24), dtype=np.int64)  # día de la semana x hora de llegada
+        self.por_medico = pd.Series(dtype='int64')  # consultas atendidas por médico
+        self.mix_prioridad = pd.DataFrame(columns=PRIORIDADES, dtype='int64')  # por día
+        self.estados_por_dia = pd.DataFrame(dtype='int64')  # total y canceladas por día
+
+    @property
+    def tasa_cancelacion(self):
+        """Serie diaria con la proporción de consultas canceladas."""
+        if self.estados_por_dia.empty:
+            return pd.Series(dtype='float64')
+        return self.estados_por_dia['canceladas'] / self.estados_por_dia['total']
+
+    def acumular(self, bloque):
+        fechas = pd.to_datetime(bloque['fecha_consulta'], format='ISO8601')
+        self.total += len(bloque)
+        celdas = fechas.dt.dayofweek.to_numpy() * 24 + fechas.dt.hour.to_numpy()
+        self.mapa_calor += np.bincount(celdas, minlength=7 * 24).reshape(7, 24)
+
+        atendidas = bloque.loc[bloque['estado'] == 'Atendido', 'medico']
+        self.por_medico = self.por_medico.add(atendidas.value_counts(), fill_value=0).astype('int64')
+
+        dia = fechas.dt.normalize()
+        mix = pd.crosstab(dia, bloque['prioridad']).reindex(columns=PRIORIDADES, fill_value=0)
+        self.mix_prioridad = self.mix_prioridad.add(mix, fill_value=0).astype('int64')
+
+        estados = pd.DataFrame({
+            'total': dia.value_counts(),
+            'canceladas': dia[bloque['estado'].eq('Cancelada').to_numpy()].value_counts(),
+        }).fillna(0)
+        self.estados_por_dia = self.estados_por_dia.add(estados, fill_value=0).astype('int64')
+
+    def combinar(self, otro):
+        """Suma los agregados de otro Resumen (p. ej. de otro mes) a este."""
+        self.total += otro.total
+        self.mapa_calor += otro.mapa_calor
+        self.por_medico = self.por_medico.add(otro.por_medico, fill_value=0).astype('int64')
+        self.mix_prioridad = self.mix_prioridad.add(otro.mix_prioridad, fill_value=0).astype('int64')
+        self.estados_por_dia = self.estados_por_dia.add(otro.estados_por_dia, fill_value=0).astype('int64')
+        return self
+
+    def ordenar(self):
+        self.por_medico = self.por_medico.sort_values(ascending=False)
+        self.mix_prioridad = self.mix_prioridad.sort_index()
+        self.estados_por_dia = self.estados_por_dia.sort_index()
+        return self
+
+
+# --- Motor DuckDB (opcional) ---
+
+def _duckdb_disponible():
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def motor_en_uso(motor=None):
+    """'duckdb' o 'sqlite': el motor que calcula los resúmenes con la configuración `motor` (MOTOR por defecto)."""
+    motor = motor or MOTOR
+    if motor == 'auto':
+        return 'duckdb' if _error_duckdb is None and _duckdb_disponible() else 'sqlite'
+    return motor
+
+
+def _conectar_duckdb():
+    """
+    Conexión DuckDB en memoria con la extensión sqlite cargada. Si falla, DuckDB no
+    sirve en este equipo (no instalado, extensión ausente o de otra versión).
+    """
+    import duckdb
+    con = duckdb.connect()
+    try:
+        if EXTENSION_SQLITE_DUCKDB:
+            con.execute(f"LOAD '{_literal(EXTENSION_SQLITE_DUCKDB)}'")
+        else:
+            con.execute('INSTALL sqlite')
+            con.execute('LOAD sqlite')
+    except Exception:
+        con.close()
+        raise
+    return con
+
+
+def _resumen_duckdb(desde, hasta, db_path, con):
+    """
+    Mismo Resumen que calcular_resumen, con las agregaciones en DuckDB: adjunta la
+    base SQLite en solo lectura, copia el período a una tabla columnar en memoria y
+    agrupa sobre ella.
+    """
+    con.execute(f"ATTACH '{_literal(os.path.abspath(db_path))}' AS guardia (TYPE sqlite, READ_ONLY)")
+    con.execute('SET sqlite_all_varchar = true')  # fechas como las guarda SQLite (texto ISO)
+    return _agregar_duckdb(con, desde, hasta)
+
+
+def _literal(texto):
+    # ATTACH y LOAD no admiten parámetros
+    return str(texto).replace("'", "''")
+
+
+def _agregar_duckdb(con, desde, hasta):
+    """Agregados del Resumen sobre guardia.consultas de una conexión DuckDB."""
+    con.execute('''CREATE TEMP TABLE periodo AS
+                   SELECT CAST(fecha_consulta AS TIMESTAMP) AS fecha, prioridad, medico, estado
+                   FROM guardia.consultas WHERE fecha_consulta >= ? AND fecha_consulta < ?''', [str(desde), str(hasta)])
+    resultado = Resumen(desde, hasta)
+    resultado.total = con.execute('SELECT COUNT(*) FROM periodo').fetchone()[0]
+    for dia, hora, cantidad in con.execute('SELECT isodow(fecha) - 1, hour(fecha), COUNT(*) FROM periodo GROUP BY ALL').fetchall():
+        resultado.mapa_calor[dia, hora] = cantidad
+    medicos = con.execute('''SELECT medico, COUNT(*) AS n FROM periodo
+                             WHERE estado = 'Atendido' AND medico IS NOT NULL GROUP BY medico''').df()
+    resultado.por_medico = medicos.set_index('medico')['n'].astype('int64')
+    mix = con.execute('''SELECT date_trunc('day', fecha) AS dia, prioridad, COUNT(*) AS n FROM periodo
+                         WHERE prioridad IS NOT NULL GROUP BY ALL''').df()
+    if not mix.empty:
+        resultado.mix_prioridad = (mix.pivot_table(index='dia', columns='prioridad', values='n', aggfunc='sum', fill_value=0)
+                                   .reindex(columns=PRIORIDADES, fill_value=0).astype('int64'))
+    resultado.estados_por_dia = con.execute('''SELECT date_trunc('day', fecha) AS dia, COUNT(*) AS total,
+                                                      COUNT(*) FILTER (WHERE estado = 'Cancelada') AS canceladas
+                                               FROM periodo GROUP BY ALL''').df().set_index('dia').astype('int64')
+    return resultado.ordenar()
+
+
+def _leer_consultas(desde, hasta, tamano_bloque, db_path=db.DB_PATH, solo_lectura=False):
+    with db.get_db_connection(db_path, solo_lectura=solo_lectura) as conn:
+        yield from pd.read_sql_query(
+            '''SELECT fecha_consulta, prioridad, medico, estado FROM consultas
+               WHERE fecha_consulta >= ? AND fecha_consulta < ?''',
+            conn, params=(str(desde), str(hasta)), chunksize=tamano_bloque,
+            dtype={'fecha_consulta': 'string', 'prioridad': 'category', 'medico': 'category', 'estado': 'category'})
+
+
+def _version_datos():
+    # El contador de cambios de consultas (versiones_tablas, lo incrementan triggers) cambia
+    # con cada alta, modificación (médico, prioridad, estado) o borrado, también al archivar;
+    # el último id distingue una base restaurada de un respaldo que volvió a llegar al mismo contador
+    with db.get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT (SELECT version FROM versiones_tablas WHERE tabla = 'consultas'), 
+                            (SELECT MAX(id) FROM consultas)''')
+        return c.fetchone()
+
+
+def _ruta_cache(desde, hasta):
+    clave = f"{desde}|{hasta}|{_version_datos()}"
+    return os.path.join(DIRECTORIO_CACHE, hashlib.sha1(clave.encode()).hexdigest() + '.pkl')
+
+
+def _limpiar_cache():
+    archivos = sorted((os.path.join(DIRECTORIO_CACHE, f) for f in os.listdir(DIRECTORIO_CACHE)), key=os.path.getmtime)
+    for archivo in archivos[:-MAX_ARCHIVOS_CACHE]:
+        os.remove(archivo)
+
+
+def calcular_resumen(desde, hasta, tamano_bloque=TAMANO_BLOQUE, db_path=db.DB_PATH, solo_lectura=False, motor=None):
+    """Calcula el Resumen de [desde, hasta) leyendo la base, sin pasar por la caché."""
+    global _error_duckdb
+    motor = motor or MOTOR
+    if motor_en_uso(motor) == 'duckdb':
+        try:
+            con = _conectar_duckdb()
+        except Exception as e:
+            if motor == 'duckdb':
+                raise
+            _error_duckdb = e  # 'auto': DuckDB no sirve en este equipo, se sigue con SQLite en esta sesión
+        else:
+            try:
+                return _resumen_duckdb(desde, hasta, db_path, con)
+            except Exception:
+                if motor == 'duckdb':
+                    raise
+                # 'auto': falló esta consulta (p. ej. la base ocupada o un dato inesperado), solo esta vez con SQLite
+            finally:
+                con.close()
+    resultado = Resumen(desde, hasta)
+    for bloque in _leer_consultas(desde, hasta, tamano_bloque, db_path, solo_lectura):
+        resultado.acumular(bloque)
+    return resultado.ordenar()
+
+
+def resumen(desde, hasta, tamano_bloque=TAMANO_BLOQUE, usar_cache=True):
+    """Devuelve el Resumen de las consultas con fecha en [desde, hasta)."""
+    ruta = _ruta_cache(desde, hasta) if usar_cache else None
+    if ruta and os.path.exists(ruta):
+        with open(ruta, 'rb') as f:
+            return pickle.load(f)
+    resultado = calcular_resumen(desde, hasta, tamano_bloque)
+    if ruta:
+        os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+        with open(ruta, 'wb') as f:
+            pickle.dump(resultado, f, protocol=pickle.HIGHEST_PROTOCOL)
+        _limpiar_cache()
+    return resultado
+
+
+def ultimos_dias(dias):
+    """Resumen de los últimos `dias` días completos más el día de hoy."""
+    hoy = datetime.combine(datetime.now().date(), datetime.min.time())
+    return resumen(hoy - timedelta(days=dias), hoy + timedelta(days=1))
@@ -0,0 +1,54 @@
+"""
+Asignación automática de médico para nuevas consultas.
+Elige, entre los médicos de guardia, al de menor carga abierta ponderada por
+prioridad, prefiriendo la especialidad que corresponde al caso.
+"""
+import db
+
+ESPECIALIDADES_NO_MEDICAS = ('Enfermería', 'Administración', 'Administrativo')
+EDAD_PEDIATRICA = 15
+
+# Palabras del motivo que orientan hacia una especialidad
+ESPECIALIDADES_POR_MOTIVO = {
+    'Traumatología': ('fractura', 'caída', 'traumatismo', 'esguince', 'luxación'),
+    'Cardiología': ('dolor de pecho', 'infarto', 'ataque cardíaco', 'paro cardíaco', 'palpitaciones'),
+    'Cirugía': ('herida profunda', 'dolor abdominal intenso', 'hemorragia'),
+}
+
+
+def especialidad_sugerida(motivo, edad):
+    """Especialidad preferida para el caso, o None si cualquiera sirve."""
+    try:
+        if int(edad) < EDAD_PEDIATRICA:
+            return 'Pediatría'
+    except (TypeError, ValueError):
+        pass
+    motivo = (motivo or '').lower()
+    for especialidad, palabras in ESPECIALIDADES_POR_MOTIVO.items():
+        if any(palabra in motivo for palabra in palabras):
+            return especialidad
+    return None
+
+
+def medicos_disponibles():
+    """Médicos de guardia ahora (o todo el personal médico activo si no hay roster) con su carga."""
+    medicos = db.carga_medicos_guardia() or db.carga_medicos_activos()
+    return [m for m in medicos if m.especialidad not in ESPECIALIDADES_NO_MEDICAS]
+
+
+def sugerir_medico(especialidad=None, medicos=None):
+    """
+    Devuelve el nombre del médico sugerido o None si no hay ninguno disponible.
+
+    Los contadores de carga los mantiene la base con triggers, así que la decisión
+    solo recorre los médicos de guardia, sin importar cuántas consultas haya abiertas.
+    """
+    medicos = medicos if medicos is not None else medicos_disponibles()
+    if not medicos:
+        return None
+    if especialidad:
+        de_la_especialidad = [m for m in medicos if m.especialidad == especialidad]
+        medicos = de_la_especialidad or medicos
+    # Menor carga ponderada (Alta=3, Media=2, Baja=1); a igual carga, menos pacientes abiertos
+    elegido = min(medicos, key=lambda m: (m.carga, m.abiertas, m.medico))
+    return elegido.medico
@@ -0,0 +1,143 @@
+"""
+Registro de auditoría de las escrituras hechas con db.py.
+db.py entrega cada cambio ya confirmado (usuario, fecha, tabla, registro, valores
+antes y después) y sigue de largo; acá se acumulan en memoria y un hilo los
+inserta por tandas con executemany, así guardar un formulario no espera a la
+auditoría. Al cerrar se vuelca lo pendiente, y si la base no está disponible se
+deja en un archivo local que se carga en el próximo inicio.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+from collections import deque
+import db
+
+ARCHIVO_PENDIENTES = os.path.join(os.path.expanduser('~'), '.guardia_hospitalaria', 'auditoria_pendiente.jsonl')
+INTERVALO_SEGUNDOS = 1.0
+TAMANO_LOTE = 1000
+ESPERA_MAXIMA = 30.0
+
+
+def _texto(valor):
+    return '' if valor is None else str(valor)
+
+
+def _fila(fecha, usuario, tabla, registro_id, accion, antes, despues):
+    """Fila de la tabla auditoria; en una modificación sólo se guardan los campos que cambiaron (None si ninguno)."""
+    if accion == 'modificacion' and antes is not None and despues is not None:
+        # Los formularios mandan texto ('42') donde la base guarda números (42)
+        cambios = {campo: valor for campo, valor in despues.items()
+                   if campo in antes and _texto(antes[campo]) != _texto(valor)}
+        if not cambios:
+            return None
+        antes, despues = {campo: antes[campo] for campo in cambios}, cambios
+    return (fecha, usuario, tabla, registro_id, accion,
+            None if antes is None else json.dumps(antes, default=str, ensure_ascii=False),
+            None if despues is None else json.dumps(despues, default=str, ensure_ascii=False))
+
+
+class Auditoria:
+    def __init__(self, db_path=db.DB_PATH, archivo=ARCHIVO_PENDIENTES, intervalo=INTERVALO_SEGUNDOS):
+        self.db_path = db_path
+        self.archivo = archivo
+        self.intervalo = intervalo
+        self.escritas = 0
+        self.ultimo_error = None
+        self._pendientes = deque()  # (fecha, usuario, tabla, registro_id, accion, antes, despues)
+        self._hay_lote = threading.Event()
+        self._detener = threading.Event()
+        self._bloqueo = threading.Lock()  # un volcado a la vez
+        self._hilo = None
+        if os.path.exists(archivo):
+            with open(archivo, encoding='utf-8') as f:
+                self._pendientes.extend(tuple(json.loads(linea)) for linea in f if linea.strip())
+
+    def registrar(self, cambios, usuario):
+        """Encola [(tabla, registro_id, accion, antes, despues)]; no toca la base."""
+        fecha = db._ahora()
+        self._pendientes.extend((fecha, usuario) + tuple(cambio) for cambio in cambios)
+        if len(self._pendientes) >= TAMANO_LOTE:
+            self._hay_lote.set()
+
+    def pendientes(self):
+        return len(self._pendientes)
+
+    def volcar(self):
+        """Inserta lo pendiente por tandas; devuelve cuántas filas escribió. Propaga el error y conserva lo pendiente."""
+        with self._bloqueo:
+            escritas = 0
+            # Conexión propia y no db.get_db_connection(): estas escrituras no deben
+            # hacer que las lecturas de este puesto dejen de usar la réplica.
+            conn = sqlite3.connect(self.db_path)
+            try:
+                while self._pendientes:
+                    lote = [self._pendientes.popleft() for _ in range(min(TAMANO_LOTE, len(self._pendientes)))]
+                    try:
+                        # Las modificaciones que no cambiaron nada no generan fila
+                        filas = [fila for fila in (_fila(*cambio) for cambio in lote) if fila is not None]
+                        conn.executemany('''INSERT INTO auditoria (fecha, usuario, tabla, registro_id, accion, antes, despues)
+                                            VALUES (?, ?, ?, ?, ?, ?, ?)''', filas)
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        self._pendientes.extendleft(reversed(lote))
+                        raise
+                    escritas += len(filas)
+            finally:
+                conn.close()
+            if os.path.exists(self.archivo):
+                os.remove(self.archivo)  # lo que quedó de la sesión anterior ya está en la base
+            self.escritas += escritas
+            return escritas
+
+    def _guardar_pendientes(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.archivo)), exist_ok=True)
+        with open(self.archivo, 'w', encoding='utf-8') as f:
+            for cambio in list(self._pendientes):
+                f.write(json.dumps(cambio, default=str, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _ejecutar(self):
+        espera = self.intervalo
+        while not self._detener.is_set():
+            self._hay_lote.wait(espera)
+            self._hay_lote.clear()
+            if not self._pendientes:
+                continue
+            try:
+                self.volcar()
+                self.ultimo_error = None
+                espera = self.intervalo
+            except Exception as e:
+                # Base bloqueada (sqlite3.Error) o un error inesperado: el hilo no se corta,
+                # los cambios siguen en memoria y se reintenta más tarde
+                self.ultimo_error = e
+                espera = min(espera * 2, ESPERA_MAXIMA)
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ejecutar, name='auditoria', daemon=True)
+            self._hilo.start()
+            atexit.register(self.detener)
+        return self
+
+    def detener(self):
+        """Vuelca lo pendiente; si no se puede, lo deja en el archivo local para la próxima sesión."""
+        self._detener.set()
+        self._hay_lote.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=5)
+        try:
+            self.volcar()
+        except Exception:
+            self._guardar_pendientes()
+
+
+def iniciar(db_path=db.DB_PATH):
+    """Crea el registro de auditoría, lo pone en uso en db.py y lo devuelve."""
+    registro = Auditoria(db_path).iniciar()
+    db.usar_auditoria(registro)
+    return registro
@@ -0,0 +1,91 @@
+"""
+Compara los motores de analitica.py (SQLite por bloques con pandas y DuckDB) a varias escalas.
+
+Para cada cantidad de consultas crea una base de prueba en un directorio temporal
+y calcula el Resumen de un año con cada motor, REPETICIONES veces; informa la
+mediana y verifica que ambos motores den los mismos agregados.
+
+    python benchmarks/bench_analitica.py [--escalas 100000 500000 2000000] [--repeticiones 3]
+                                         [--extension ruta/sqlite_scanner.duckdb_extension]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db  # noqa: E402
+import analitica  # noqa: E402
+
+MOTORES = ('sqlite', 'duckdb')
+
+
+def _poblar(consultas, desde):
+    db.init_db()
+    with db.get_db_connection() as conn:
+        conn.executemany('INSERT INTO pacientes (nombre, apellido, dni) VALUES (?, ?, ?)',
+                         [(f'Nombre{i}', f'Apellido{i}', str(20_000_000 + i)) for i in range(1000)])
+        minutos_anio = 365 * 24 * 60
+        for inicio in range(0, consultas, 100_000):
+            conn.executemany('''INSERT INTO consultas (paciente_id, fecha_consulta, motivo, medico, estado, prioridad)
+                                VALUES (?, ?, ?, ?, ?, ?)''',
+                             [(random.randint(1, 1000), str(desde + timedelta(minutes=random.randint(0, minutos_anio - 1))),
+                               'Fiebre', f'Dr {i % 40}', random.choice(['Atendido', 'Atendido', 'Cancelada', 'En espera']),
+                               random.choice(analitica.PRIORIDADES))
+                              for i in range(inicio, min(consultas, inicio + 100_000))])
+        conn.commit()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def _iguales(a, b):
+    return (a.total == b.total and np.array_equal(a.mapa_calor, b.mapa_calor)
+            and a.por_medico.sort_index().equals(b.por_medico.sort_index())
+            and np.array_equal(a.mix_prioridad.to_numpy(), b.mix_prioridad.to_numpy())
+            and np.array_equal(a.estados_por_dia[['total', 'canceladas']].to_numpy(),
+                               b.estados_por_dia[['total', 'canceladas']].to_numpy()))
+
+
+def _medir(motor, desde, hasta, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = analitica.calcular_resumen(desde, hasta, motor=motor, solo_lectura=True)
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--escalas', type=int, nargs='+', default=[100_000, 500_000, 2_000_000])
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--extension', help='extensión sqlite de DuckDB (analitica.EXTENSION_SQLITE_DUCKDB), sin internet')
+    args = parser.parse_args()
+    if args.extension:
+        analitica.EXTENSION_SQLITE_DUCKDB = os.path.abspath(args.extension)
+    desde = datetime(2024, 1, 1)
+    hasta = datetime(2025, 1, 1)
+    print(f"{'consultas':>12}{'sqlite s':>12}{'duckdb s':>12}{'relación':>10}  iguales")
+    for escala in args.escalas:
+        with tempfile.TemporaryDirectory() as directorio:
+            os.chdir(directorio)
+            _poblar(escala, desde)
+            tiempo_sqlite, resumen_sqlite = _medir('sqlite', desde, hasta, args.repeticiones)
+            try:
+                tiempo_duckdb, resumen_duckdb = _medir('duckdb', desde, hasta, args.repeticiones)
+            except Exception as e:  # duckdb no instalado o sin su extensión sqlite
+                print(f"{escala:>12}{tiempo_sqlite:>12.2f}{'-':>12}{'-':>10}  DuckDB no disponible: {str(e).splitlines()[0]}")
+                os.chdir(os.path.dirname(directorio))
+                continue
+            print(f"{escala:>12}{tiempo_sqlite:>12.2f}{tiempo_duckdb:>12.2f}{tiempo_sqlite / tiempo_duckdb:>9.1f}x"
+                  f"  {'sí' if _iguales(resumen_sqlite, resumen_duckdb) else 'NO'}")
+            os.chdir(os.path.dirname(directorio))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Corre planificador_turnos.generar_roster con dotaciones al azar (semillas fijas) y verifica el roster.
+
+Cada corrida arranca en un momento a mitad de turno, como "Generar roster..." en la
+aplicación, con turnos ya cargados antes de ese momento (previos) que se conservan y
+días no disponibles para parte del personal: la carga queda despareja y mejorar()
+tiene que nivelarla sin mover los previos. Verifica que no falle, que no asigne antes
+del comienzo ni en un día no disponible y que respete el descanso mínimo y el tope
+semanal contando los previos; informa el tiempo de las corridas.
+
+    python benchmarks/bench_planificador.py [--corridas 50] [--personas 8] [--semanas 4]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import planificador_turnos as pt  # noqa: E402
+from modelos import Personal  # noqa: E402
+
+ESPECIALIDADES = ['Clínica', 'Pediatría', 'Cirugía', None]
+
+
+def _dotacion(azar, personas):
+    return [Personal(i, f'Nombre{i}', f'Apellido{i}', azar.choice(ESPECIALIDADES), str(i),
+                     azar.choice(list(pt.TURNOS)), azar.choice(['Activo'] * 9 + ['Licencia']))
+            for i in range(1, personas + 1)]
+
+
+def _previos(azar, personal, comienzo):
+    """Turnos de las últimas 24 h antes de `comienzo`, como los devuelve db.turnos_personal."""
+    previos = []
+    for p in personal:
+        if p.estado != 'Activo' or azar.random() < 0.5:
+            continue
+        dia = datetime.combine(comienzo.date(), datetime.min.time()) - timedelta(days=azar.randint(0, 1))
+        tipo = azar.choice(list(pt.TURNOS))
+        hora, duracion = pt.TURNOS[tipo]
+        inicio = dia + timedelta(hours=hora)
+        if inicio < comienzo:
+            previos.append((p.id, str(inicio), str(inicio + timedelta(hours=duracion)), tipo))
+    return previos
+
+
+def _no_disponible(azar, personal, comienzo, semanas):
+    return {p.id: {comienzo.date() + timedelta(days=d) for d in range(semanas * 7) if azar.random() < 0.6}
+            for p in personal if azar.random() < 0.4}
+
+
+def _errores(roster, previos, no_disponible, comienzo):
+    errores = []
+    agenda = defaultdict(list)
+    for personal_id, inicio, fin, _ in previos:
+        agenda[personal_id].append((datetime.fromisoformat(inicio), datetime.fromisoformat(fin)))
+    for personal_id, inicio, fin, _ in roster.asignaciones:
+        if inicio < comienzo:
+            errores.append(f'turno antes del comienzo: {personal_id} {inicio}')
+        if inicio.date() in no_disponible.get(personal_id, ()):
+            errores.append(f'no disponible: {personal_id} {inicio}')
+        agenda[personal_id].append((inicio, fin))
+    descanso = timedelta(hours=pt.DESCANSO_MINIMO_HORAS)
+    semana_cero = datetime.combine(comienzo.date(), datetime.min.time())
+    for personal_id, turnos in agenda.items():
+        turnos.sort()
+        for (_, fin), (inicio, _) in zip(turnos, turnos[1:]):
+            if fin + descanso > inicio:
+                errores.append(f'descanso: {personal_id} {fin} -> {inicio}')
+        por_semana = defaultdict(int)
+        for inicio, _ in turnos:
+            if inicio >= semana_cero:
+                por_semana[(inicio - semana_cero).days // 7] += 1
+        errores.extend(f'tope semanal: {personal_id} semana {s}' for s, n in por_semana.items() if n > pt.MAX_TURNOS_SEMANA)
+    return errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corridas', type=int, default=50)
+    parser.add_argument('--personas', type=int, default=8)
+    parser.add_argument('--semanas', type=int, default=4)
+    parser.add_argument('--presupuesto', type=float, default=1.0, help='segundos de mejora por corrida')
+    args = parser.parse_args()
+    tiempos, fallidas = [], 0
+    for semilla in range(args.corridas):
+        azar = random.Random(semilla)
+        personal = _dotacion(azar, args.personas)
+        ahora = datetime(2024, 3, 4) + timedelta(hours=azar.randint(0, 7 * 24 - 1), minutes=azar.randint(0, 59))
+        comienzo = pt.proximo_turno(ahora)
+        previos = _previos(azar, personal, comienzo)
+        no_disponible = _no_disponible(azar, personal, comienzo, args.semanas)
+        inicio = time.perf_counter()
+        try:
+            roster = pt.generar_roster(personal, comienzo, semanas=args.semanas, no_disponible=no_disponible,
+                                       previos=previos, presupuesto_segundos=args.presupuesto)
+        except Exception as e:
+            fallidas += 1
+            print(f'semilla {semilla}: {type(e).__name__}: {e}')
+            continue
+        tiempos.append(time.perf_counter() - inicio)
+        errores = _errores(roster, previos, no_disponible, comienzo)
+        if errores:
+            fallidas += 1
+            print(f'semilla {semilla}: {len(errores)} errores, p. ej. {errores[0]}')
+    if tiempos:
+        print(f'{args.corridas} corridas, {fallidas} con errores; mediana {statistics.median(tiempos):.2f} s, '
+              f'máximo {max(tiempos):.2f} s')
+    else:
+        print(f'{args.corridas} corridas, todas con errores')
+    return 1 if fallidas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Mide el efecto de la réplica de lectura con varios puestos escribiendo a la vez.
+
+Crea una base de prueba en un directorio temporal, lanza PUESTOS procesos que
+registran consultas y cambian estados como lo haría la guardia, y mientras tanto
+ejecuta los reportes/búsquedas que pasan por la réplica. Se corre dos veces
+(sin réplica y con réplica en memoria) y se informan las latencias.
+
+    python benchmarks/bench_replica.py [--puestos 6] [--segundos 20] [--consultas 200000]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db  # noqa: E402
+import replica  # noqa: E402
+
+
+def _poblar(consultas):
+    db.init_db()
+    ahora = datetime.now()
+    with db.get_db_connection() as conn:
+        conn.executemany('''INSERT INTO pacientes (nombre, apellido, dni, edad, genero) VALUES (?, ?, ?, ?, ?)''',
+                         [(f'Nombre{i}', f'Apellido{i % 5000}', str(20_000_000 + i), random.randint(1, 90), 'Otro')
+                          for i in range(consultas // 10)])
+        conn.executemany('''INSERT INTO consultas (paciente_id, fecha_consulta, motivo, medico, estado, prioridad)
+                            VALUES (?, ?, ?, ?, ?, ?)''',
+                         [(random.randint(1, consultas // 10), str(ahora - timedelta(minutes=random.randint(0, 525_600))),
+                           random.choice(['Fiebre', 'Dolor abdominal', 'Trauma', 'Cefalea']), f'Dr {i % 40}',
+                           random.choice(['Atendido', 'Atendido', 'Cancelada']), random.choice(['Alta', 'Media', 'Baja']))
+                          for i in range(consultas)])
+        conn.commit()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def _puesto(directorio, hasta, cola):
+    os.chdir(directorio)
+    latencias = []
+    while time.time() < hasta:
+        inicio = time.perf_counter()
+        db.agregar_consulta({'paciente_id': random.randint(1, 100), 'fecha_consulta': str(datetime.now()),
+                             'motivo': 'Fiebre', 'medico': 'Dr 1', 'estado': 'En espera', 'prioridad': 'Media'})
+        db.actualizar_estado_consulta(random.randint(1, 1000), 'Atendido')
+        latencias.append(time.perf_counter() - inicio)
+        time.sleep(random.uniform(0.05, 0.2))
+    cola.put(latencias)
+
+
+PAUSA_LECTURAS = 0.1  # mismo ritmo de lecturas en ambas corridas
+
+_LECTURAS = [
+    lambda: db.consultas_filtrado('Trauma'),
+    lambda: db.pacientes_filtrado('Apellido12'),
+    lambda: db.obtener_estadisticas_prioridad(),
+    lambda: db.distribucion_espera_prioridad(datetime.now() - timedelta(days=30), datetime.now()),
+    lambda: db.llegadas_por_hora(datetime.now() - timedelta(days=60), datetime.now()),
+]
+
+
+def _percentil(valores, q):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * q / 100))] * 1000 if valores else float('nan')
+
+
+def _correr(directorio, puestos, segundos, con_replica):
+    cola = multiprocessing.Queue()
+    hasta = time.time() + segundos
+    procesos = [multiprocessing.Process(target=_puesto, args=(directorio, hasta, cola)) for _ in range(puestos)]
+    for p in procesos:
+        p.start()
+    rep = replica.iniciar(replica.MODO if con_replica else None, intervalo=max(5, segundos // 4))
+    if rep is not None:
+        rep.esperar()
+    lecturas = []
+    while time.time() < hasta:
+        consulta = random.choice(_LECTURAS)
+        inicio = time.perf_counter()
+        consulta()
+        lecturas.append(time.perf_counter() - inicio)
+        time.sleep(PAUSA_LECTURAS)
+    escrituras = [l for _ in procesos for l in cola.get()]
+    for p in procesos:
+        p.join()
+    if rep is not None:
+        rep.detener()
+        replica.iniciar(None)
+    return lecturas, escrituras
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--puestos', type=int, default=6)
+    parser.add_argument('--segundos', type=int, default=20)
+    parser.add_argument('--consultas', type=int, default=200_000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directorio:
+        os.chdir(directorio)
+        _poblar(args.consultas)
+        print(f"{args.consultas} consultas, {args.puestos} puestos escribiendo, {args.segundos} s por corrida\n")
+        print(f"{'':14}{'lecturas':>10}{'p50 ms':>10}{'p99 ms':>10}{'escrituras':>12}{'p50 ms':>10}{'p99 ms':>10}")
+        for nombre, con_replica in (('sin réplica', False), ('con réplica', True)):
+            lecturas, escrituras = _correr(directorio, args.puestos, args.segundos, con_replica)
+            print(f"{nombre:14}{len(lecturas):>10}{_percentil(lecturas, 50):>10.1f}{_percentil(lecturas, 99):>10.1f}"
+                  f"{len(escrituras):>12}{_percentil(escrituras, 50):>10.1f}{_percentil(escrituras, 99):>10.1f}")
+        os.chdir(os.path.dirname(directorio))
+
+
+if __name__ == '__main__':
+    main()
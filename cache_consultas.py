@@ -0,0 +1,109 @@
+"""
+Caché en memoria de resultados de lecturas de db.py.
+Cada entrada guarda de qué tablas depende; db.py la invalida cuando cambia la
+versión de alguna de esas tablas (la mantienen triggers, así que también se
+enteran los cambios hechos desde otros puestos). El tamaño está acotado por
+cantidad de entradas y por memoria estimada, y se descarta la menos usada.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+MAX_ENTRADAS = 256
+MAX_BYTES = 32 * 1024 * 1024
+MUESTRA_TAMANO = 100  # filas que se miden para estimar el tamaño de un resultado
+
+
+def estimar_tamano(valor):
+    """Bytes aproximados de un resultado (escalares, filas o listas de filas)."""
+    if isinstance(valor, (list, tuple)):
+        total = sys.getsizeof(valor)
+        if not valor:
+            return total
+        muestra = valor[:MUESTRA_TAMANO]
+        medido = sum(estimar_tamano(v) for v in muestra)
+        return total + medido * len(valor) // len(muestra)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(estimar_tamano(k) + estimar_tamano(v) for k, v in valor.items())
+    return sys.getsizeof(valor)
+
+
+class CacheConsultas:
+    def __init__(self, max_entradas=MAX_ENTRADAS, max_bytes=MAX_BYTES):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidaciones = 0
+        self.descartadas = 0  # por falta de lugar o por ser demasiado grandes
+        self._entradas = OrderedDict()  # clave -> (valor, tablas, generacion, bytes)
+        self._por_tabla = {}  # tabla -> claves que dependen de ella
+        self._epoca = 0  # cambia con cada invalidación
+        self._bloqueo = threading.Lock()
+
+    def obtener(self, clave, generacion):
+        """Devuelve (True, valor) si hay una entrada vigente para `generacion`, o (False, época actual)."""
+        with self._bloqueo:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[2] == generacion:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return True, entrada[0]
+            self.fallos += 1
+            return False, self._epoca
+
+    def guardar(self, clave, valor, tablas, generacion, epoca):
+        """
+        Guarda el resultado salvo que haya habido una invalidación desde `epoca`
+        (lo leído podría ser anterior al cambio que la provocó).
+        """
+        tamano = estimar_tamano(valor)
+        with self._bloqueo:
+            if epoca != self._epoca:
+                return
+            if tamano > self.max_bytes // 4:
+                self.descartadas += 1
+                return
+            self._quitar(clave)
+            self._entradas[clave] = (valor, tablas, generacion, tamano)
+            self.bytes += tamano
+            for tabla in tablas:
+                self._por_tabla.setdefault(tabla, set()).add(clave)
+            while len(self._entradas) > self.max_entradas or self.bytes > self.max_bytes:
+                self._quitar(next(iter(self._entradas)))
+                self.descartadas += 1
+
+    def _quitar(self, clave):
+        entrada = self._entradas.pop(clave, None)
+        if entrada is None:
+            return
+        self.bytes -= entrada[3]
+        for tabla in entrada[1]:
+            claves = self._por_tabla.get(tabla)
+            if claves is not None:
+                claves.discard(clave)
+
+    def invalidar(self, tablas=None):
+        """Descarta las entradas que dependen de `tablas` (todas si es None)."""
+        with self._bloqueo:
+            self._epoca += 1
+            if tablas is None:
+                claves = list(self._entradas)
+            else:
+                claves = {c for tabla in tablas for c in self._por_tabla.get(tabla, ())}
+            for clave in claves:
+                self._quitar(clave)
+            self.invalidaciones += len(claves)
+
+    def estadisticas(self):
+        with self._bloqueo:
+            consultas = self.aciertos + self.fallos
+            return {'aciertos': self.aciertos, 'fallos': self.fallos,
+                    'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+                    'invalidaciones': self.invalidaciones, 'descartadas': self.descartadas,
+                    'entradas': len(self._entradas), 'bytes': self.bytes}
+
+    def reiniciar_estadisticas(self):
+        with self._bloqueo:
+            self.aciertos = self.fallos = self.invalidaciones = self.descartadas = 0
@@ -0,0 +1,189 @@
+"""
+Cola local de escrituras de cada puesto.
+Las altas de pacientes y consultas se anotan primero en un diario local
+(JSONL, con fsync) y se responde al instante; un hilo las aplica a la base en
+orden y por tandas apenas está disponible. Cada escritura lleva una clave
+única que queda registrada en la misma transacción (db.escrituras_aplicadas),
+así que repetir una tanda después de un corte no duplica registros.
+
+El diario debe estar en el disco local del puesto, no junto a la base compartida.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+import db
+
+ARCHIVO_COLA = os.path.join(os.path.expanduser('~'), '.guardia_hospitalaria', 'cola_escrituras.jsonl')
+TAMANO_LOTE = 100
+ESPERA_INICIAL = 1.0
+ESPERA_MAXIMA = 30.0
+
+
+def nueva_clave():
+    return uuid.uuid4().hex
+
+
+class ColaEscrituras:
+    def __init__(self, archivo=ARCHIVO_COLA):
+        self.archivo = archivo
+        self.archivo_posicion = archivo + '.pos'  # bytes del diario ya aplicados
+        self.archivo_rechazadas = os.path.splitext(archivo)[0] + '.rechazadas.jsonl'
+        self.ultimo_error = None  # motivo por el que la base no está disponible
+        self.rechazadas = []
+        self._pendientes = deque()  # (fin en el diario, escritura)
+        self._bloqueo = threading.Lock()
+        self._hay_trabajo = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        os.makedirs(os.path.dirname(os.path.abspath(archivo)), exist_ok=True)
+        self._cargar()
+
+    def _cargar(self):
+        posicion = 0
+        if os.path.exists(self.archivo_posicion):
+            with open(self.archivo_posicion) as f:
+                posicion = int(f.read().strip() or 0)
+        if os.path.exists(self.archivo):
+            with open(self.archivo, 'r+b') as f:
+                f.seek(posicion)
+                for linea in iter(f.readline, b''):
+                    try:
+                        escritura = json.loads(linea)
+                    except ValueError:
+                        break  # última línea a medio escribir por un corte: nunca se confirmó al usuario
+                    posicion = f.tell()
+                    self._pendientes.append((posicion, escritura))
+                # Descarta una posible línea incompleta para que las próximas queden bien separadas
+                if f.seek(0, os.SEEK_END) > posicion:
+                    f.truncate(posicion)
+        if os.path.exists(self.archivo_rechazadas):
+            with open(self.archivo_rechazadas, encoding='utf-8') as f:
+                self.rechazadas = [json.loads(linea) for linea in f if linea.strip()]
+
+    @staticmethod
+    def _agregar_lineas(archivo, registros):
+        """Agrega las líneas con un solo fsync; devuelve la posición del final de cada una."""
+        lineas = [json.dumps(registro, default=str, ensure_ascii=False).encode() + b'\n' for registro in registros]
+        with open(archivo, 'ab') as f:
+            fin = f.seek(0, os.SEEK_END)
+            f.write(b''.join(lineas))
+            f.flush()
+            os.fsync(f.fileno())
+        finales = []
+        for linea in lineas:
+            fin += len(linea)
+            finales.append(fin)
+        return finales
+
+    @classmethod
+    def _agregar_linea(cls, archivo, registro):
+        return cls._agregar_lineas(archivo, [registro])[0]
+
+    def encolar(self, operacion, datos):
+        """Anota la escritura en el diario local y devuelve su clave; se aplica a la base en segundo plano."""
+        return self.encolar_varias([(nueva_clave(), operacion, datos)])[0]
+
+    def encolar_varias(self, escrituras):
+        """
+        Como encolar, para [(clave, operacion, datos)] que van juntas (un paciente y su
+        consulta con 'paciente_clave'): un solo fsync y quedan contiguas en el diario.
+        """
+        escrituras = [{'clave': clave, 'operacion': operacion,
+                       'datos': json.loads(json.dumps(datos, default=str)), 'fecha': db._ahora(),
+                       'usuario': db.usuario_actual()} for clave, operacion, datos in escrituras]
+        with self._bloqueo:
+            self._pendientes.extend(zip(self._agregar_lineas(self.archivo, escrituras), escrituras))
+        self._hay_trabajo.set()
+        return [escritura['clave'] for escritura in escrituras]
+
+    def pendientes(self):
+        return len(self._pendientes)
+
+    def claves_pendientes(self):
+        with self._bloqueo:
+            return {e['clave'] for _, e in self._pendientes}
+
+    def pacientes_pendientes(self):
+        """Altas de pacientes todavía no aplicadas: [(clave, datos)]."""
+        with self._bloqueo:
+            return [(e['clave'], e['datos']) for _, e in self._pendientes if e['operacion'] == 'agregar_paciente']
+
+    def _guardar_posicion(self, posicion):
+        temporal = self.archivo_posicion + '.tmp'
+        with open(temporal, 'w') as f:
+            f.write(str(posicion))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.archivo_posicion)
+
+    def aplicar_pendientes(self):
+        """Aplica lo pendiente por tandas de TAMANO_LOTE. Si la base no está disponible propaga el sqlite3.Error."""
+        aplicadas = 0
+        while True:
+            with self._bloqueo:
+                lote = [self._pendientes[i] for i in range(min(TAMANO_LOTE, len(self._pendientes)))]
+            if not lote:
+                return aplicadas
+            rechazadas = db.aplicar_escrituras([(e['clave'], e['operacion'], e['datos'], e.get('usuario')) for _, e in lote])
+            for _, escritura in lote:
+                if escritura['clave'] in rechazadas:
+                    registro = dict(escritura, error=rechazadas[escritura['clave']])
+                    self._agregar_linea(self.archivo_rechazadas, registro)
+                    self.rechazadas.append(registro)
+            with self._bloqueo:
+                for _ in lote:
+                    self._pendientes.popleft()
+                if self._pendientes:
+                    self._guardar_posicion(lote[-1][0])
+                else:
+                    # Todo aplicado: el diario vuelve a empezar vacío (si se corta entre
+                    # estos dos pasos se reaplica lo ya aplicado, que se saltea por la clave)
+                    self._guardar_posicion(0)
+                    open(self.archivo, 'wb').close()
+            aplicadas += len(lote)
+
+    def descartar_rechazadas(self):
+        with self._bloqueo:
+            self.rechazadas = []
+            if os.path.exists(self.archivo_rechazadas):
+                os.remove(self.archivo_rechazadas)
+
+    def esperar(self, timeout=1.0):
+        """Espera hasta `timeout` segundos a que no quede nada pendiente; devuelve True si se vació."""
+        limite = time.monotonic() + timeout
+        while self._pendientes and time.monotonic() < limite:
+            time.sleep(0.02)
+        return not self._pendientes
+
+    def _ejecutar(self):
+        espera = ESPERA_INICIAL
+        while not self._detener.is_set():
+            self._hay_trabajo.wait(espera)
+            self._hay_trabajo.clear()
+            if not self._pendientes:
+                continue
+            try:
+                self.aplicar_pendientes()
+                self.ultimo_error = None
+                espera = ESPERA_INICIAL
+            except Exception as e:
+                # Base bloqueada o inaccesible (sqlite3.Error) o un error inesperado: el hilo
+                # no se corta, lo informa en ultimo_error y reintenta con espera creciente
+                self.ultimo_error = e
+                espera = min(espera * 2, ESPERA_MAXIMA)
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ejecutar, name='cola_escrituras', daemon=True)
+            self._hilo.start()
+            self._hay_trabajo.set()
+        return self
+
+    def detener(self, timeout=5.0):
+        """Intenta vaciar la cola antes de cerrar; lo que quede se aplica en la próxima sesión."""
+        self.esperar(timeout)
+        self._detener.set()
+        self._hay_trabajo.set()
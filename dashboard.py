@@ -0,0 +1,95 @@
+"""
+Tablero de solo lectura para las pantallas de sala de espera y enfermería.
+
+    streamlit run dashboard.py
+
+La pantalla de enfermería abre la URL tal cual; la de sala de espera agrega
+?vista=sala, que oculta nombres completos y motivos.
+
+Todas las consultas pasan por st.cache_data con un TTL corto; la caché es
+compartida entre sesiones, así que muchas pestañas abiertas generan una sola
+consulta por intervalo. La base se abre en modo solo lectura.
+"""
+import time
+import pandas as pd
+import streamlit as st
+import db
+
+TTL_SEGUNDOS = 15
+INTERVALO_REFRESCO = 30
+
+db.SOLO_LECTURA = True
+
+
+@st.cache_data(ttl=TTL_SEGUNDOS, show_spinner=False)
+def _contadores():
+    return {
+        'en_espera': db.consultas_en_espera(),
+        'hoy': db.consultas_hoy(),
+        'personal': db.personal_activo(),
+        'criticos': db.recursos_criticos(),
+    }
+
+
+@st.cache_data(ttl=TTL_SEGUNDOS, show_spinner=False)
+def _cola_espera():
+    return pd.DataFrame(db.consultas_en_espera_lista())
+
+
+@st.cache_data(ttl=TTL_SEGUNDOS, show_spinner=False)
+def _recursos_criticos():
+    return pd.DataFrame(db.recursos_criticos_lista())
+
+
+@st.cache_data(ttl=TTL_SEGUNDOS, show_spinner=False)
+def _prioridades_hoy():
+    return pd.DataFrame(db.obtener_estadisticas_prioridad(), columns=['prioridad', 'cantidad']).set_index('prioridad')
+
+
+def _iniciales(nombre):
+    return ''.join(parte[0] + '.' for parte in str(nombre).split() if parte)
+
+
+def main():
+    st.set_page_config(page_title="Guardia Hospitalaria", layout="wide")
+    sala_de_espera = st.query_params.get('vista') == 'sala'
+    st.title("Sistema de Guardia Hospitalaria")
+
+    contadores = _contadores()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Pacientes en Espera", contadores['en_espera'])
+    col2.metric("Consultas del Día", contadores['hoy'])
+    col3.metric("Personal Activo", contadores['personal'])
+    col4.metric("Recursos Críticos", contadores['criticos'])
+
+    st.subheader("Pacientes en espera")
+    cola = _cola_espera()
+    if cola.empty:
+        st.info("No hay pacientes en espera.")
+    else:
+        cola = cola.rename(columns={'id': 'ID', 'paciente': 'Paciente', 'motivo': 'Motivo',
+                                    'prioridad': 'Prioridad', 'minutos_espera': 'Espera (min)'})
+        if sala_de_espera:
+            # En la sala de espera no se muestran nombres completos ni motivos
+            cola = cola.assign(Paciente=cola['Paciente'].map(_iniciales)).drop(columns=['Motivo'])
+        st.dataframe(cola, hide_index=True, use_container_width=True)
+
+    if not sala_de_espera:
+        izquierda, derecha = st.columns(2)
+        with izquierda:
+            st.subheader("Consultas de hoy por prioridad")
+            st.bar_chart(_prioridades_hoy())
+        with derecha:
+            st.subheader("Recursos críticos")
+            criticos = _recursos_criticos()
+            if criticos.empty:
+                st.success("Sin recursos críticos.")
+            else:
+                st.dataframe(criticos[['tipo', 'nombre', 'cantidad', 'stock_minimo']], hide_index=True, use_container_width=True)
+
+    st.caption(f"Actualizado: {time.strftime('%H:%M:%S')} · se refresca cada {INTERVALO_REFRESCO} s")
+    time.sleep(INTERVALO_REFRESCO)
+    st.rerun()
+
+
+main()
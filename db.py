@@ -1,22 +1,201 @@
 import sqlite3
+import threading
+import calendar
+from bisect import bisect_right
 from contextlib import contextmanager
 import hashlib
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import partial, wraps
+from pathlib import Path
+import json
+import cache_consultas
+import fonetica
+import triage
+from modelos import (Paciente, PacienteResumen, Consulta, ConsultaReciente, ConsultaEnEspera,
+                     Personal, Recurso, CargaMedico, EntradaAuditoria,
+                     Ubicacion, Ocupacion, ConsultaPaciente, ConteoSintoma,
+                     ConsultaTriage, PacienteProvisorio, EventoConsulta, DistribucionEspera,
+                     ContadorOcupacion, Turno, TurnoPersonal, PersonalDeGuardia, MovimientoRecurso, ConteoPrioridad, ConteoEstado)
 
 DB_PATH = 'hospital_guard.db'
+# Si está activo, todas las conexiones se abren de solo lectura (tablero de pantallas)
+SOLO_LECTURA = False
+# Réplica de lectura para reportes, listados y búsquedas (ver replica.py); None = base principal
+_replica = None
 
 @contextmanager
-def get_db_connection(db_path=DB_PATH):
-    """Context manager for database connections."""
-    conn = sqlite3.connect(db_path)
+def get_db_connection(db_path=DB_PATH, solo_lectura=None):
+    """Context manager for database connections.
+
+    Con solo_lectura=True la base se abre en modo ro: no puede escribir ni tomar
+    el lock de escritura, por lo que no compite con los puestos que registran datos.
+    Las conexiones de escritura controlan las claves foráneas (PRAGMA foreign_keys).
+    """
+    if solo_lectura is None:
+        solo_lectura = SOLO_LECTURA
+    if solo_lectura:
+        conn = sqlite3.connect(Path(db_path).resolve().as_uri() + '?mode=ro', uri=True)
+        conn.execute('PRAGMA query_only = ON')
+    else:
+        conn = sqlite3.connect(db_path)
+        conn.execute('PRAGMA foreign_keys = ON')
+    try:
+        yield conn
+    finally:
+        if _replica is not None and conn.total_changes:
+            _replica.escritura_local()
+        conn.close()
+
+def usar_replica(replica):
+    """Envía las lecturas de reportes, listados y búsquedas a `replica` (None para leer de la base principal)."""
+    global _replica
+    _replica = replica
+
+def desfase_replica():
+    """Antigüedad en segundos de los datos que devuelven los reportes (0 si se lee de la base principal)."""
+    replica = _replica
+    if replica is None or not replica.disponible():
+        return 0
+    return replica.desfase()
+
+@contextmanager
+def _conexion_lectura():
+    replica = _replica
+    if replica is None or not replica.disponible():
+        with get_db_connection() as conn:
+            yield conn
+        return
+    conn = replica.conectar()
     try:
         yield conn
     finally:
         conn.close()
 
+# --- Caché de lecturas (ver cache_consultas.py) ---
+
+USAR_CACHE = True
+# Tablas con versión en versiones_tablas: las lecturas en caché sólo pueden depender de éstas
+_TABLAS_VERSIONADAS = ('pacientes', 'consultas', 'personal', 'turnos', 'recursos', 'movimientos_recursos', 'carga_medicos',
+                       'ubicaciones', 'ocupaciones', 'ocupacion_por_tipo', 'consulta_sintomas')
+_cache = cache_consultas.CacheConsultas()
+# Conexión propia para PRAGMA data_version: cambia sólo si alguna otra conexión
+# (de este u otro proceso) confirmó cambios, y consultarlo no toca el disco.
+_monitor = {'ruta': None, 'conn': None, 'data_version': None, 'versiones': {}}
+_bloqueo_monitor = threading.Lock()
+
+def _crear_versiones_tablas(c):
+    """Contador de cambios por tabla, incrementado por triggers en cada fila insertada, modificada o borrada."""
+    c.execute('''CREATE TABLE IF NOT EXISTS versiones_tablas (
+        tabla TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID''')
+    for tabla in _TABLAS_VERSIONADAS:
+        c.execute('INSERT OR IGNORE INTO versiones_tablas (tabla) VALUES (?)', (tabla,))
+        for evento in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_version_{tabla}_{evento.lower()} AFTER {evento} ON {tabla} BEGIN
+                              UPDATE versiones_tablas SET version = version + 1 WHERE tabla = '{tabla}';
+                          END''')
+
+def _cerrar_monitor():
+    if _monitor['conn'] is not None:
+        _monitor['conn'].close()
+    _monitor.update(ruta=None, conn=None, data_version=None, versiones={})
+
+def _generacion_cache():
+    """
+    Invalida lo que dependa de tablas cambiadas desde la última vez y devuelve la
+    generación de los datos que se leerían ahora (base principal o copia de la
+    réplica), o None si la caché no se puede usar.
+    """
+    if not USAR_CACHE:
+        return None
+    ruta = Path(DB_PATH).resolve()
+    with _bloqueo_monitor:
+        try:
+            if _monitor['ruta'] != ruta:
+                _cerrar_monitor()
+                _cache.invalidar()
+                _monitor['conn'] = sqlite3.connect(ruta.as_uri() + '?mode=ro', uri=True, check_same_thread=False)
+                _monitor['ruta'] = ruta
+            conn = _monitor['conn']
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version != _monitor['data_version']:
+                versiones = dict(conn.execute('SELECT tabla, version FROM versiones_tablas'))
+                anteriores = _monitor['versiones']
+                cambiadas = [tabla for tabla, version in versiones.items() if anteriores.get(tabla) != version]
+                if cambiadas:
+                    _cache.invalidar(cambiadas)
+                _monitor.update(data_version=data_version, versiones=versiones)
+        except sqlite3.Error:
+            # Base todavía sin crear o sin versiones_tablas (init_db no corrió): se lee sin caché
+            _cerrar_monitor()
+            _cache.invalidar()
+            return None
+    replica = _replica
+    if replica is not None and replica.disponible():
+        return replica.refrescada_en
+    return 'principal'
+
+def _clave_cache(valor):
+    """Versión hashable de los argumentos (los filtros de listado() llegan como dict)."""
+    if isinstance(valor, dict):
+        return (dict, tuple(sorted((k, _clave_cache(v)) for k, v in valor.items())))
+    if isinstance(valor, (list, tuple)):
+        return (type(valor), tuple(_clave_cache(v) for v in valor))
+    hash(valor)
+    return valor
+
+def _en_cache(tablas):
+    """
+    Memoriza la función de lectura por argumentos. `tablas` son las tablas que
+    lee, o una función que las calcula a partir de los mismos argumentos.
+    """
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            generacion = _generacion_cache()
+            if generacion is None:
+                return funcion(*args, **kwargs)
+            try:
+                clave = _clave_cache((funcion.__name__, args, kwargs))
+                encontrado, valor = _cache.obtener(clave, generacion)
+            except TypeError:  # argumentos no hashables
+                return funcion(*args, **kwargs)
+            if not encontrado:
+                epoca = valor
+                valor = funcion(*args, **kwargs)
+                _cache.guardar(clave, valor, tablas(*args, **kwargs) if callable(tablas) else tablas, generacion, epoca)
+            # Copia de la lista para que quien la modifique no altere la entrada
+            return list(valor) if isinstance(valor, list) else valor
+        return envoltura
+    return decorador
+
+def estadisticas_cache():
+    """Aciertos, fallos, invalidaciones, entradas y bytes de la caché de lecturas."""
+    return _cache.estadisticas()
+
+def vaciar_cache():
+    _cache.invalidar()
+
+# Al eliminar un paciente se eliminan sus consultas (ver eliminar_paciente)
+_TABLA_CONSULTAS = '''CREATE TABLE IF NOT EXISTS {} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            paciente_id INTEGER,
+            fecha_consulta DATETIME,
+            motivo TEXT,
+            diagnostico TEXT,
+            tratamiento TEXT,
+            medico TEXT,
+            estado TEXT,
+            prioridad TEXT,
+            FOREIGN KEY (paciente_id) REFERENCES pacientes (id) ON DELETE CASCADE
+        )'''
+
 def init_db(db_path=DB_PATH):
     """Inicializa la base de datos y crea las tablas si no existen."""
     with get_db_connection(db_path) as conn:
+        # WAL: los lectores (reportes, tablero, respaldos) no bloquean a los puestos que escriben
+        conn.execute('PRAGMA journal_mode = WAL')
         c = conn.cursor()
         c.execute('''CREATE TABLE IF NOT EXISTS pacientes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -30,20 +209,39 @@ def init_db(db_path=DB_PATH):
             direccion TEXT,
             obra_social TEXT,
             numero_afiliado TEXT,
-            fecha_registro DATETIME DEFAULT CURRENT_TIMESTAMP
+            fecha_registro DATETIME DEFAULT CURRENT_TIMESTAMP,
+            codigo_provisorio TEXT,
+            provisorio INTEGER NOT NULL DEFAULT 0
         )''')
-        c.execute('''CREATE TABLE IF NOT EXISTS consultas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            paciente_id INTEGER,
-            fecha_consulta DATETIME,
-            motivo TEXT,
-            diagnostico TEXT,
-            tratamiento TEXT,
-            medico TEXT,
-            estado TEXT,
-            prioridad TEXT,
-            FOREIGN KEY (paciente_id) REFERENCES pacientes (id)
+        # Pacientes sin identificar del ingreso masivo (ver ingreso_rapido.py): el código va en la pulsera
+        _agregar_columna_si_falta(c, 'pacientes', 'codigo_provisorio', 'TEXT')
+        _agregar_columna_si_falta(c, 'pacientes', 'provisorio', 'INTEGER NOT NULL DEFAULT 0')
+        c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_pacientes_codigo_provisorio ON pacientes (codigo_provisorio) 
+                     WHERE codigo_provisorio IS NOT NULL''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_pacientes_provisorios ON pacientes (id) WHERE provisorio = 1')
+        # Código de cada puesto en las pulseras del ingreso masivo: reservado acá para que no se repita
+        c.execute('''CREATE TABLE IF NOT EXISTS puestos_ingreso (
+            codigo TEXT PRIMARY KEY,
+            equipo TEXT NOT NULL,
+            fecha_alta DATETIME DEFAULT CURRENT_TIMESTAMP
         )''')
+        _crear_claves_pacientes(c)
+        c.execute(_TABLA_CONSULTAS.format('consultas'))
+        _migrar_claves_foraneas(c)
+        c.execute('CREATE INDEX IF NOT EXISTS idx_consultas_fecha ON consultas (fecha_consulta)')
+        # Índices para ordenar y filtrar la lista de consultas por columna (ver _LISTADOS)
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_consultas_prioridad_orden ON consultas ({_ORDEN_PRIORIDAD_SQL.format("")})')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_consultas_medico ON consultas (medico COLLATE NOCASE)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_consultas_estado ON consultas (estado)')
+        # Historia clínica de un paciente, de la más reciente hacia atrás (ver historia_paciente)
+        c.execute('DROP INDEX IF EXISTS idx_consultas_paciente')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_consultas_paciente_fecha ON consultas (paciente_id, fecha_consulta, id)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_pacientes_apellido ON pacientes (apellido COLLATE NOCASE)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_pacientes_nombre ON pacientes (nombre COLLATE NOCASE)')
+        _crear_carga_medicos(c)
+        _crear_eventos_consulta(c)
+        _crear_ubicaciones(c)
+        _crear_sintomas(c)
         c.execute('''CREATE TABLE IF NOT EXISTS personal (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             nombre TEXT NOT NULL,
@@ -53,72 +251,802 @@ def init_db(db_path=DB_PATH):
             turno TEXT,
             estado TEXT
         )''')
+        # Turnos asignados (roster); inicio/fin en hora local
+        c.execute('''CREATE TABLE IF NOT EXISTS turnos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            personal_id INTEGER NOT NULL,
+            inicio DATETIME NOT NULL,
+            fin DATETIME NOT NULL,
+            tipo TEXT,
+            FOREIGN KEY (personal_id) REFERENCES personal (id) ON DELETE CASCADE
+        )''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_turnos_inicio ON turnos (inicio, fin)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_turnos_personal_inicio ON turnos (personal_id, inicio)')
         c.execute('''CREATE TABLE IF NOT EXISTS recursos (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             tipo TEXT NOT NULL,
             nombre TEXT NOT NULL,
             cantidad INTEGER,
-            estado TEXT
+            estado TEXT,
+            stock_minimo INTEGER NOT NULL DEFAULT 5
+        )''')
+        _agregar_columna_si_falta(c, 'recursos', 'stock_minimo', 'INTEGER NOT NULL DEFAULT 5')
+        # Libro de movimientos de stock: la cantidad de recursos la mantiene el trigger
+        c.execute('''CREATE TABLE IF NOT EXISTS movimientos_recursos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recurso_id INTEGER NOT NULL,
+            tipo TEXT NOT NULL CHECK (tipo IN ('consumo', 'reposicion', 'ajuste')),
+            cantidad INTEGER NOT NULL,
+            usuario TEXT,
+            fecha DATETIME NOT NULL,
+            FOREIGN KEY (recurso_id) REFERENCES recursos (id) ON DELETE CASCADE
+        )''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS trg_movimientos_recursos_stock
+                     AFTER INSERT ON movimientos_recursos
+                     BEGIN
+                         UPDATE recursos SET cantidad = COALESCE(cantidad, 0) + NEW.cantidad WHERE id = NEW.recurso_id;
+                     END''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_movimientos_recurso_fecha ON movimientos_recursos (recurso_id, fecha)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_movimientos_tipo_fecha ON movimientos_recursos (tipo, fecha, recurso_id, cantidad)')
+        # Índice parcial: solo contiene los recursos por debajo de su mínimo
+        c.execute('CREATE INDEX IF NOT EXISTS idx_recursos_criticos ON recursos (stock_minimo) WHERE cantidad <= stock_minimo')
+        c.execute('''CREATE TABLE IF NOT EXISTS escrituras_aplicadas (
+            clave TEXT PRIMARY KEY,
+            operacion TEXT NOT NULL,
+            registro_id INTEGER,
+            fecha TEXT NOT NULL
         )''')
         c.execute('''CREATE TABLE IF NOT EXISTS usuarios (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             usuario TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL
         )''')
+        # Historial de cambios: lo escribe auditoria.py por tandas
+        c.execute('''CREATE TABLE IF NOT EXISTS auditoria (
+            id INTEGER PRIMARY KEY,
+            fecha TEXT NOT NULL,
+            usuario TEXT,
+            tabla TEXT NOT NULL,
+            registro_id INTEGER,
+            accion TEXT NOT NULL,
+            antes TEXT,
+            despues TEXT
+        )''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_auditoria_registro ON auditoria (tabla, registro_id, fecha)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_auditoria_usuario ON auditoria (usuario, fecha)')
+        _crear_versiones_tablas(c)
         conn.commit()
 
+def _migrar_claves_foraneas(c):
+    """
+    Las bases anteriores crearon consultas sin ON DELETE y no controlaban las claves
+    foráneas. SQLite no permite cambiar una FOREIGN KEY: se reconstruye la tabla
+    (las consultas de pacientes ya eliminados quedan sin paciente). Sus índices y
+    triggers se vuelven a crear a continuación en init_db.
+    """
+    c.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='consultas'")
+    if 'ON DELETE CASCADE' in c.fetchone()[0]:
+        return
+    columnas = 'id, paciente_id, fecha_consulta, motivo, diagnostico, tratamiento, medico, estado, prioridad'
+    c.connection.commit()
+    # Con las claves activas, DROP TABLE borraría en cascada las filas que apuntan a consultas
+    c.execute('PRAGMA foreign_keys = OFF')
+    try:
+        c.execute("SELECT seq FROM sqlite_sequence WHERE name = 'consultas'")
+        secuencia = c.fetchone()
+        c.execute(_TABLA_CONSULTAS.format('consultas_nueva'))
+        c.execute(f'''INSERT INTO consultas_nueva ({columnas}) 
+                      SELECT {columnas.replace('paciente_id', '(SELECT p.id FROM pacientes p WHERE p.id = paciente_id)')} FROM consultas''')
+        c.execute('DROP TABLE consultas')
+        c.execute('ALTER TABLE consultas_nueva RENAME TO consultas')
+        if secuencia:
+            # Que no se reutilicen ids de consultas ya eliminadas (auditoría, cola de escrituras)
+            c.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'consultas'", secuencia)
+        c.connection.commit()
+    finally:
+        c.execute('PRAGMA foreign_keys = ON')
+
+def _crear_claves_pacientes(c):
+    """Índice de agrupamiento (apellido fonético, año de nacimiento, variantes de DNI) para detectar duplicados."""
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='pacientes_claves'")
+    existia = c.fetchone() is not None
+    c.execute('''CREATE TABLE IF NOT EXISTS pacientes_claves (
+        clave TEXT NOT NULL,
+        paciente_id INTEGER NOT NULL,
+        PRIMARY KEY (clave, paciente_id)
+    ) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_pacientes_claves_paciente ON pacientes_claves (paciente_id)')
+    if not existia:
+        _reconstruir_claves_pacientes(c)
+
+def _reconstruir_claves_pacientes(c, tamano_bloque=10000):
+    c.execute('DELETE FROM pacientes_claves')
+    lectura = c.connection.cursor()
+    lectura.execute('SELECT id, nombre, apellido, dni, edad, fecha_registro FROM pacientes')
+    while True:
+        filas = lectura.fetchmany(tamano_bloque)
+        if not filas:
+            break
+        c.executemany('INSERT OR IGNORE INTO pacientes_claves (clave, paciente_id) VALUES (?, ?)',
+                      [(clave, id_) for id_, nombre, apellido, dni, edad, registro in filas
+                       for clave in fonetica.claves_paciente(nombre, apellido, dni, edad, registro)])
+
+def _guardar_claves_paciente(c, paciente_id):
+    c.execute('DELETE FROM pacientes_claves WHERE paciente_id = ?', (paciente_id,))
+    # Los provisorios no tienen claves: 'NN' y el código de la pulsera los agruparían a todos entre sí
+    c.execute('SELECT nombre, apellido, dni, edad, fecha_registro FROM pacientes WHERE id = ? AND NOT provisorio', (paciente_id,))
+    fila = c.fetchone()
+    if fila:
+        c.executemany('INSERT OR IGNORE INTO pacientes_claves (clave, paciente_id) VALUES (?, ?)',
+                      [(clave, paciente_id) for clave in fonetica.claves_paciente(*fila)])
+
+# Peso de cada prioridad en la carga de un médico
+_PESO_PRIORIDAD_SQL = "CASE {0}.prioridad WHEN 'Alta' THEN 3 WHEN 'Media' THEN 2 ELSE 1 END"
+
+def _crear_carga_medicos(c):
+    """Contadores de consultas abiertas por médico, mantenidos por triggers sobre consultas."""
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='carga_medicos'")
+    existia = c.fetchone() is not None
+    c.execute('''CREATE TABLE IF NOT EXISTS carga_medicos (
+        medico TEXT PRIMARY KEY,
+        abiertas INTEGER NOT NULL DEFAULT 0,
+        carga INTEGER NOT NULL DEFAULT 0
+    )''')
+    sumar = '''INSERT INTO carga_medicos (medico, abiertas, carga) VALUES (NEW.medico, 1, {peso})
+               ON CONFLICT (medico) DO UPDATE SET abiertas = abiertas + 1, carga = carga + excluded.carga;'''.format(
+        peso=_PESO_PRIORIDAD_SQL.format('NEW'))
+    restar = '''UPDATE carga_medicos SET abiertas = abiertas - 1, carga = carga - {peso} 
+                WHERE medico = OLD.medico;'''.format(peso=_PESO_PRIORIDAD_SQL.format('OLD'))
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_carga_medicos_insert AFTER INSERT ON consultas 
+                  WHEN NEW.estado = 'En espera' AND NEW.medico IS NOT NULL BEGIN {sumar} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_carga_medicos_update_resta AFTER UPDATE OF estado, prioridad, medico ON consultas 
+                  WHEN OLD.estado = 'En espera' BEGIN {restar} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_carga_medicos_update_suma AFTER UPDATE OF estado, prioridad, medico ON consultas 
+                  WHEN NEW.estado = 'En espera' AND NEW.medico IS NOT NULL BEGIN {sumar} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_carga_medicos_delete AFTER DELETE ON consultas 
+                  WHEN OLD.estado = 'En espera' BEGIN {restar} END''')
+    if not existia:
+        _recalcular_carga_medicos(c)
+
+def _recalcular_carga_medicos(c):
+    c.execute('DELETE FROM carga_medicos')
+    c.execute('''INSERT INTO carga_medicos (medico, abiertas, carga) 
+                 SELECT medico, COUNT(*), SUM({peso}) FROM consultas c 
+                 WHERE estado = 'En espera' AND medico IS NOT NULL GROUP BY medico'''.format(peso=_PESO_PRIORIDAD_SQL.format('c')))
+
+def _crear_eventos_consulta(c):
+    """Registro append-only de cambios de estado de las consultas, escrito por triggers."""
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='consulta_eventos'")
+    existia = c.fetchone() is not None
+    c.execute('''CREATE TABLE IF NOT EXISTS consulta_eventos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        consulta_id INTEGER NOT NULL,
+        estado_anterior TEXT,
+        estado_nuevo TEXT,
+        prioridad TEXT,
+        fecha DATETIME NOT NULL
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_consulta_eventos_estado_fecha ON consulta_eventos (estado_nuevo, fecha)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_consulta_eventos_consulta ON consulta_eventos (consulta_id, fecha)')
+    # El ingreso toma la fecha de la consulta; los cambios, la hora local del momento
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_consulta_eventos_insert AFTER INSERT ON consultas BEGIN
+                     INSERT INTO consulta_eventos (consulta_id, estado_anterior, estado_nuevo, prioridad, fecha) 
+                     VALUES (NEW.id, NULL, NEW.estado, NEW.prioridad, COALESCE(NEW.fecha_consulta, strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')));
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_consulta_eventos_update AFTER UPDATE OF estado ON consultas 
+                 WHEN OLD.estado IS NOT NEW.estado BEGIN
+                     INSERT INTO consulta_eventos (consulta_id, estado_anterior, estado_nuevo, prioridad, fecha) 
+                     VALUES (NEW.id, OLD.estado, NEW.estado, NEW.prioridad, strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'));
+                 END''')
+    if not existia:
+        # Las consultas anteriores solo tienen su ingreso
+        c.execute('''INSERT INTO consulta_eventos (consulta_id, estado_anterior, estado_nuevo, prioridad, fecha) 
+                     SELECT id, NULL, 'En espera', prioridad, fecha_consulta FROM consultas WHERE fecha_consulta IS NOT NULL''')
+
+def _crear_sintomas(c):
+    """
+    Síntomas del motivo de cada consulta, codificados con triage.py al guardarla.
+    La fecha de la consulta se repite en consulta_sintomas (la mantiene un trigger)
+    para que contar un síntoma en un período sea un rango de la clave primaria.
+    Si el catálogo cambió (o la tabla es nueva) las consultas existentes quedan
+    pendientes y las codifica sintomas.py por tandas.
+    """
+    c.execute('''CREATE TABLE IF NOT EXISTS sintomas (
+        codigo TEXT PRIMARY KEY,
+        descripcion TEXT NOT NULL,
+        prioridad TEXT NOT NULL
+    ) WITHOUT ROWID''')
+    c.execute('''CREATE TABLE IF NOT EXISTS consulta_sintomas (
+        codigo TEXT NOT NULL,
+        fecha DATETIME NOT NULL,
+        consulta_id INTEGER NOT NULL,
+        PRIMARY KEY (codigo, fecha, consulta_id),
+        FOREIGN KEY (consulta_id) REFERENCES consultas (id) ON DELETE CASCADE
+    ) WITHOUT ROWID''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_consulta_sintomas_consulta ON consulta_sintomas (consulta_id)')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_consulta_sintomas_fecha AFTER UPDATE OF fecha_consulta ON consultas 
+                 WHEN NEW.fecha_consulta IS NOT OLD.fecha_consulta AND NEW.fecha_consulta IS NOT NULL BEGIN
+                     UPDATE consulta_sintomas SET fecha = NEW.fecha_consulta WHERE consulta_id = NEW.id;
+                 END''')
+    # Consultas con id en (desde_id, hasta_id] todavía sin codificar con el catálogo `version`
+    c.execute('''CREATE TABLE IF NOT EXISTS codificacion_sintomas (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version TEXT NOT NULL,
+        desde_id INTEGER NOT NULL,
+        hasta_id INTEGER NOT NULL
+    )''')
+    version = triage.version_catalogo()
+    c.execute('SELECT version FROM codificacion_sintomas')
+    fila = c.fetchone()
+    if fila is None or fila[0] != version:
+        c.execute('DELETE FROM sintomas')
+        c.executemany('INSERT INTO sintomas (codigo, descripcion, prioridad) VALUES (?, ?, ?)',
+                      [(codigo, descripcion, prioridad) for codigo, (descripcion, prioridad, _) in triage.SINTOMAS.items()])
+        c.execute('''INSERT OR REPLACE INTO codificacion_sintomas (id, version, desde_id, hasta_id) 
+                     SELECT 1, ?, 0, COALESCE(MAX(id), 0) FROM consultas''', (version,))
+
+def _guardar_sintomas_consulta(c, consulta_id, motivo):
+    c.execute('DELETE FROM consulta_sintomas WHERE consulta_id = ?', (consulta_id,))
+    c.executemany('''INSERT OR IGNORE INTO consulta_sintomas (codigo, fecha, consulta_id) 
+                     SELECT ?, fecha_consulta, id FROM consultas WHERE id = ? AND fecha_consulta IS NOT NULL''',
+                  [(codigo, consulta_id) for codigo in triage.codificar(motivo)])
+
+# Tipos de ubicación física de la guardia
+TIPOS_UBICACION = ('Box', 'Cama', 'Sillón de observación')
+# Extremo de las ocupaciones abiertas en el índice de intervalos (máximo de rtree_i32)
+_SIN_FIN = 2147483647
+
+def _crear_ubicaciones(c):
+    """
+    Ubicaciones (boxes, camas, sillones) y sus ocupaciones. Cada ubicación apunta a
+    su ocupación abierta y ocupacion_por_tipo lleva los totales, ambos mantenidos
+    por triggers: saber qué está libre ahora no depende del historial. Para "quién
+    estaba en T" los intervalos se indexan en un R*Tree por minuto.
+    """
+    c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='ocupacion_por_tipo'")
+    existia = c.fetchone() is not None
+    c.execute('''CREATE TABLE IF NOT EXISTS ubicaciones (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT UNIQUE NOT NULL,
+        tipo TEXT NOT NULL,
+        sector TEXT,
+        activa INTEGER NOT NULL DEFAULT 1,
+        ocupacion_id INTEGER
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_ubicaciones_libres ON ubicaciones (tipo) WHERE ocupacion_id IS NULL AND activa = 1')
+    c.execute('''CREATE TABLE IF NOT EXISTS ocupaciones (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ubicacion_id INTEGER NOT NULL,
+        consulta_id INTEGER,
+        desde DATETIME NOT NULL,
+        hasta DATETIME,
+        FOREIGN KEY (ubicacion_id) REFERENCES ubicaciones (id),
+        FOREIGN KEY (consulta_id) REFERENCES consultas (id) ON DELETE SET NULL
+    )''')
+    # Una sola ocupación abierta por ubicación
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_ocupaciones_abiertas ON ocupaciones (ubicacion_id) WHERE hasta IS NULL')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_ocupaciones_consulta ON ocupaciones (consulta_id)')
+    c.execute('CREATE VIRTUAL TABLE IF NOT EXISTS ocupaciones_rango USING rtree_i32(id, desde_min, hasta_min)')
+    minuto_desde = "CAST(strftime('%s', NEW.desde) AS INTEGER) / 60"
+    minuto_hasta = f"COALESCE((CAST(strftime('%s', NEW.hasta) AS INTEGER) + 59) / 60, {_SIN_FIN})"
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_ocupaciones_insert AFTER INSERT ON ocupaciones BEGIN
+                      INSERT INTO ocupaciones_rango (id, desde_min, hasta_min) VALUES (NEW.id, {minuto_desde}, {minuto_hasta});
+                      UPDATE ubicaciones SET ocupacion_id = NEW.id WHERE id = NEW.ubicacion_id AND NEW.hasta IS NULL;
+                  END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_ocupaciones_update AFTER UPDATE OF desde, hasta ON ocupaciones BEGIN
+                      UPDATE ocupaciones_rango SET desde_min = {minuto_desde}, hasta_min = {minuto_hasta} WHERE id = NEW.id;
+                      UPDATE ubicaciones SET ocupacion_id = NULL 
+                      WHERE id = NEW.ubicacion_id AND ocupacion_id = NEW.id AND NEW.hasta IS NOT NULL;
+                  END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_ocupaciones_delete AFTER DELETE ON ocupaciones BEGIN
+                     DELETE FROM ocupaciones_rango WHERE id = OLD.id;
+                     UPDATE ubicaciones SET ocupacion_id = NULL WHERE id = OLD.ubicacion_id AND ocupacion_id = OLD.id;
+                 END''')
+    # Una consulta cancelada o borrada deja libre su lugar; las atendidas siguen
+    # ocupándolo (observación) hasta que se libera a mano
+    liberar = '''UPDATE ocupaciones SET hasta = strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime') 
+                 WHERE consulta_id = {0}.id AND hasta IS NULL;'''
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_ocupaciones_consulta_cancelada AFTER UPDATE OF estado ON consultas 
+                  WHEN NEW.estado = 'Cancelada' BEGIN {liberar.format('NEW')} END''')
+    # BEFORE: con las claves foráneas activas, ON DELETE SET NULL deja consulta_id en NULL
+    # antes de los triggers AFTER y la ocupación ya no se encontraría (también al borrar
+    # el paciente en cascada o al archivar)
+    c.execute('DROP TRIGGER IF EXISTS trg_ocupaciones_consulta_delete')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_ocupaciones_consulta_borrada BEFORE DELETE ON consultas 
+                  BEGIN {liberar.format('OLD')} END''')
+    c.execute('''CREATE TABLE IF NOT EXISTS ocupacion_por_tipo (
+        tipo TEXT PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0,
+        ocupadas INTEGER NOT NULL DEFAULT 0
+    )''')
+    sumar = '''INSERT INTO ocupacion_por_tipo (tipo, total, ocupadas) VALUES (NEW.tipo, 1, NEW.ocupacion_id IS NOT NULL)
+               ON CONFLICT (tipo) DO UPDATE SET total = total + 1, ocupadas = ocupadas + excluded.ocupadas;'''
+    restar = '''UPDATE ocupacion_por_tipo SET total = total - 1, ocupadas = ocupadas - (OLD.ocupacion_id IS NOT NULL) 
+                WHERE tipo = OLD.tipo;'''
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_ocupacion_tipo_insert AFTER INSERT ON ubicaciones 
+                  WHEN NEW.activa BEGIN {sumar} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_ocupacion_tipo_update_resta AFTER UPDATE OF tipo, activa, ocupacion_id ON ubicaciones 
+                  WHEN OLD.activa BEGIN {restar} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_ocupacion_tipo_update_suma AFTER UPDATE OF tipo, activa, ocupacion_id ON ubicaciones 
+                  WHEN NEW.activa BEGIN {sumar} END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_ocupacion_tipo_delete AFTER DELETE ON ubicaciones 
+                  WHEN OLD.activa BEGIN {restar} END''')
+    if not existia:
+        _recalcular_ocupacion_por_tipo(c)
+
+def _recalcular_ocupacion_por_tipo(c):
+    c.execute('DELETE FROM ocupacion_por_tipo')
+    c.execute('''INSERT INTO ocupacion_por_tipo (tipo, total, ocupadas) 
+                 SELECT tipo, COUNT(*), COUNT(ocupacion_id) FROM ubicaciones WHERE activa = 1 GROUP BY tipo''')
+
+def _agregar_columna_si_falta(c, tabla, columna, definicion):
+    """Agrega una columna a una tabla existente (migración de bases anteriores)."""
+    c.execute(f'PRAGMA table_info({tabla})')
+    if columna not in [fila[1] for fila in c.fetchall()]:
+        c.execute(f'ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}')
+
+def _filas(c, tipo):
+    """Convierte las filas del cursor al tipo indicado sin ejecutar código Python por fila."""
+    return list(map(partial(tuple.__new__, tipo), c.fetchall()))
+
+def _ahora():
+    """Fecha y hora local en el mismo formato que se guarda en fecha_consulta."""
+    return datetime.now().isoformat(sep=' ')
+
+# --- Auditoría (ver auditoria.py) ---
+
+# Usuario que firma las escrituras de este proceso (lo fija el login)
+_usuario = None
+# Registro que recibe los cambios confirmados; None = no se audita (scripts, pruebas)
+_auditoria = None
+
+def establecer_usuario(usuario):
+    global _usuario
+    _usuario = usuario
+
+def usuario_actual():
+    return _usuario
+
+def usar_auditoria(registro):
+    """Envía los cambios de cada escritura a `registro` (auditoria.Auditoria o None para no auditar)."""
+    global _auditoria
+    _auditoria = registro
+
+def _previas(c, tabla, ids):
+    """{id: fila como dict} antes de modificar o borrar; vacío si no se audita."""
+    ids = list(ids)
+    if _auditoria is None or not ids:
+        return {}
+    previas = {}
+    for inicio in range(0, len(ids), 500):
+        tramo = ids[inicio:inicio + 500]
+        c.execute(f'SELECT * FROM {tabla} WHERE id IN ({",".join("?" * len(tramo))})', tramo)
+        columnas = [d[0] for d in c.description]
+        for fila in c.fetchall():
+            previas[fila[0]] = dict(zip(columnas, fila))
+    return previas
+
+def _auditar(cambios, usuario=None):
+    """
+    Entrega [(tabla, registro_id, accion, antes, despues)] ya confirmados al registro
+    de auditoría. No escribe en la base: se llama después del commit.
+    """
+    if _auditoria is not None and cambios:
+        _auditoria.registrar(cambios, usuario or _usuario)
+
+def historial_registro(tabla, registro_id, limite=100):
+    """Cambios de un registro, del más reciente al más antiguo."""
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT id, fecha, usuario, tabla, registro_id, accion, antes, despues FROM auditoria 
+                     WHERE tabla = ? AND registro_id = ? ORDER BY fecha DESC LIMIT ?''', (tabla, registro_id, limite))
+        return [_entrada_auditoria(fila) for fila in c.fetchall()]
+
+def acciones_usuario(usuario, desde, hasta, limite=500):
+    """Cambios hechos por `usuario` en [desde, hasta), del más reciente al más antiguo."""
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT id, fecha, usuario, tabla, registro_id, accion, antes, despues FROM auditoria 
+                     WHERE usuario = ? AND fecha >= ? AND fecha < ? ORDER BY fecha DESC LIMIT ?''', 
+                  (usuario, str(desde), str(hasta), limite))
+        return [_entrada_auditoria(fila) for fila in c.fetchall()]
+
+def _entrada_auditoria(fila):
+    *datos, antes, despues = fila
+    return EntradaAuditoria(*datos, json.loads(antes) if antes else None, json.loads(despues) if despues else None)
+
+# --- Listados con orden y filtros por columna ---
+
+# Orden clínico de las prioridades; la misma expresión tiene un índice en consultas
+_ORDEN_PRIORIDAD_SQL = "CASE {0}prioridad WHEN 'Alta' THEN 1 WHEN 'Media' THEN 2 WHEN 'Baja' THEN 3 END"
+
+# Por listado: FROM, tablas que lee (para la caché), tipo de fila, orden por defecto, columna de fecha
+# indexada para filtrar por rango (si tiene) y, por columna,
+# (expresión del SELECT, expresión de orden, expresión a filtrar, modo de filtro).
+# La expresión de orden puede ser una tupla: sólo la primera puede ser NULL.
+# Modos: 'prefijo' (rango sobre un índice), 'contiene' (LIKE, sin índice) e 'igual'.
+_LISTADOS = {
+    'pacientes': {
+        'desde': 'pacientes p',
+        'tablas': ('pacientes',),
+        'tipo': Paciente,
+        'orden': ('id', False),
+        'columnas': {
+            'id': ('p.id', 'p.id', 'p.id', 'igual'),
+            'nombre': ('p.nombre', 'p.nombre COLLATE NOCASE', 'p.nombre COLLATE NOCASE', 'prefijo'),
+            'apellido': ('p.apellido', 'p.apellido COLLATE NOCASE', 'p.apellido COLLATE NOCASE', 'prefijo'),
+            'dni': ('p.dni', 'p.dni', 'p.dni', 'prefijo'),
+            'edad': ('p.edad', 'p.edad', 'p.edad', 'igual'),
+            'genero': ('p.genero', 'p.genero', 'p.genero', 'igual'),
+            'telefono': ('p.telefono', 'p.telefono', 'p.telefono', 'contiene'),
+            'email': ('p.email', 'p.email', 'p.email', 'contiene'),
+            'direccion': ('p.direccion', 'p.direccion', 'p.direccion', 'contiene'),
+            'obra_social': ('p.obra_social', 'p.obra_social', 'p.obra_social', 'contiene'),
+            'numero_afiliado': ('p.numero_afiliado', 'p.numero_afiliado', 'p.numero_afiliado', 'contiene'),
+        },
+    },
+    'consultas': {
+        'desde': 'consultas c JOIN pacientes p ON c.paciente_id = p.id',
+        'tablas': ('consultas', 'pacientes'),
+        'tipo': Consulta,
+        'orden': ('fecha_consulta', True),
+        'fecha': 'c.fecha_consulta',
+        'columnas': {
+            'id': ('c.id', 'c.id', 'c.id', 'igual'),
+            # Por apellido y paciente: recorre el índice del apellido y las consultas de cada paciente por el suyo
+            'paciente': ('p.nombre || " " || p.apellido', ('p.apellido COLLATE NOCASE', 'p.id'), 'p.apellido COLLATE NOCASE', 'prefijo'),
+            'fecha_consulta': ('c.fecha_consulta', 'c.fecha_consulta', 'c.fecha_consulta', 'prefijo'),
+            'motivo': ('c.motivo', 'c.motivo', 'c.motivo', 'contiene'),
+            'prioridad': ('c.prioridad', _ORDEN_PRIORIDAD_SQL.format('c.'), 'c.prioridad', 'igual'),
+            'medico': ('c.medico', 'c.medico COLLATE NOCASE', 'c.medico COLLATE NOCASE', 'prefijo'),
+            'estado': ('c.estado', 'c.estado', 'c.estado', 'igual'),
+        },
+    },
+    'personal': {
+        'desde': 'personal',
+        'tablas': ('personal',),
+        'tipo': Personal,
+        'orden': ('id', False),
+        'columnas': {
+            'id': ('id', 'id', 'id', 'igual'),
+            'nombre': ('nombre', 'nombre COLLATE NOCASE', 'nombre', 'contiene'),
+            'apellido': ('apellido', 'apellido COLLATE NOCASE', 'apellido', 'contiene'),
+            'especialidad': ('especialidad', 'especialidad COLLATE NOCASE', 'especialidad', 'contiene'),
+            'matricula': ('matricula', 'matricula', 'matricula', 'contiene'),
+            'turno': ('turno', 'turno', 'turno', 'contiene'),
+            'estado': ('estado', 'estado', 'estado', 'contiene'),
+        },
+    },
+    'recursos': {
+        'desde': 'recursos',
+        'tablas': ('recursos',),
+        'tipo': Recurso,
+        'orden': ('id', False),
+        'columnas': {
+            'id': ('id', 'id', 'id', 'igual'),
+            'tipo': ('tipo', 'tipo COLLATE NOCASE', 'tipo', 'contiene'),
+            'nombre': ('nombre', 'nombre COLLATE NOCASE', 'nombre', 'contiene'),
+            'cantidad': ('cantidad', 'cantidad', 'cantidad', 'igual'),
+            'estado': ('estado', 'estado COLLATE NOCASE', 'estado', 'contiene'),
+            'stock_minimo': ('stock_minimo', 'stock_minimo', 'stock_minimo', 'igual'),
+        },
+    },
+}
+
+def _condicion_filtro(expresion, modo, valor):
+    if modo == 'prefijo':
+        # Rango en lugar de LIKE para que lo resuelva el índice de la columna
+        return f'{expresion} >= ? AND {expresion} < ?', [valor, valor + '\U0010ffff']
+    if modo == 'contiene':
+        return f"{expresion} LIKE ? ESCAPE '\\'", ['%' + valor.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%']
+    return f'{expresion} = ?', [valor]
+
+def _siguientes(claves, despues, descendente):
+    """
+    Condiciones que eligen, en el orden del listado, las filas posteriores a la que
+    tiene los valores `despues` de `claves` (la última es el id, que desempata): el
+    resto de su grupo de claves iguales, luego los grupos siguientes de cada clave y,
+    si la primera puede ser NULL, los NULL (SQLite los ordena primero). Cada una se
+    resuelve buscando en el índice, sin recorrer las filas anteriores. Devuelve
+    (condición, valores, cuántas de las primeras claves fija la condición).
+    """
+    signo = '<' if descendente else '>'
+
+    def grupos(claves, valores, fijas=0):
+        return [(' AND '.join([f'{clave} = ?' for clave in claves[:i]] + [f'{claves[i]} {signo} ?']), list(valores[:i + 1]), fijas + i)
+                for i in range(len(claves) - 1, -1, -1)]
+    primera = claves[0]
+    if despues[0] is None:
+        nulos = [(f'{primera} IS NULL AND {condicion}', valores, fijas)
+                 for condicion, valores, fijas in grupos(claves[1:], despues[1:], 1)]
+        return nulos if descendente else nulos + [(f'{primera} IS NOT NULL', [], 0)]
+    return grupos(claves, despues) + ([(f'{primera} IS NULL', [], 1)] if descendente else [])
+
+@_en_cache(lambda nombre, *args, **kwargs: _LISTADOS[nombre]['tablas'])
+def listado(nombre, orden=None, descendente=False, filtros=None, despues=None, por_pagina=50, rango=None):
+    """
+    Una página del listado `nombre` ('pacientes', 'consultas', 'personal' o 'recursos'),
+    ordenada por la columna `orden` y filtrada por {columna: texto} y, en los que tienen
+    fecha, por rango=(desde, hasta) con fecha en [desde, hasta). Sólo se aceptan
+    las columnas declaradas en _LISTADOS: ningún nombre de columna llega del usuario
+    al SQL. Como en historial_triage, la página siguiente se pide con el `despues`
+    que devolvió la anterior y no con OFFSET: la página 1000 cuesta lo mismo que
+    la primera. Devuelve (filas, despues de la última fila o None si no hay más).
+    """
+    definicion = _LISTADOS[nombre]
+    columnas = definicion['columnas']
+    if orden is None:
+        orden, descendente = definicion['orden']
+    if orden not in columnas:
+        raise ValueError(f"No se puede ordenar {nombre} por {orden!r}")
+    condiciones, parametros = [], []
+    for columna, valor in (filtros or {}).items():
+        valor = str(valor).strip() if valor is not None else ''
+        if not valor:
+            continue
+        if columna not in columnas:
+            raise ValueError(f"No se puede filtrar {nombre} por {columna!r}")
+        _, _, expresion, modo = columnas[columna]
+        condicion, valores = _condicion_filtro(expresion, modo, valor)
+        condiciones.append(condicion)
+        parametros.extend(valores)
+    if rango is not None:
+        if 'fecha' not in definicion:
+            raise ValueError(f"El listado {nombre} no se filtra por fecha")
+        condiciones.append(f"{definicion['fecha']} >= ? AND {definicion['fecha']} < ?")
+        parametros.extend(str(limite) for limite in rango)
+    direccion = 'DESC' if descendente else 'ASC'
+    claves = columnas[orden][1]
+    claves = (claves if isinstance(claves, tuple) else (claves,)) + (columnas['id'][1],)
+    seleccion = [c[0] for c in columnas.values()]
+    consulta = f"SELECT {', '.join(seleccion + list(claves))} FROM {definicion['desde']} WHERE {{}} ORDER BY {{}} LIMIT ?"
+    siguientes = [([], [], 0)] if despues is None else [([condicion], valores, fijas) for condicion, valores, fijas
+                                                        in _siguientes(claves, despues, descendente)]
+    resultado = []
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        for extra, valores, fijas in siguientes:
+            # Sin las claves que la condición deja fijas: con una expresión (prioridad) SQLite no lo deduce y ordenaría todo el grupo
+            c.execute(consulta.format(' AND '.join(condiciones + extra) or '1',
+                                      ', '.join(f'{clave} {direccion}' for clave in claves[fijas:])),
+                      parametros + valores + [por_pagina + 1 - len(resultado)])
+            resultado.extend(c.fetchall())
+            if len(resultado) > por_pagina:
+                break
+    n = len(seleccion)
+    filas = [tuple.__new__(definicion['tipo'], fila[:n]) for fila in resultado[:por_pagina]]
+    return filas, tuple(resultado[por_pagina - 1][n:]) if len(resultado) > por_pagina else None
+
 # --- Pacientes ---
 
+_COLUMNAS_PACIENTE = 'id, nombre, apellido, dni, edad, genero, telefono, email, direccion, obra_social, numero_afiliado'
+
+def _insertar_paciente(c, datos):
+    c.execute('''INSERT INTO pacientes (nombre, apellido, dni, edad, genero, telefono, email, direccion, obra_social, numero_afiliado, 
+                                        codigo_provisorio, provisorio, fecha_registro) 
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))''', (
+        datos['nombre'], datos['apellido'], datos['dni'], datos['edad'], datos['genero'], 
+        datos['telefono'], datos['email'], datos['direccion'], datos['obra_social'], datos['numero_afiliado'],
+        datos.get('codigo_provisorio'), datos.get('codigo_provisorio') is not None, datos.get('fecha_registro')))
+    paciente_id = c.lastrowid
+    _guardar_claves_paciente(c, paciente_id)
+    return paciente_id
+
 def agregar_paciente(datos):
     with get_db_connection() as conn:
-        c = conn.cursor()
-        c.execute('''INSERT INTO pacientes (nombre, apellido, dni, edad, genero, telefono, email, direccion, obra_social, numero_afiliado) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (
-            datos['nombre'], datos['apellido'], datos['dni'], datos['edad'], datos['genero'], 
-            datos['telefono'], datos['email'], datos['direccion'], datos['obra_social'], datos['numero_afiliado']))
+        paciente_id = _insertar_paciente(conn.cursor(), datos)
         conn.commit()
+    _auditar([('pacientes', paciente_id, 'alta', None, dict(datos))])
+    return paciente_id
 
+@_en_cache(('pacientes',))
 def obtener_pacientes():
-    with get_db_connection() as conn:
+    with _conexion_lectura() as conn:
         c = conn.cursor()
-        c.execute('SELECT * FROM pacientes')
-        return c.fetchall()
+        c.execute(f'SELECT {_COLUMNAS_PACIENTE} FROM pacientes')
+        return _filas(c, Paciente)
 
-def actualizar_paciente(paciente_id, datos):
+def actualizar_paciente(paciente_id, datos, identificar=False):
+    """Con identificar=True el paciente, si era provisorio, pasa a identificado (conserva su código)."""
     with get_db_connection() as conn:
         c = conn.cursor()
-        c.execute('''UPDATE pacientes SET nombre=?, apellido=?, dni=?, edad=?, genero=?, telefono=?, email=?, direccion=?, obra_social=?, numero_afiliado=? 
+        antes = _previas(c, 'pacientes', [paciente_id])
+        c.execute('''UPDATE pacientes SET nombre=?, apellido=?, dni=?, edad=?, genero=?, telefono=?, email=?, direccion=?, obra_social=?, numero_afiliado=?, 
+                                          provisorio = CASE WHEN ? THEN 0 ELSE provisorio END 
                      WHERE id=?''', (
             datos['nombre'], datos['apellido'], datos['dni'], datos['edad'], datos['genero'], 
-            datos['telefono'], datos['email'], datos['direccion'], datos['obra_social'], datos['numero_afiliado'], paciente_id))
+            datos['telefono'], datos['email'], datos['direccion'], datos['obra_social'], datos['numero_afiliado'], identificar, paciente_id))
+        _guardar_claves_paciente(c, paciente_id)
         conn.commit()
+    _auditar([('pacientes', paciente_id, 'modificacion', antes.get(paciente_id), dict(datos))])
 
 def eliminar_paciente(paciente_id):
+    """Elimina el paciente y, en cascada, sus consultas."""
     with get_db_connection() as conn:
         c = conn.cursor()
+        antes = _previas(c, 'pacientes', [paciente_id])
+        if antes:
+            c.execute('SELECT id FROM consultas WHERE paciente_id = ?', (paciente_id,))
+            consultas_antes = _previas(c, 'consultas', [fila[0] for fila in c.fetchall()])
+        c.execute('DELETE FROM pacientes_claves WHERE paciente_id=?', (paciente_id,))
         c.execute('DELETE FROM pacientes WHERE id=?', (paciente_id,))
         conn.commit()
+    if antes:
+        _auditar([('pacientes', paciente_id, 'baja', fila, None) for fila in antes.values()]
+                 + [('consultas', consulta_id, 'baja', fila, None) for consulta_id, fila in consultas_antes.items()])
 
 def pacientes():
     return obtener_pacientes()
 
+@_en_cache(('pacientes',))
 def pacientes_filtrado(valor):
-    with get_db_connection() as conn:
+    with _conexion_lectura() as conn:
         c = conn.cursor()
-        c.execute('''SELECT * FROM pacientes WHERE nombre LIKE ? OR apellido LIKE ? OR dni LIKE ?''', 
+        c.execute(f'''SELECT {_COLUMNAS_PACIENTE} FROM pacientes WHERE nombre LIKE ? OR apellido LIKE ? OR dni LIKE ?''', 
                   (f'%{valor}%', f'%{valor}%', f'%{valor}%'))
-        return c.fetchall()
+        return _filas(c, Paciente)
+
+@_en_cache(('pacientes',))
+def pacientes_resumen(valor='', limite=50):
+    """Pacientes para un selector: los más recientes que coinciden con `valor` (id, nombre, apellido, dni, edad)."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT id, nombre, apellido, dni, edad FROM pacientes 
+                     WHERE nombre LIKE ? OR apellido LIKE ? OR dni LIKE ? ORDER BY id DESC LIMIT ?''', 
+                  (f'%{valor}%', f'%{valor}%', f'%{valor}%', limite))
+        return _filas(c, PacienteResumen)
+
+@_en_cache(('pacientes',))
+def paciente_resumen(paciente_id):
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT id, nombre, apellido, dni, edad FROM pacientes WHERE id = ?', (paciente_id,))
+        fila = c.fetchone()
+        return PacienteResumen._make(fila) if fila else None
+
+@_en_cache(('pacientes', 'consultas'))
+def pacientes_provisorios():
+    """Pacientes del ingreso masivo todavía sin identificar, en orden de llegada, con su última consulta."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT p.id, p.codigo_provisorio, p.genero, p.edad, p.fecha_registro, c.prioridad, c.estado, c.motivo 
+                     FROM pacientes p LEFT JOIN consultas c ON c.id = (SELECT MAX(id) FROM consultas WHERE paciente_id = p.id) 
+                     WHERE p.provisorio = 1 ORDER BY p.id''')
+        return _filas(c, PacienteProvisorio)
+
+def reservar_codigo_puesto(equipo, candidatos):
+    """
+    Código de puesto de `equipo` para las pulseras del ingreso masivo: el primero de
+    `candidatos` que el equipo ya tenía reservado o que nadie reservó todavía (y que
+    queda reservado). None si todos son de otros equipos. Los códigos no se liberan.
+    """
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')  # dos equipos que arrancan a la vez no eligen el mismo
+        for codigo in candidatos:
+            c.execute('SELECT equipo FROM puestos_ingreso WHERE codigo = ?', (codigo,))
+            fila = c.fetchone()
+            if fila is None:
+                c.execute('INSERT INTO puestos_ingreso (codigo, equipo) VALUES (?, ?)', (codigo, equipo))
+            elif fila[0] != equipo:
+                continue
+            conn.commit()
+            return codigo
+        conn.commit()
+        return None
+
+def consultas_del_paciente(paciente_id):
+    """Cantidad de consultas del paciente (las que se eliminan junto con él)."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT COUNT(*) FROM consultas WHERE paciente_id = ?', (paciente_id,))
+        return c.fetchone()[0]
+
+@_en_cache(('consultas',))
+def historia_paciente(paciente_id, antes=None, limite=30):
+    """
+    Consultas del paciente de la más reciente hacia atrás, de a `limite`. Para la
+    página siguiente se pasa antes=(fecha_consulta, id) de la última fila recibida:
+    se sigue desde ahí por el índice (paciente_id, fecha_consulta, id), sin OFFSET,
+    así que cada página cuesta lo mismo sin importar cuántas consultas haya.
+    """
+    # Sin "? IS NULL OR ...": el planificador no usaría la comparación como límite del índice
+    desde_donde, parametros = ('AND (fecha_consulta, id) < (?, ?)', (paciente_id, *antes)) if antes else ('', (paciente_id,))
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        c.execute(f'''SELECT id, fecha_consulta, motivo, diagnostico, tratamiento, medico, estado, prioridad 
+                      FROM consultas WHERE paciente_id = ? {desde_donde} 
+                      ORDER BY fecha_consulta DESC, id DESC LIMIT ?''', (*parametros, limite))
+        return _filas(c, ConsultaPaciente)
+
+# --- Duplicados ---
+
+def pacientes_por_claves(claves):
+    """Pacientes que comparten alguna de las claves de agrupamiento."""
+    claves = list(claves)
+    if not claves:
+        return []
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(f'''SELECT {_COLUMNAS_PACIENTE} FROM pacientes WHERE id IN (
+                          SELECT paciente_id FROM pacientes_claves WHERE clave IN ({",".join("?" * len(claves))}))''', claves)
+        return _filas(c, Paciente)
+
+def pacientes_por_ids(ids):
+    ids = list(ids)
+    resultado = []
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        for inicio in range(0, len(ids), 500):
+            tramo = ids[inicio:inicio + 500]
+            c.execute(f'SELECT {_COLUMNAS_PACIENTE} FROM pacientes WHERE id IN ({",".join("?" * len(tramo))})', tramo)
+            resultado.extend(_filas(c, Paciente))
+    return resultado
+
+def bloques_claves(max_bloque=50):
+    """Grupos de ids de pacientes que comparten una clave (se omiten los bloques más grandes que max_bloque)."""
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT group_concat(paciente_id) FROM pacientes_claves 
+                     GROUP BY clave HAVING COUNT(*) BETWEEN 2 AND ?''', (max_bloque,))
+        for (ids,) in c:
+            yield [int(i) for i in ids.split(',')]
+
+def reconstruir_claves_pacientes():
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        _reconstruir_claves_pacientes(c)
+        conn.commit()
+
+def fusionar_pacientes(conservar_id, duplicado_id):
+    """
+    Pasa las consultas del duplicado al paciente que se conserva, completa sus datos
+    vacíos y borra el duplicado. También identifica a un paciente provisorio: se
+    conserva el paciente real, que se queda con el código de la pulsera.
+    """
+    campos = ['nombre', 'apellido', 'dni', 'edad', 'genero', 'telefono', 'email', 'direccion', 'obra_social', 'numero_afiliado',
+              'codigo_provisorio']
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute(f'SELECT {", ".join(campos)} FROM pacientes WHERE id = ?', (duplicado_id,))
+        duplicado = c.fetchone()
+        if duplicado is None or conservar_id == duplicado_id:
+            return False
+        antes = _previas(c, 'pacientes', [conservar_id, duplicado_id])
+        c.execute('SELECT id FROM consultas WHERE paciente_id = ?', (duplicado_id,))
+        movidas = [fila[0] for fila in c.fetchall()] if antes else []
+        c.execute('UPDATE consultas SET paciente_id = ? WHERE paciente_id = ?', (conservar_id, duplicado_id))
+        c.execute('DELETE FROM pacientes_claves WHERE paciente_id = ?', (duplicado_id,))
+        c.execute('DELETE FROM pacientes WHERE id = ?', (duplicado_id,))
+        c.execute(f'''UPDATE pacientes SET {", ".join(f"{campo} = COALESCE(NULLIF({campo}, ''), ?)" for campo in campos)} 
+                      WHERE id = ?''', (*duplicado, conservar_id))
+        _guardar_claves_paciente(c, conservar_id)
+        despues = _previas(c, 'pacientes', [conservar_id])
+        conn.commit()
+    if antes:
+        _auditar([('pacientes', duplicado_id, 'baja', antes.get(duplicado_id), {'fusionado_en': conservar_id}),
+                  ('pacientes', conservar_id, 'modificacion', antes.get(conservar_id), despues.get(conservar_id))]
+                 + [('consultas', consulta_id, 'modificacion', {'paciente_id': duplicado_id}, {'paciente_id': conservar_id})
+                    for consulta_id in movidas])
+    return True
 
 # --- Consultas ---
 
+def _insertar_consulta(c, datos):
+    c.execute('''INSERT INTO consultas (paciente_id, fecha_consulta, motivo, diagnostico, tratamiento, medico, estado, prioridad) 
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', (
+        datos['paciente_id'], datos['fecha_consulta'], datos['motivo'], datos.get('diagnostico', ''), 
+        datos.get('tratamiento', ''), datos['medico'], datos['estado'], datos['prioridad']))
+    consulta_id = c.lastrowid
+    _guardar_sintomas_consulta(c, consulta_id, datos['motivo'])
+    return consulta_id
+
 def agregar_consulta(datos):
     with get_db_connection() as conn:
-        c = conn.cursor()
-        c.execute('''INSERT INTO consultas (paciente_id, fecha_consulta, motivo, diagnostico, tratamiento, medico, estado, prioridad) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', (
-            datos['paciente_id'], datos['fecha_consulta'], datos['motivo'], datos.get('diagnostico', ''), 
-            datos.get('tratamiento', ''), datos['medico'], datos['estado'], datos['prioridad']))
+        consulta_id = _insertar_consulta(conn.cursor(), datos)
         conn.commit()
+    _auditar([('consultas', consulta_id, 'alta', None, dict(datos))])
+    return consulta_id
 
 def obtener_consultas():
     with get_db_connection() as conn:
@@ -129,57 +1057,452 @@ def obtener_consultas():
 def actualizar_consulta(consulta_id, datos):
     with get_db_connection() as conn:
         c = conn.cursor()
+        antes = _previas(c, 'consultas', [consulta_id])
         c.execute('''UPDATE consultas SET paciente_id=?, fecha_consulta=?, motivo=?, diagnostico=?, tratamiento=?, medico=?, estado=?, prioridad=? 
                      WHERE id=?''', (
             datos['paciente_id'], datos['fecha_consulta'], datos['motivo'], datos.get('diagnostico', ''), 
             datos.get('tratamiento', ''), datos['medico'], datos['estado'], datos['prioridad'], consulta_id))
+        _guardar_sintomas_consulta(c, consulta_id, datos['motivo'])
         conn.commit()
+    _auditar([('consultas', consulta_id, 'modificacion', antes.get(consulta_id), dict(datos))])
 
 def eliminar_consulta(consulta_id):
+    eliminar_consultas([consulta_id])
+
+def actualizar_estado_consultas(consulta_ids, nuevo_estado):
+    """Cambia el estado de varias consultas en una sola transacción; devuelve cuántas cambiaron."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        antes = _previas(c, 'consultas', consulta_ids)
+        c.executemany('UPDATE consultas SET estado=? WHERE id=? AND estado IS NOT ?', 
+                      [(nuevo_estado, consulta_id, nuevo_estado) for consulta_id in consulta_ids])
+        cambiadas = c.rowcount
+        conn.commit()
+    _auditar([('consultas', consulta_id, 'modificacion', fila, {'estado': nuevo_estado}) for consulta_id, fila in antes.items()])
+    return cambiadas
+
+def eliminar_consultas(consulta_ids):
+    """Elimina varias consultas en una sola transacción; devuelve cuántas se eliminaron."""
     with get_db_connection() as conn:
         c = conn.cursor()
-        c.execute('DELETE FROM consultas WHERE id=?', (consulta_id,))
+        antes = _previas(c, 'consultas', consulta_ids)
+        c.executemany('DELETE FROM consultas WHERE id=?', [(consulta_id,) for consulta_id in consulta_ids])
+        eliminadas = c.rowcount
         conn.commit()
+    _auditar([('consultas', consulta_id, 'baja', fila, None) for consulta_id, fila in antes.items()])
+    return eliminadas
 
+def consultas_por_ids(consulta_ids):
+    """Filas de la lista de consultas para los ids dados (se leen de la base principal, recién escritas)."""
+    consulta_ids = list(consulta_ids)
+    resultado = []
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        for inicio in range(0, len(consulta_ids), 500):
+            tramo = consulta_ids[inicio:inicio + 500]
+            c.execute(f'''SELECT c.id, p.nombre || " " || p.apellido, c.fecha_consulta, c.motivo, c.prioridad, c.medico, c.estado 
+                          FROM consultas c JOIN pacientes p ON c.paciente_id = p.id 
+                          WHERE c.id IN ({",".join("?" * len(tramo))})''', tramo)
+            resultado.extend(_filas(c, Consulta))
+    return resultado
+
+@_en_cache(('consultas', 'pacientes'))
 def consultas():
     """Devuelve todas las consultas con datos de paciente."""
-    with get_db_connection() as conn:
+    with _conexion_lectura() as conn:
         c = conn.cursor()
         c.execute('''SELECT c.id, p.nombre || " " || p.apellido, c.fecha_consulta, c.motivo, c.prioridad, c.medico, c.estado 
                      FROM consultas c JOIN pacientes p ON c.paciente_id = p.id ORDER BY c.fecha_consulta DESC''')
-        return c.fetchall()
+        return _filas(c, Consulta)
 
+@_en_cache(('consultas', 'pacientes'))
 def consultas_filtrado(valor):
-    with get_db_connection() as conn:
+    with _conexion_lectura() as conn:
         c = conn.cursor()
         c.execute('''SELECT c.id, p.nombre || " " || p.apellido, c.fecha_consulta, c.motivo, c.prioridad, c.medico, c.estado 
                      FROM consultas c JOIN pacientes p ON c.paciente_id = p.id 
                      WHERE p.nombre LIKE ? OR p.apellido LIKE ? OR c.motivo LIKE ? OR c.medico LIKE ? 
                      ORDER BY c.fecha_consulta DESC''', (f'%{valor}%', f'%{valor}%', f'%{valor}%', f'%{valor}%'))
-        return c.fetchall()
+        return _filas(c, Consulta)
 
 def consultas_en_espera_lista():
     with get_db_connection() as conn:
         c = conn.cursor()
-        c.execute('''SELECT c.id, p.nombre || " " || p.apellido, c.motivo, c.prioridad, datetime(c.fecha_consulta) as tiempo_espera 
+        c.execute('''SELECT c.id, p.nombre || " " || p.apellido, c.motivo, c.prioridad, 
+                            CAST((julianday('now', 'localtime') - julianday(c.fecha_consulta)) * 1440 AS INTEGER) as minutos_espera 
                      FROM consultas c JOIN pacientes p ON c.paciente_id = p.id 
                      WHERE c.estado = 'En espera' 
                      ORDER BY CASE c.prioridad WHEN 'Alta' THEN 1 WHEN 'Media' THEN 2 WHEN 'Baja' THEN 3 END, c.fecha_consulta''')
-        return c.fetchall()
+        return _filas(c, ConsultaEnEspera)
 
+@_en_cache(('consultas', 'pacientes'))
 def consultas_recientes():
     with get_db_connection() as conn:
         c = conn.cursor()
         c.execute('''SELECT c.id, p.nombre || " " || p.apellido, c.fecha_consulta, c.motivo, c.prioridad, c.estado 
                      FROM consultas c JOIN pacientes p ON c.paciente_id = p.id 
                      ORDER BY c.fecha_consulta DESC LIMIT 10''')
-        return c.fetchall()
+        return _filas(c, ConsultaReciente)
 
 def actualizar_estado_consulta(consulta_id, nuevo_estado):
+    actualizar_estado_consultas([consulta_id], nuevo_estado)
+
+# Sin caché: cada página se pide con otro cursor `antes`, y el índice ya la hace barata
+def historial_triage(desde, hasta, antes=None, limite=50, prioridad=None):
+    """
+    Consultas ingresadas en [desde, hasta), de la más reciente hacia atrás, de a
+    `limite`, con los minutos que esperaron hasta ser atendidas. Como en
+    historia_paciente, la página siguiente se pide con antes=(fecha_consulta, id)
+    de la última fila: se sigue por el índice de la fecha sin OFFSET, así que ver
+    la guardia de anoche cuesta lo mismo con un día o con años de historia.
+    """
+    if antes:
+        # La fecha de la última fila como límite del índice; el id desempata las de igual fecha
+        condiciones = ['c.fecha_consulta >= ?', 'c.fecha_consulta <= ?', '(c.fecha_consulta, c.id) < (?, ?)']
+        parametros = [str(desde), antes[0], *antes]
+    else:
+        condiciones, parametros = ['c.fecha_consulta >= ?', 'c.fecha_consulta < ?'], [str(desde), str(hasta)]
+    if prioridad:
+        condiciones.append('c.prioridad = ?')
+        parametros.append(prioridad)
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        c.execute(f'''SELECT c.id, p.nombre || " " || p.apellido, c.fecha_consulta, c.motivo, c.prioridad, c.medico, c.estado, 
+                             CAST((julianday((SELECT MIN(e.fecha) FROM consulta_eventos e 
+                                              WHERE e.consulta_id = c.id AND e.estado_nuevo = 'Atendido')) 
+                                   - julianday(c.fecha_consulta)) * 1440 AS INTEGER) 
+                      FROM consultas c JOIN pacientes p ON c.paciente_id = p.id 
+                      WHERE {' AND '.join(condiciones)} 
+                      ORDER BY c.fecha_consulta DESC, c.id DESC LIMIT ?''', (*parametros, limite))
+        return _filas(c, ConsultaTriage)
+
+# Sin caché: prediccion_demanda pide cada hora cerrada una sola vez y guarda lo que necesita
+def llegadas_por_hora(desde, hasta):
+    """Cantidad de consultas ingresadas por hora en [desde, hasta): ('AAAA-MM-DD HH', cantidad)."""
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT substr(fecha_consulta, 1, 13) AS hora, COUNT(*) FROM consultas 
+                     WHERE fecha_consulta >= ? AND fecha_consulta < ? GROUP BY hora''', (str(desde), str(hasta)))
+        return c.fetchall()
+
+# --- Eventos y tiempos de espera ---
+
+def eventos_consulta(consulta_id):
+    """Historial de estados de una consulta, del más antiguo al más reciente."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT estado_anterior, estado_nuevo, prioridad, fecha FROM consulta_eventos 
+                     WHERE consulta_id = ? ORDER BY fecha, id''', (consulta_id,))
+        return _filas(c, EventoConsulta)
+
+def _esperas_atencion(desde, hasta):
+    """(prioridad, hora de ingreso, minutos hasta la primera atención) de las consultas atendidas en [desde, hasta)."""
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT c.prioridad, CAST(strftime('%H', c.fecha_consulta) AS INTEGER), 
+                            (julianday(MIN(e.fecha)) - julianday(c.fecha_consulta)) * 1440 
+                     FROM consulta_eventos e JOIN consultas c ON c.id = e.consulta_id 
+                     WHERE e.estado_nuevo = 'Atendido' AND e.fecha >= ? AND e.fecha < ? 
+                     GROUP BY e.consulta_id''', (str(desde), str(hasta)))
+        return c.fetchall()
+
+def _percentiles(valores, cuantiles=(50, 90, 99)):
+    """Percentiles por rango más cercano de una lista de valores."""
+    valores = sorted(valores)
+    n = len(valores)
+    return tuple(round(valores[max(0, -(-q * n // 100) - 1)], 1) for q in cuantiles)
+
+def _distribucion_espera(desde, hasta, campo):
+    grupos = {}
+    for fila in _esperas_atencion(desde, hasta):
+        grupos.setdefault(fila[campo], []).append(fila[2])
+    return [DistribucionEspera(clave, len(valores), *_percentiles(valores))
+            for clave, valores in sorted(grupos.items(), key=lambda g: (g[0] is None, g[0]))]
+
+def distribucion_espera_prioridad(desde, hasta):
+    """Tiempo puerta-médico en minutos por prioridad (el grupo de cada DistribucionEspera)."""
+    return _distribucion_espera(desde, hasta, 0)
+
+def distribucion_espera_hora(desde, hasta):
+    """Tiempo puerta-médico en minutos por hora de ingreso (el grupo de cada DistribucionEspera)."""
+    return _distribucion_espera(desde, hasta, 1)
+
+# --- Ubicaciones y ocupación ---
+
+def _minuto(momento):
+    """Minuto (época) de una fecha local, igual que strftime('%s') / 60 en los triggers de ocupaciones."""
+    if isinstance(momento, str):
+        momento = datetime.fromisoformat(momento)
+    return calendar.timegm(momento.timetuple()) // 60
+
+def agregar_ubicacion(datos):
     with get_db_connection() as conn:
         c = conn.cursor()
-        c.execute('UPDATE consultas SET estado=? WHERE id=?', (nuevo_estado, consulta_id))
+        c.execute('INSERT INTO ubicaciones (nombre, tipo, sector) VALUES (?, ?, ?)', 
+                  (datos['nombre'], datos['tipo'], datos.get('sector')))
+        ubicacion_id = c.lastrowid
         conn.commit()
+    _auditar([('ubicaciones', ubicacion_id, 'alta', None, dict(datos))])
+    return ubicacion_id
+
+def actualizar_ubicacion(ubicacion_id, datos):
+    """Cambia nombre, tipo, sector o `activa` (una ubicación dada de baja conserva su historial)."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        antes = _previas(c, 'ubicaciones', [ubicacion_id])
+        c.execute('UPDATE ubicaciones SET nombre=?, tipo=?, sector=?, activa=? WHERE id=?', 
+                  (datos['nombre'], datos['tipo'], datos.get('sector'), int(datos.get('activa', 1)), ubicacion_id))
+        conn.commit()
+    _auditar([('ubicaciones', ubicacion_id, 'modificacion', antes.get(ubicacion_id), dict(datos))])
+
+@_en_cache(('ubicaciones', 'ocupaciones', 'consultas', 'pacientes'))
+def ubicaciones_estado(tipo=None):
+    """Ubicaciones activas con su ocupación actual, sin recorrer el historial."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT u.id, u.nombre, u.tipo, u.sector, o.id, o.consulta_id, p.nombre || " " || p.apellido, c.prioridad, o.desde 
+                     FROM ubicaciones u 
+                     LEFT JOIN ocupaciones o ON o.id = u.ocupacion_id 
+                     LEFT JOIN consultas c ON c.id = o.consulta_id 
+                     LEFT JOIN pacientes p ON p.id = c.paciente_id 
+                     WHERE u.activa = 1 AND (? IS NULL OR u.tipo = ?) ORDER BY u.tipo, u.nombre''', (tipo, tipo))
+        return _filas(c, Ubicacion)
+
+@_en_cache(('ubicaciones',))
+def ubicaciones_libres(tipo=None):
+    """Ubicaciones libres ahora (índice parcial sobre las libres)."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT id, nombre, tipo, sector, NULL, NULL, NULL, NULL, NULL FROM ubicaciones 
+                     WHERE ocupacion_id IS NULL AND activa = 1 AND (? IS NULL OR tipo = ?) ORDER BY tipo, nombre''', (tipo, tipo))
+        return _filas(c, Ubicacion)
+
+@_en_cache(('ocupacion_por_tipo',))
+def contadores_ocupacion():
+    """Total y ocupadas por tipo de las ubicaciones activas, de los contadores que mantienen los triggers."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT tipo, total, ocupadas FROM ocupacion_por_tipo WHERE total > 0 ORDER BY tipo')
+        return _filas(c, ContadorOcupacion)
+
+def ocupar_ubicacion(ubicacion_id, consulta_id, desde=None):
+    """
+    Ubica la consulta (si ya estaba en otro lugar, se la traslada). Devuelve el id
+    de la ocupación, o None si la ubicación ya está ocupada; ValueError si está dada de baja.
+    """
+    desde = str(desde or _ahora())
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('UPDATE ocupaciones SET hasta = ? WHERE consulta_id = ? AND hasta IS NULL', (desde, consulta_id))
+        # Después de la primera escritura: nadie puede darla de baja entre la comprobación y el alta
+        c.execute('SELECT activa FROM ubicaciones WHERE id = ?', (ubicacion_id,))
+        fila = c.fetchone()
+        if fila is None or not fila[0]:
+            conn.rollback()
+            raise ValueError("La ubicación está dada de baja")
+        try:
+            c.execute('INSERT INTO ocupaciones (ubicacion_id, consulta_id, desde) VALUES (?, ?, ?)', 
+                      (ubicacion_id, consulta_id, desde))
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return None
+        ocupacion_id = c.lastrowid
+        conn.commit()
+    _auditar([('ocupaciones', ocupacion_id, 'alta', None, 
+               {'ubicacion_id': ubicacion_id, 'consulta_id': consulta_id, 'desde': desde})])
+    return ocupacion_id
+
+def liberar_ubicacion(ubicacion_id, hasta=None):
+    """Cierra la ocupación abierta de la ubicación; devuelve False si ya estaba libre."""
+    hasta = str(hasta or _ahora())
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT ocupacion_id FROM ubicaciones WHERE id = ?', (ubicacion_id,))
+        fila = c.fetchone()
+        if fila is None or fila[0] is None:
+            return False
+        c.execute('UPDATE ocupaciones SET hasta = ? WHERE id = ?', (hasta, fila[0]))
+        conn.commit()
+    _auditar([('ocupaciones', fila[0], 'modificacion', {'hasta': None}, {'hasta': hasta})])
+    return True
+
+def ocupadas_en(momento, tipo=None):
+    """Ubicaciones ocupadas en `momento`; busca en el R*Tree de intervalos, no en todo el historial."""
+    minuto = _minuto(momento)
+    momento = str(momento)
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT u.id, u.nombre, u.tipo, u.sector, o.id, o.consulta_id, p.nombre || " " || p.apellido, 
+                            c.prioridad, o.desde, o.hasta 
+                     FROM ocupaciones_rango r 
+                     JOIN ocupaciones o ON o.id = r.id 
+                     JOIN ubicaciones u ON u.id = o.ubicacion_id 
+                     LEFT JOIN consultas c ON c.id = o.consulta_id 
+                     LEFT JOIN pacientes p ON p.id = c.paciente_id 
+                     WHERE r.desde_min <= ? AND r.hasta_min >= ? 
+                       AND o.desde <= ? AND (o.hasta IS NULL OR o.hasta > ?) AND (? IS NULL OR u.tipo = ?) 
+                     ORDER BY u.tipo, u.nombre''', (minuto, minuto, momento, momento, tipo, tipo))
+        return _filas(c, Ocupacion)
+
+# Sin caché, como las demás lecturas de una ventana que se corre con la hora (ocupadas_en, conteo_sintomas)
+def ocupacion_en_el_tiempo(desde, hasta, paso=timedelta(hours=1)):
+    """Ubicaciones ocupadas por tipo cada `paso` en [desde, hasta): [(momento, {tipo: ocupadas})]."""
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT u.tipo, o.desde, o.hasta FROM ocupaciones_rango r 
+                     JOIN ocupaciones o ON o.id = r.id JOIN ubicaciones u ON u.id = o.ubicacion_id 
+                     WHERE r.desde_min <= ? AND r.hasta_min >= ?''', (_minuto(hasta), _minuto(desde)))
+        intervalos = c.fetchall()
+    # Por tipo, inicios y finales ordenados: ocupadas en m = inicios <= m menos finales <= m
+    inicios, finales = {}, {}
+    for tipo, inicio, fin in intervalos:
+        inicios.setdefault(tipo, []).append(inicio)
+        if fin is not None:
+            finales.setdefault(tipo, []).append(fin)
+    for lista in (*inicios.values(), *finales.values()):
+        lista.sort()
+    serie = []
+    momento = desde
+    while momento < hasta:
+        texto = momento.isoformat(sep=' ')
+        serie.append((momento, {tipo: bisect_right(inicios[tipo], texto) - bisect_right(finales.get(tipo, []), texto)
+                                for tipo in inicios}))
+        momento += paso
+    return serie
+
+# --- Síntomas codificados (ver triage.py y sintomas.py) ---
+
+def conteo_sintomas(desde, hasta):
+    """
+    Consultas de [desde, hasta) con cada síntoma del catálogo, de la más frecuente a
+    la menos. Cada cantidad es un rango de la clave primaria (codigo, fecha): no se
+    lee ningún motivo.
+    """
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT s.codigo, s.descripcion, s.prioridad, 
+                            (SELECT COUNT(*) FROM consulta_sintomas cs 
+                             WHERE cs.codigo = s.codigo AND cs.fecha >= ? AND cs.fecha < ?) AS cantidad 
+                     FROM sintomas s ORDER BY cantidad DESC, s.codigo''', (str(desde), str(hasta)))
+        return _filas(c, ConteoSintoma)
+
+# Largo del prefijo de la fecha que define cada período de una tendencia
+_PERIODOS_TENDENCIA = {'hora': 13, 'dia': 10, 'mes': 7}
+
+def tendencia_sintoma(codigo, desde, hasta, periodo='dia'):
+    """Consultas con el síntoma `codigo` por período ('hora', 'dia' o 'mes') en [desde, hasta): [(período, cantidad)]."""
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        c.execute(f'''SELECT substr(fecha, 1, {_PERIODOS_TENDENCIA[periodo]}) AS periodo, COUNT(*) FROM consulta_sintomas 
+                      WHERE codigo = ? AND fecha >= ? AND fecha < ? GROUP BY periodo ORDER BY periodo''',
+                  (codigo, str(desde), str(hasta)))
+        return c.fetchall()
+
+def sintomas_consulta(consulta_id):
+    """Códigos de síntomas guardados para una consulta."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT codigo FROM consulta_sintomas WHERE consulta_id = ?', (consulta_id,))
+        return [fila[0] for fila in c.fetchall()]
+
+def codificacion_pendiente():
+    """(desde_id, hasta_id) de las consultas que faltan codificar con el catálogo actual, o None si no falta ninguna."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT desde_id, hasta_id FROM codificacion_sintomas WHERE desde_id < hasta_id')
+        return c.fetchone()
+
+def consultas_a_codificar(desde_id, hasta_id, limite):
+    """[(id, motivo)] de las primeras `limite` consultas con id en (desde_id, hasta_id]."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT id, motivo FROM consultas WHERE id > ? AND id <= ? ORDER BY id LIMIT ?', (desde_id, hasta_id, limite))
+        return c.fetchall()
+
+def guardar_codificacion(tandas, progreso=None):
+    """
+    Por cada tanda (desde_id, hasta_id, [(id, motivo, códigos)]) (ver triage.codificar_lote)
+    reemplaza los síntomas de las consultas con id en (desde_id, hasta_id] y marca
+    el tramo como hecho, en una transacción por tanda. Si un motivo cambió desde
+    que se leyó se vuelve a codificar acá, así una edición simultánea no queda
+    pisada. `progreso(hasta_id)` se llama después de cada tanda; devuelve cuántos
+    síntomas se guardaron.
+
+    Una sola conexión para todas las tandas: al cerrarse la última conexión a la
+    base SQLite hace un checkpoint del WAL completo, que por tanda costaba más que
+    la tanda misma.
+    """
+    guardados = 0
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        for desde_id, hasta_id, codificadas in tandas:
+            codigos = {consulta_id: (motivo, lista) for consulta_id, motivo, lista in codificadas}
+            c.execute('BEGIN IMMEDIATE')
+            c.execute('DELETE FROM consulta_sintomas WHERE consulta_id > ? AND consulta_id <= ?', (desde_id, hasta_id))
+            c.execute('''SELECT id, motivo, fecha_consulta FROM consultas 
+                         WHERE id > ? AND id <= ? AND fecha_consulta IS NOT NULL''', (desde_id, hasta_id))
+            filas = []
+            for consulta_id, motivo, fecha in c.fetchall():
+                leido, lista = codigos.get(consulta_id, (None, None))
+                if lista is None or leido != motivo:
+                    lista = triage.codificar(motivo)
+                filas.extend((codigo, fecha, consulta_id) for codigo in lista)
+            c.executemany('INSERT OR IGNORE INTO consulta_sintomas (codigo, fecha, consulta_id) VALUES (?, ?, ?)', filas)
+            c.execute('UPDATE codificacion_sintomas SET desde_id = MAX(desde_id, ?)', (hasta_id,))
+            conn.commit()
+            guardados += len(filas)
+            if progreso:
+                progreso(hasta_id)
+    return guardados
+
+# --- Escrituras diferidas (cola local de cada puesto, ver cola_escrituras.py) ---
+
+_OPERACIONES_DIFERIDAS = {
+    'agregar_paciente': _insertar_paciente,
+    'agregar_consulta': _insertar_consulta,
+}
+
+def aplicar_escrituras(escrituras):
+    """
+    Aplica en una sola transacción una tanda de escrituras [(clave, operacion, datos, usuario)]
+    en orden. Las claves ya aplicadas se saltean, así que reintentar una tanda no
+    duplica nada. Devuelve {clave: mensaje} de las que se rechazaron por sus datos
+    (faltantes, de otro tipo o que la base no acepta); si la base no está disponible
+    se propaga el sqlite3.Error y no se aplica ninguna.
+    """
+    rechazadas = {}
+    auditadas = []
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        for clave, operacion, datos, usuario in escrituras:
+            c.execute('SELECT 1 FROM escrituras_aplicadas WHERE clave = ?', (clave,))
+            if c.fetchone():
+                continue
+            c.execute('SAVEPOINT escritura')
+            try:
+                datos = dict(datos)
+                if 'paciente_clave' in datos:
+                    # Consulta de un paciente que llegó por la misma cola
+                    c.execute('SELECT registro_id FROM escrituras_aplicadas WHERE clave = ?', (datos.pop('paciente_clave'),))
+                    fila = c.fetchone()
+                    if fila is None:
+                        raise ValueError('No se pudo guardar el paciente de esta consulta')
+                    datos['paciente_id'] = fila[0]
+                registro_id = _OPERACIONES_DIFERIDAS[operacion](c, datos)
+            except (sqlite3.IntegrityError, sqlite3.InterfaceError, KeyError, TypeError, ValueError) as e:
+                c.execute('ROLLBACK TO escritura')
+                c.execute('RELEASE escritura')
+                rechazadas[clave] = str(e)
+                continue
+            c.execute('RELEASE escritura')
+            c.execute('INSERT INTO escrituras_aplicadas (clave, operacion, registro_id, fecha) VALUES (?, ?, ?, ?)', 
+                      (clave, operacion, registro_id, _ahora()))
+            auditadas.append((usuario, ('pacientes' if operacion == 'agregar_paciente' else 'consultas', registro_id, 'alta', None, datos)))
+        conn.commit()
+    for usuario, cambio in auditadas:
+        _auditar([cambio], usuario)
+    return rechazadas
 
 # --- Personal ---
 
@@ -189,121 +1512,339 @@ def agregar_personal(datos):
         c.execute('''INSERT INTO personal (nombre, apellido, especialidad, matricula, turno, estado) 
                      VALUES (?, ?, ?, ?, ?, ?)''', (
             datos['nombre'], datos['apellido'], datos['especialidad'], datos['matricula'], datos['turno'], datos['estado']))
+        personal_id = c.lastrowid
         conn.commit()
+    _auditar([('personal', personal_id, 'alta', None, dict(datos))])
 
+@_en_cache(('personal',))
 def obtener_personal():
-    with get_db_connection() as conn:
+    with _conexion_lectura() as conn:
         c = conn.cursor()
-        c.execute('SELECT * FROM personal')
-        return c.fetchall()
+        c.execute('SELECT id, nombre, apellido, especialidad, matricula, turno, estado FROM personal')
+        return _filas(c, Personal)
 
 def actualizar_personal(personal_id, datos):
     with get_db_connection() as conn:
         c = conn.cursor()
+        antes = _previas(c, 'personal', [personal_id])
         c.execute('''UPDATE personal SET nombre=?, apellido=?, especialidad=?, matricula=?, turno=?, estado=? 
                      WHERE id=?''', (
             datos['nombre'], datos['apellido'], datos['especialidad'], datos['matricula'], datos['turno'], datos['estado'], personal_id))
         conn.commit()
+    _auditar([('personal', personal_id, 'modificacion', antes.get(personal_id), dict(datos))])
 
 def eliminar_personal(personal_id):
     with get_db_connection() as conn:
         c = conn.cursor()
+        antes = _previas(c, 'personal', [personal_id])
         c.execute('DELETE FROM personal WHERE id=?', (personal_id,))
         conn.commit()
+    _auditar([('personal', personal_id, 'baja', fila, None) for fila in antes.values()])
 
 def personal():
     return obtener_personal()
 
+@_en_cache(('personal',))
 def personal_filtrado(valor):
-    with get_db_connection() as conn:
+    with _conexion_lectura() as conn:
         c = conn.cursor()
-        c.execute('''SELECT * FROM personal WHERE nombre LIKE ? OR apellido LIKE ? OR matricula LIKE ?''', 
+        c.execute('''SELECT id, nombre, apellido, especialidad, matricula, turno, estado FROM personal WHERE nombre LIKE ? OR apellido LIKE ? OR matricula LIKE ?''', 
                   (f'%{valor}%', f'%{valor}%', f'%{valor}%'))
-        return c.fetchall()
+        return _filas(c, Personal)
+
+# --- Turnos ---
+
+# Ningún turno dura más que esto; acota la búsqueda por rango de "quién está de guardia"
+DURACION_MAXIMA_TURNO_HORAS = 12
+
+def guardar_turnos(turnos, desde, hasta):
+    """
+    Reemplaza los turnos que empiezan en [desde, hasta) por `turnos` (personal_id,
+    inicio, fin, tipo). Cada turno borrado y cada turno nuevo queda en la auditoría.
+    """
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        ids = []
+        if _auditoria is not None:
+            c.execute('SELECT id FROM turnos WHERE inicio >= ? AND inicio < ?', (str(desde), str(hasta)))
+            ids = [fila[0] for fila in c.fetchall()]
+        antes = _previas(c, 'turnos', ids)
+        c.execute('DELETE FROM turnos WHERE inicio >= ? AND inicio < ?', (str(desde), str(hasta)))
+        nuevos = []
+        for personal_id, inicio, fin, tipo in turnos:
+            datos = {'personal_id': personal_id, 'inicio': str(inicio), 'fin': str(fin), 'tipo': tipo}
+            c.execute('INSERT INTO turnos (personal_id, inicio, fin, tipo) VALUES (:personal_id, :inicio, :fin, :tipo)', datos)
+            nuevos.append((c.lastrowid, datos))
+        conn.commit()
+    _auditar([('turnos', turno_id, 'baja', fila, None) for turno_id, fila in antes.items()]
+             + [('turnos', turno_id, 'alta', None, datos) for turno_id, datos in nuevos])
+
+@_en_cache(('turnos', 'personal'))
+def turnos_rango(desde, hasta):
+    """Turnos que empiezan en [desde, hasta) con el nombre y especialidad del personal."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT t.id, p.nombre || " " || p.apellido, p.especialidad, t.tipo, t.inicio, t.fin 
+                     FROM turnos t JOIN personal p ON t.personal_id = p.id 
+                     WHERE t.inicio >= ? AND t.inicio < ? ORDER BY t.inicio, p.especialidad, p.apellido''', (str(desde), str(hasta)))
+        return _filas(c, Turno)
+
+def turnos_personal(desde, hasta):
+    """Turnos que se superponen con [desde, hasta), por personal_id (para el planificador)."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT personal_id, inicio, fin, tipo FROM turnos 
+                     WHERE inicio > ? AND inicio < ? AND fin > ? ORDER BY personal_id, inicio''', (
+            str(desde - timedelta(hours=DURACION_MAXIMA_TURNO_HORAS)), str(hasta), str(desde)))
+        return _filas(c, TurnoPersonal)
+
+def personal_de_guardia(momento=None):
+    """Personal con un turno en curso en `momento` (por defecto, ahora)."""
+    momento = momento or datetime.now()
+    desde = momento - timedelta(hours=DURACION_MAXIMA_TURNO_HORAS)
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT p.id, p.nombre, p.apellido, p.especialidad, t.tipo, t.inicio, t.fin 
+                     FROM turnos t JOIN personal p ON t.personal_id = p.id 
+                     WHERE t.inicio > ? AND t.inicio <= ? AND t.fin > ? ORDER BY p.especialidad, p.apellido''', (
+            str(desde), str(momento), str(momento)))
+        return _filas(c, PersonalDeGuardia)
+
+def carga_medicos_guardia(momento=None):
+    """Médicos de guardia en `momento` con su carga abierta: (nombre, especialidad, abiertas, carga)."""
+    momento = momento or datetime.now()
+    desde = momento - timedelta(hours=DURACION_MAXIMA_TURNO_HORAS)
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT p.nombre || " " || p.apellido AS medico, p.especialidad, 
+                            COALESCE(cm.abiertas, 0), COALESCE(cm.carga, 0) 
+                     FROM turnos t JOIN personal p ON t.personal_id = p.id 
+                     LEFT JOIN carga_medicos cm ON cm.medico = p.nombre || " " || p.apellido 
+                     WHERE t.inicio > ? AND t.inicio <= ? AND t.fin > ?''', (str(desde), str(momento), str(momento)))
+        return _filas(c, CargaMedico)
+
+@_en_cache(('personal', 'carga_medicos'))
+def carga_medicos_activos():
+    """Como carga_medicos_guardia pero sobre todo el personal activo (cuando no hay roster cargado)."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT p.nombre || " " || p.apellido AS medico, p.especialidad, 
+                            COALESCE(cm.abiertas, 0), COALESCE(cm.carga, 0) 
+                     FROM personal p LEFT JOIN carga_medicos cm ON cm.medico = p.nombre || " " || p.apellido 
+                     WHERE p.estado = 'Activo' ''')
+        return _filas(c, CargaMedico)
+
+def recalcular_carga_medicos():
+    """Reconstruye los contadores de carga desde cero (solo para reparaciones)."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        _recalcular_carga_medicos(c)
+        conn.commit()
 
 # --- Recursos ---
 
-def agregar_recurso(datos):
+def agregar_recurso(datos, usuario=None):
+    """Da de alta un recurso; la cantidad inicial se registra como reposición."""
+    usuario = usuario or _usuario
     with get_db_connection() as conn:
         c = conn.cursor()
-        c.execute('''INSERT INTO recursos (tipo, nombre, cantidad, estado) VALUES (?, ?, ?, ?)''', (
-            datos['tipo'], datos['nombre'], datos['cantidad'], datos['estado']))
+        c.execute('''INSERT INTO recursos (tipo, nombre, cantidad, estado, stock_minimo) VALUES (?, ?, 0, ?, ?)''', (
+            datos['tipo'], datos['nombre'], datos['estado'], datos.get('stock_minimo', 5)))
+        recurso_id = c.lastrowid
+        cantidad = int(datos['cantidad'] or 0)
+        if cantidad:
+            c.execute('''INSERT INTO movimientos_recursos (recurso_id, tipo, cantidad, usuario, fecha) 
+                         VALUES (?, 'reposicion', ?, ?, ?)''', (recurso_id, cantidad, usuario, _ahora()))
         conn.commit()
+    _auditar([('recursos', recurso_id, 'alta', None, dict(datos))], usuario)
 
+@_en_cache(('recursos',))
 def obtener_recursos():
-    with get_db_connection() as conn:
+    with _conexion_lectura() as conn:
         c = conn.cursor()
-        c.execute('SELECT * FROM recursos')
-        return c.fetchall()
+        c.execute('SELECT id, tipo, nombre, cantidad, estado, stock_minimo FROM recursos')
+        return _filas(c, Recurso)
 
-def actualizar_recurso(recurso_id, datos):
+def actualizar_recurso(recurso_id, datos, usuario=None):
+    """Actualiza los datos del recurso; un cambio de cantidad queda registrado como ajuste."""
+    usuario = usuario or _usuario
     with get_db_connection() as conn:
         c = conn.cursor()
-        c.execute('''UPDATE recursos SET tipo=?, nombre=?, cantidad=?, estado=? WHERE id=?''', (
-            datos['tipo'], datos['nombre'], datos['cantidad'], datos['estado'], recurso_id))
+        antes = _previas(c, 'recursos', [recurso_id])
+        c.execute('''UPDATE recursos SET tipo=?, nombre=?, estado=?, stock_minimo=? WHERE id=?''', (
+            datos['tipo'], datos['nombre'], datos['estado'], datos.get('stock_minimo', 5), recurso_id))
+        _registrar_ajuste(c, recurso_id, int(datos['cantidad']), usuario)
         conn.commit()
+    _auditar([('recursos', recurso_id, 'modificacion', antes.get(recurso_id), dict(datos))], usuario)
 
 def eliminar_recurso(recurso_id):
     with get_db_connection() as conn:
         c = conn.cursor()
+        antes = _previas(c, 'recursos', [recurso_id])
+        c.execute('DELETE FROM movimientos_recursos WHERE recurso_id=?', (recurso_id,))
         c.execute('DELETE FROM recursos WHERE id=?', (recurso_id,))
         conn.commit()
+    _auditar([('recursos', recurso_id, 'baja', fila, None) for fila in antes.values()])
 
 def recursos():
     return obtener_recursos()
 
+@_en_cache(('recursos',))
 def recursos_filtrado(valor):
-    with get_db_connection() as conn:
+    with _conexion_lectura() as conn:
         c = conn.cursor()
-        c.execute('''SELECT * FROM recursos WHERE tipo LIKE ? OR nombre LIKE ?''', (f'%{valor}%', f'%{valor}%'))
-        return c.fetchall()
+        c.execute('''SELECT id, tipo, nombre, cantidad, estado, stock_minimo FROM recursos WHERE tipo LIKE ? OR nombre LIKE ?''', (f'%{valor}%', f'%{valor}%'))
+        return _filas(c, Recurso)
 
+@_en_cache(('recursos',))
 def recursos_criticos_lista():
+    """Recursos cuya cantidad está en o por debajo de su stock mínimo (usa el índice parcial)."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT id, tipo, nombre, cantidad, estado, stock_minimo FROM recursos WHERE cantidad <= stock_minimo')
+        return _filas(c, Recurso)
+
+# --- Movimientos de stock ---
+
+def _registrar_ajuste(c, recurso_id, nueva_cantidad, usuario):
+    c.execute('''INSERT INTO movimientos_recursos (recurso_id, tipo, cantidad, usuario, fecha) 
+                 SELECT id, 'ajuste', ? - COALESCE(cantidad, 0), ?, ? FROM recursos 
+                 WHERE id = ? AND COALESCE(cantidad, 0) <> ?''', (nueva_cantidad, usuario, _ahora(), recurso_id, nueva_cantidad))
+
+def consumir_recurso(recurso_id, cantidad, usuario=None):
+    """Descuenta stock de forma atómica. Devuelve False si no hay stock suficiente.
+
+    La verificación y el descuento ocurren en una única sentencia, por lo que dos
+    consumos simultáneos del mismo recurso nunca dejan la cantidad en negativo.
+    """
+    if cantidad <= 0:
+        raise ValueError("La cantidad a consumir debe ser positiva")
+    usuario = usuario or _usuario
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''INSERT INTO movimientos_recursos (recurso_id, tipo, cantidad, usuario, fecha) 
+                     SELECT id, 'consumo', ?, ?, ? FROM recursos WHERE id = ? AND cantidad >= ?''', (
+            -cantidad, usuario, _ahora(), recurso_id, cantidad))
+        conn.commit()
+        return c.rowcount == 1
+
+def reponer_recurso(recurso_id, cantidad, usuario=None):
+    """Suma stock a un recurso registrando la reposición."""
+    if cantidad <= 0:
+        raise ValueError("La cantidad a reponer debe ser positiva")
+    usuario = usuario or _usuario
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''INSERT INTO movimientos_recursos (recurso_id, tipo, cantidad, usuario, fecha) 
+                     SELECT id, 'reposicion', ?, ?, ? FROM recursos WHERE id = ?''', (
+            cantidad, usuario, _ahora(), recurso_id))
+        conn.commit()
+        return c.rowcount == 1
+
+def ajustar_recurso(recurso_id, nueva_cantidad, usuario=None):
+    """Fija la cantidad de un recurso (p. ej. tras un recuento) registrando la diferencia."""
+    usuario = usuario or _usuario
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        _registrar_ajuste(c, recurso_id, nueva_cantidad, usuario)
+        conn.commit()
+
+@_en_cache(('movimientos_recursos',))
+def movimientos_recurso(recurso_id, limite=50):
+    """Últimos movimientos de un recurso, del más reciente al más antiguo."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT id, tipo, cantidad, usuario, fecha FROM movimientos_recursos 
+                     WHERE recurso_id = ? ORDER BY fecha DESC LIMIT ?''', (recurso_id, limite))
+        return _filas(c, MovimientoRecurso)
+
+def consumos_desde(ultimo_id, desde):
+    """Consumos con id mayor a `ultimo_id` y fecha desde `desde`: (id, recurso_id, unidades, fecha)."""
     with get_db_connection() as conn:
         c = conn.cursor()
-        c.execute('SELECT * FROM recursos WHERE cantidad <= 5')
+        c.execute('''SELECT id, recurso_id, -cantidad, fecha FROM movimientos_recursos 
+                     WHERE id > ? AND tipo = 'consumo' AND fecha >= ? ORDER BY id''', (ultimo_id, desde))
         return c.fetchall()
 
+def tasa_consumo_recurso(recurso_id, horas=24):
+    """Unidades consumidas por hora de un recurso en las últimas `horas`."""
+    desde = (datetime.now() - timedelta(hours=horas)).isoformat(sep=' ')
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT COALESCE(-SUM(cantidad), 0) FROM movimientos_recursos 
+                     WHERE recurso_id = ? AND tipo = 'consumo' AND fecha >= ?''', (recurso_id, desde))
+        return c.fetchone()[0] / horas
+
+def tasas_consumo(horas=24):
+    """Devuelve (recurso_id, unidades por hora) de todos los recursos con consumo en las últimas `horas`."""
+    desde = (datetime.now() - timedelta(hours=horas)).isoformat(sep=' ')
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT recurso_id, -SUM(cantidad) FROM movimientos_recursos 
+                     WHERE tipo = 'consumo' AND fecha >= ? GROUP BY recurso_id''', (desde,))
+        return [(recurso_id, total / horas) for recurso_id, total in c.fetchall()]
+
 # --- Estadísticas y Usuarios ---
 
+@_en_cache(('consultas',))
 def consultas_en_espera():
     with get_db_connection() as conn:
         c = conn.cursor()
         c.execute('SELECT COUNT(*) FROM consultas WHERE estado = "En espera"')
         return c.fetchone()[0]
 
-def consultas_hoy():
-    with get_db_connection() as conn:
+def rango_dia(dia=None):
+    """[00:00, 00:00 del día siguiente) de `dia` (hoy si no se indica), en hora local como las fechas guardadas."""
+    inicio = datetime.combine(dia or datetime.now().date(), datetime.min.time())
+    return inicio, inicio + timedelta(days=1)
+
+@_en_cache(('consultas',))
+def contar_consultas(desde, hasta):
+    """Consultas ingresadas en [desde, hasta), contadas sobre el índice de la fecha."""
+    with _conexion_lectura() as conn:
         c = conn.cursor()
-        c.execute('SELECT COUNT(*) FROM consultas WHERE date(fecha_consulta) = date("now")')
+        c.execute('SELECT COUNT(*) FROM consultas WHERE fecha_consulta >= ? AND fecha_consulta < ?', (str(desde), str(hasta)))
         return c.fetchone()[0]
 
+def consultas_hoy():
+    return contar_consultas(*rango_dia())
+
+@_en_cache(('personal',))
 def personal_activo():
     with get_db_connection() as conn:
         c = conn.cursor()
         c.execute('SELECT COUNT(*) FROM personal WHERE estado = "Activo"')
         return c.fetchone()[0]
 
+@_en_cache(('recursos',))
 def recursos_criticos():
     with get_db_connection() as conn:
         c = conn.cursor()
-        c.execute('SELECT COUNT(*) FROM recursos WHERE cantidad <= 5')
+        c.execute('SELECT COUNT(*) FROM recursos WHERE cantidad <= stock_minimo')
         return c.fetchone()[0]
 
-def obtener_estadisticas_prioridad():
-    """Devuelve estadísticas de consultas por prioridad para el día actual."""
-    with get_db_connection() as conn:
+def obtener_estadisticas_prioridad(desde=None, hasta=None):
+    """Consultas por prioridad ingresadas en [desde, hasta) (por defecto, hoy)."""
+    if desde is None:
+        desde, hasta = rango_dia()
+    # El día se resuelve antes de la caché: pasada la medianoche no se devuelve el de ayer
+    return _estadisticas_prioridad(desde, hasta)
+
+@_en_cache(('consultas',))
+def _estadisticas_prioridad(desde, hasta):
+    with _conexion_lectura() as conn:
         c = conn.cursor()
         c.execute('''SELECT prioridad, COUNT(*) as cantidad FROM consultas 
-                     WHERE date(fecha_consulta) = date('now') GROUP BY prioridad''')
-        return c.fetchall()
+                     WHERE fecha_consulta >= ? AND fecha_consulta < ? GROUP BY prioridad''', (str(desde), str(hasta)))
+        return _filas(c, ConteoPrioridad)
 
+@_en_cache(('recursos',))
 def obtener_estadisticas_recursos_estado():
     """Devuelve estadísticas de recursos por estado."""
-    with get_db_connection() as conn:
+    with _conexion_lectura() as conn:
         c = conn.cursor()
         c.execute('''SELECT estado, COUNT(*) as cantidad FROM recursos GROUP BY estado''')
-        return c.fetchall()
+        return _filas(c, ConteoEstado)
 
 def registrar_usuario(usuario, password):
     with get_db_connection() as conn:
@@ -324,4 +1865,188 @@ def verificar_usuario(usuario, password):
         if not row:
             return False
         password_hash = hashlib.sha256(password.encode()).hexdigest()
-        return row[0] == password_hash
\ No newline at end of file
+        return row[0] == password_hash
+
+# --- Mantenimiento por lotes (ver guardia.py) ---
+
+_CAMPOS_IMPORTACION = {
+    'pacientes': ('nombre', 'apellido', 'dni', 'edad', 'genero', 'telefono', 'email', 'direccion', 'obra_social', 'numero_afiliado'),
+    'consultas': ('paciente_id', 'fecha_consulta', 'motivo', 'diagnostico', 'tratamiento', 'medico', 'estado', 'prioridad'),
+}
+# Tablas que se pueden exportar y su columna de fecha (None: sin filtro por fecha)
+TABLAS_EXPORTACION = {'pacientes': 'fecha_registro', 'consultas': 'fecha_consulta', 'personal': None, 'turnos': 'inicio',
+                      'recursos': None, 'movimientos_recursos': 'fecha', 'auditoria': 'fecha', 'consulta_sintomas': 'fecha'}
+
+def importar(tabla, filas, tamano_lote=1000):
+    """
+    Da de alta pacientes o consultas a partir de dicts (p. ej. las filas de un CSV),
+    con una transacción cada `tamano_lote`. Devuelve (importadas, rechazadas), con
+    rechazadas = [(número de fila, motivo)]: una fila inválida no frena a las demás.
+    """
+    campos = _CAMPOS_IMPORTACION[tabla]
+    insertar = _insertar_paciente if tabla == 'pacientes' else _insertar_consulta
+    importadas, rechazadas, cambios = 0, [], []
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        for numero, fila in enumerate(filas, 1):
+            datos = {campo: fila.get(campo) or None for campo in campos}
+            try:
+                registro_id = insertar(c, datos)
+            except sqlite3.IntegrityError as e:
+                rechazadas.append((numero, str(e)))
+                continue
+            importadas += 1
+            cambios.append((tabla, registro_id, 'alta', None, datos))
+            if importadas % tamano_lote == 0:
+                conn.commit()
+                _auditar(cambios)
+                cambios = []
+        conn.commit()
+    _auditar(cambios)
+    return importadas, rechazadas
+
+def exportar(tabla, desde=None, hasta=None):
+    """
+    Nombres de columna y después las filas de `tabla` (las de [desde, hasta) si
+    tiene fecha), leídas de a una: sirve para tablas más grandes que la memoria.
+    """
+    columna = TABLAS_EXPORTACION[tabla]
+    condiciones, parametros = [], []
+    for operador, limite in (('>=', desde), ('<', hasta)):
+        if columna and limite:
+            condiciones.append(f'{columna} {operador} ?')
+            parametros.append(str(limite))
+    consulta = f'SELECT * FROM {tabla}'
+    if condiciones:
+        consulta += f' WHERE {" AND ".join(condiciones)} ORDER BY {columna}'
+    with _conexion_lectura() as conn:
+        c = conn.cursor()
+        c.execute(consulta, parametros)
+        yield [d[0] for d in c.description]
+        yield from c
+
+# Mismas columnas que en la base principal, sin claves foráneas: el archivo se consulta solo
+_TABLAS_ARCHIVO = (
+    '''CREATE TABLE IF NOT EXISTS archivo.pacientes (id INTEGER PRIMARY KEY, nombre TEXT, apellido TEXT, dni TEXT, 
+           edad INTEGER, genero TEXT, telefono TEXT, email TEXT, direccion TEXT, obra_social TEXT, numero_afiliado TEXT, 
+           fecha_registro DATETIME)''',
+    '''CREATE TABLE IF NOT EXISTS archivo.consultas (id INTEGER PRIMARY KEY, paciente_id INTEGER, fecha_consulta DATETIME, 
+           motivo TEXT, diagnostico TEXT, tratamiento TEXT, medico TEXT, estado TEXT, prioridad TEXT)''',
+    'CREATE INDEX IF NOT EXISTS archivo.idx_consultas_paciente_fecha ON consultas (paciente_id, fecha_consulta)',
+    '''CREATE TABLE IF NOT EXISTS archivo.consulta_eventos (id INTEGER PRIMARY KEY, consulta_id INTEGER, 
+           estado_anterior TEXT, estado_nuevo TEXT, prioridad TEXT, fecha DATETIME)''',
+    '''CREATE TABLE IF NOT EXISTS archivo.consulta_sintomas (codigo TEXT NOT NULL, fecha DATETIME NOT NULL, 
+           consulta_id INTEGER NOT NULL, PRIMARY KEY (codigo, fecha, consulta_id)) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS archivo.idx_consulta_sintomas_consulta ON consulta_sintomas (consulta_id)',
+)
+
+def archivar_consultas(antes, destino):
+    """
+    Pasa a la base `destino` las consultas cerradas (no 'En espera') anteriores a
+    `antes`, con sus eventos, sus síntomas y una copia de sus pacientes, y las borra
+    de la base principal. Devuelve cuántas consultas se archivaron.
+
+    Con WAL una transacción no es atómica entre bases adjuntas, así que se hace en
+    dos: primero se copia y se confirma, después se borra sólo lo que ya está en el
+    archivo. Si se corta en el medio, volver a ejecutarlo termina el trabajo.
+    """
+    condicion = "fecha_consulta < ? AND estado IS NOT 'En espera'"
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        c.execute('ATTACH DATABASE ? AS archivo', (destino,))
+        try:
+            for sql in _TABLAS_ARCHIVO:
+                c.execute(sql)
+            c.execute(f'''INSERT OR REPLACE INTO archivo.pacientes SELECT {_COLUMNAS_PACIENTE}, fecha_registro FROM pacientes 
+                          WHERE id IN (SELECT paciente_id FROM consultas WHERE {condicion})''', (str(antes),))
+            c.execute(f'''INSERT OR IGNORE INTO archivo.consultas 
+                          SELECT id, paciente_id, fecha_consulta, motivo, diagnostico, tratamiento, medico, estado, prioridad 
+                          FROM consultas WHERE {condicion}''', (str(antes),))
+            c.execute(f'''INSERT OR REPLACE INTO archivo.consulta_eventos 
+                          SELECT id, consulta_id, estado_anterior, estado_nuevo, prioridad, fecha FROM consulta_eventos 
+                          WHERE consulta_id IN (SELECT id FROM consultas WHERE {condicion})''', (str(antes),))
+            c.execute(f'''INSERT OR IGNORE INTO archivo.consulta_sintomas 
+                          SELECT codigo, fecha, consulta_id FROM consulta_sintomas 
+                          WHERE consulta_id IN (SELECT id FROM consultas WHERE {condicion})''', (str(antes),))
+            # Las que sintomas.py todavía no codificó con el catálogo actual se codifican acá:
+            # después de borrarlas de la base principal ya no las alcanzaría
+            c.execute('SELECT desde_id, hasta_id FROM codificacion_sintomas WHERE desde_id < hasta_id')
+            pendiente = c.fetchone()
+            if pendiente:
+                c.execute(f'SELECT id, fecha_consulta, motivo FROM consultas WHERE {condicion} AND id > ? AND id <= ?', 
+                          (str(antes), *pendiente))
+                filas = c.fetchall()
+                c.executemany('DELETE FROM archivo.consulta_sintomas WHERE consulta_id = ?', [(fila[0],) for fila in filas])
+                c.executemany('INSERT OR IGNORE INTO archivo.consulta_sintomas (codigo, fecha, consulta_id) VALUES (?, ?, ?)', 
+                              [(codigo, fecha, consulta_id) for consulta_id, fecha, motivo in filas 
+                               for codigo in triage.codificar(motivo)])
+            conn.commit()
+            archivadas = f'SELECT id FROM consultas WHERE {condicion} AND id IN (SELECT id FROM archivo.consultas)'
+            c.execute(f'DELETE FROM consulta_eventos WHERE consulta_id IN ({archivadas})', (str(antes),))
+            c.execute(f'DELETE FROM consultas WHERE id IN ({archivadas})', (str(antes),))
+            cantidad = c.rowcount
+            conn.commit()
+        finally:
+            conn.rollback()
+            c.execute('DETACH DATABASE archivo')
+    # Un solo registro: el detalle de cada consulta queda en el archivo
+    _auditar([('consultas', None, 'archivo', None, {'antes': str(antes), 'destino': str(destino), 'consultas': cantidad})])
+    return cantidad
+
+# Contadores que mantienen los triggers: (nombre, valores esperados según los datos, valores guardados)
+_CONTADORES = (
+    ('carga_medicos',
+     '''SELECT medico, COUNT(*), SUM({peso}) FROM consultas c 
+        WHERE estado = 'En espera' AND medico IS NOT NULL GROUP BY medico'''.format(peso=_PESO_PRIORIDAD_SQL.format('c')),
+     'SELECT medico, abiertas, carga FROM carga_medicos WHERE abiertas != 0 OR carga != 0'),
+    ('ocupacion_por_tipo',
+     'SELECT tipo, COUNT(*), COUNT(ocupacion_id) FROM ubicaciones WHERE activa = 1 GROUP BY tipo',
+     'SELECT tipo, total, ocupadas FROM ocupacion_por_tipo WHERE total != 0 OR ocupadas != 0'),
+    ('ubicaciones.ocupacion_id',
+     'SELECT ubicacion_id, id FROM ocupaciones WHERE hasta IS NULL',
+     'SELECT id, ocupacion_id FROM ubicaciones WHERE ocupacion_id IS NOT NULL'),
+    # Toda ocupación es de una consulta: abierta y sin consulta es una consulta borrada que no liberó su lugar
+    ('ocupaciones abiertas sin consulta',
+     'SELECT id FROM ocupaciones WHERE 0',
+     'SELECT id FROM ocupaciones WHERE hasta IS NULL AND consulta_id IS NULL'),
+    ('consulta_sintomas.fecha',
+     'SELECT s.codigo, c.fecha_consulta, c.id FROM consulta_sintomas s JOIN consultas c ON c.id = s.consulta_id',
+     'SELECT codigo, fecha, consulta_id FROM consulta_sintomas'),
+)
+
+def verificar_integridad(completa=True):
+    """
+    Problemas encontrados, como textos (lista vacía si está todo bien): integrity_check
+    (quick_check si completa=False), claves foráneas rotas y contadores mantenidos por
+    triggers que no coinciden con los datos.
+    """
+    problemas = []
+    with get_db_connection(solo_lectura=True) as conn:
+        c = conn.cursor()
+        c.execute('PRAGMA integrity_check' if completa else 'PRAGMA quick_check')
+        problemas += [f"integridad: {fila[0]}" for fila in c.fetchall() if fila[0] != 'ok']
+        c.execute('PRAGMA foreign_key_check')
+        problemas += [f"clave foránea: {tabla} fila {rowid} apunta a un registro inexistente de {padre}" 
+                      for tabla, rowid, padre, _ in c.fetchall()]
+        for nombre, esperados, guardados in _CONTADORES:
+            c.execute(f'SELECT COUNT(*) FROM (SELECT * FROM ({esperados}) EXCEPT SELECT * FROM ({guardados}))')
+            faltan = c.fetchone()[0]
+            c.execute(f'SELECT COUNT(*) FROM (SELECT * FROM ({guardados}) EXCEPT SELECT * FROM ({esperados}))')
+            sobran = c.fetchone()[0]
+            if faltan or sobran:
+                problemas.append(f"contador {nombre}: {max(faltan, sobran)} valores no coinciden con los datos")
+    return problemas
+
+def reparar_contadores():
+    """Vuelve a calcular los contadores que mantienen los triggers a partir de los datos."""
+    with get_db_connection() as conn:
+        c = conn.cursor()
+        _recalcular_carga_medicos(c)
+        c.execute('UPDATE ocupaciones SET hasta = ? WHERE hasta IS NULL AND consulta_id IS NULL', (_ahora(),))
+        c.execute('''UPDATE ubicaciones SET ocupacion_id = (SELECT o.id FROM ocupaciones o 
+                                                             WHERE o.ubicacion_id = ubicaciones.id AND o.hasta IS NULL)''')
+        _recalcular_ocupacion_por_tipo(c)
+        c.execute('''UPDATE consulta_sintomas SET fecha = c.fecha_consulta FROM consultas c 
+                     WHERE c.id = consulta_sintomas.consulta_id AND c.fecha_consulta IS NOT NULL 
+                           AND consulta_sintomas.fecha IS NOT c.fecha_consulta''')
+        conn.commit()
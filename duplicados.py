@@ -0,0 +1,94 @@
+"""
+Detección de pacientes duplicados.
+Los candidatos se buscan por las claves de agrupamiento de db.pacientes_claves
+(apellido fonético + inicial + año de nacimiento, y variantes del DNI), así que
+sólo se comparan pacientes que comparten alguna clave y nunca la tabla completa.
+"""
+from difflib import SequenceMatcher
+import db
+import fonetica
+
+UMBRAL_SIMILITUD = 0.75
+MAX_BLOQUE = 50  # claves compartidas por más pacientes no discriminan (p. ej. apellidos muy comunes)
+
+
+def _similitud_dni(a, b):
+    a, b = fonetica.solo_digitos(a), fonetica.solo_digitos(b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    # A un dígito de distancia (tipeo): comparten alguna variante con un dígito borrado
+    return 0.8 if fonetica.claves_dni(a) & fonetica.claves_dni(b) else 0.0
+
+
+def similitud(a, b):
+    """Puntaje de 0 a 1 entre dos pacientes (objetos con nombre, apellido, dni y edad)."""
+    nombre = SequenceMatcher(None, fonetica.normalizar(f"{a.nombre} {a.apellido}"),
+                             fonetica.normalizar(f"{b.nombre} {b.apellido}")).ratio()
+    dni = _similitud_dni(a.dni, b.dni)
+    try:
+        diferencia_edad = abs(int(a.edad) - int(b.edad))
+    except (TypeError, ValueError):
+        diferencia_edad = 99
+    edad = 1.0 if diferencia_edad == 0 else 0.7 if diferencia_edad == 1 else 0.0
+    return round(0.45 * nombre + 0.40 * dni + 0.15 * edad, 3)
+
+
+class _Datos:
+    def __init__(self, datos):
+        self.nombre = datos.get('nombre')
+        self.apellido = datos.get('apellido')
+        self.dni = datos.get('dni')
+        self.edad = datos.get('edad')
+
+
+def buscar_candidatos(datos, umbral=UMBRAL_SIMILITUD, excluir_id=None):
+    """Posibles duplicados de un paciente aún no guardado: [(puntaje, Paciente)] de mayor a menor."""
+    nuevo = _Datos(datos)
+    claves = fonetica.claves_busqueda(nuevo.nombre, nuevo.apellido, nuevo.dni, nuevo.edad)
+    candidatos = []
+    for paciente in db.pacientes_por_claves(claves):
+        if paciente.id == excluir_id:
+            continue
+        puntaje = similitud(nuevo, paciente)
+        if puntaje >= umbral:
+            candidatos.append((puntaje, paciente))
+    candidatos.sort(key=lambda c: -c[0])
+    return candidatos
+
+
+def reporte_duplicados(umbral=UMBRAL_SIMILITUD, max_bloque=MAX_BLOQUE, progreso=None):
+    """
+    Recorre todos los bloques de claves compartidas y devuelve los pares
+    sospechosos [(puntaje, Paciente, Paciente)] de mayor a menor puntaje.
+    `progreso`, si se indica, se llama con la cantidad de bloques revisados.
+    """
+    pares = {}
+    pendientes = []
+    bloques = 0
+
+    def evaluar(bloque_ids):
+        pacientes = {p.id: p for p in db.pacientes_por_ids({i for ids in bloque_ids for i in ids})}
+        for ids in bloque_ids:
+            ids = sorted(ids)
+            for i, a in enumerate(ids):
+                for b in ids[i + 1:]:
+                    if (a, b) in pares or a not in pacientes or b not in pacientes:
+                        continue
+                    puntaje = similitud(pacientes[a], pacientes[b])
+                    pares[(a, b)] = (puntaje, pacientes[a], pacientes[b])
+
+    for ids in db.bloques_claves(max_bloque):
+        pendientes.append(ids)
+        if len(pendientes) >= 500:
+            evaluar(pendientes)
+            bloques += len(pendientes)
+            pendientes = []
+            if progreso:
+                progreso(bloques)
+    if pendientes:
+        evaluar(pendientes)
+        if progreso:
+            progreso(bloques + len(pendientes))
+    return sorted((p for p in pares.values() if p[0] >= umbral), key=lambda p: -p[0])
@@ -0,0 +1,83 @@
+"""
+Normalización de nombres y claves de agrupamiento para detectar pacientes duplicados.
+Funciones puras (sin acceso a la base) para que db.py pueda mantener las claves
+en la misma transacción en que se guarda el paciente.
+"""
+import re
+import unicodedata
+from datetime import datetime
+
+_REEMPLAZOS = [
+    ('ch', 'x'), ('ll', 'y'), ('qu', 'k'), ('gue', 'ge'), ('gui', 'gi'),
+    ('ge', 'je'), ('gi', 'ji'), ('ce', 'se'), ('ci', 'si'),
+    ('z', 's'), ('c', 'k'), ('v', 'b'), ('w', 'b'), ('h', ''), ('y', 'i'),
+]
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos ni signos: 'Muñoz-Pérez' -> 'munoz perez'."""
+    texto = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode()
+    return ' '.join(re.sub(r'[^a-z ]', ' ', texto.lower()).split())
+
+
+def clave_fonetica(texto):
+    """Clave fonética simple para apellidos en castellano: 'Vázquez' y 'Basques' dan lo mismo."""
+    t = normalizar(texto).replace(' ', '')
+    if not t:
+        return ''
+    for origen, destino in _REEMPLAZOS:
+        t = t.replace(origen, destino)
+    t = re.sub(r'(.)\1+', r'\1', t)
+    if not t:
+        return ''
+    return t[0] + re.sub(r'(.)\1+', r'\1', re.sub(r'[aeiou]', '', t[1:]))
+
+
+def solo_digitos(dni):
+    return re.sub(r'\D', '', str(dni or ''))
+
+
+def claves_dni(dni):
+    """El DNI y todas sus variantes con un dígito borrado: dos DNI a un error de tipeo comparten una clave."""
+    digitos = solo_digitos(dni)
+    if len(digitos) < 6:
+        return set()
+    return {f'd:{digitos}'} | {f'd:{digitos[:i]}{digitos[i + 1:]}' for i in range(len(digitos))}
+
+
+def anio_nacimiento(edad, fecha_registro=None):
+    try:
+        edad = int(edad)
+    except (TypeError, ValueError):
+        return None
+    anio = int(str(fecha_registro)[:4]) if fecha_registro else datetime.now().year
+    return anio - edad
+
+
+def clave_nombre(nombre, apellido, anio):
+    apellido_clave = clave_fonetica(apellido.split()[0] if apellido and apellido.split() else apellido)
+    inicial = normalizar(nombre)[:1]
+    if not apellido_clave or anio is None:
+        return None
+    return f'a:{apellido_clave}:{inicial}:{anio}'
+
+
+def claves_paciente(nombre, apellido, dni, edad, fecha_registro=None):
+    """Claves de agrupamiento que se guardan para un paciente."""
+    claves = claves_dni(dni)
+    clave = clave_nombre(nombre, apellido, anio_nacimiento(edad, fecha_registro))
+    if clave:
+        claves.add(clave)
+    return claves
+
+
+def claves_busqueda(nombre, apellido, dni, edad):
+    """Claves para buscar candidatos: como claves_paciente, con un año de tolerancia en la edad."""
+    claves = claves_dni(dni)
+    anio = anio_nacimiento(edad)
+    if anio is not None:
+        for delta in (-1, 0, 1):
+            clave = clave_nombre(nombre, apellido, anio + delta)
+            if clave:
+                claves.add(clave)
+    return claves
@@ -0,0 +1,216 @@
+"""
+Tareas de mantenimiento de la guardia desde la línea de comandos, sin interfaz
+gráfica (no carga Tk, ttkbootstrap ni matplotlib), para correrlas en el servidor,
+por ejemplo desde cron:
+
+    python -m guardia init
+    python -m guardia importar pacientes pacientes.csv
+    python -m guardia exportar consultas consultas.csv --desde 2026-01-01 --hasta 2026-02-01
+    python -m guardia estadisticas [--dias 30]
+    python -m guardia respaldo crear | listar | restaurar RUTA
+    python -m guardia archivar --antes 2024-01-01 [--destino archivo_guardia.db]
+    python -m guardia integridad [--rapida] [--reparar]
+    python -m guardia sintomas [--procesos N] [--desde AAAA-MM-DD --hasta AAAA-MM-DD]
+
+    # crontab: respaldo y verificación todas las noches
+    30 2 * * * cd /srv/guardia && python -m guardia respaldo crear && python -m guardia integridad --rapida
+
+Las rutas (base, respaldos) son relativas al directorio actual, o al que se
+indique con -C. Las escrituras quedan en la auditoría a nombre de --usuario.
+"""
+import argparse
+import csv
+import getpass
+import os
+import sys
+from datetime import datetime, timedelta
+import db
+import respaldos
+
+ARCHIVO_DESTINO = 'archivo_guardia.db'
+
+
+def _fecha(texto):
+    """AAAA-MM-DD o AAAA-MM-DD HH:MM[:SS] a datetime."""
+    try:
+        return datetime.fromisoformat(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida: {texto} (usar AAAA-MM-DD [HH:MM])")
+
+
+def _iniciar_auditoria(args):
+    import auditoria
+    db.establecer_usuario(args.usuario)
+    return auditoria.iniciar()  # vuelca lo pendiente al salir
+
+
+def cmd_init(args):
+    db.init_db()
+    print(f"Base {os.path.abspath(db.DB_PATH)} inicializada")
+    return 0
+
+
+def cmd_importar(args):
+    _iniciar_auditoria(args)
+    with open(args.archivo, newline='', encoding=args.codificacion) as f:
+        importadas, rechazadas = db.importar(args.tabla, csv.DictReader(f, delimiter=args.separador))
+    for numero, motivo in rechazadas:
+        print(f"fila {numero}: {motivo}", file=sys.stderr)
+    print(f"{importadas} {args.tabla} importados, {len(rechazadas)} rechazados")
+    return 1 if rechazadas else 0
+
+
+def cmd_exportar(args):
+    salida = sys.stdout if args.archivo == '-' else open(args.archivo, 'w', newline='', encoding='utf-8')
+    try:
+        escritor = csv.writer(salida, delimiter=args.separador)
+        filas = -1  # sin contar el encabezado
+        for fila in db.exportar(args.tabla, args.desde, args.hasta):
+            escritor.writerow(fila)
+            filas += 1
+    finally:
+        if salida is not sys.stdout:
+            salida.close()
+    print(f"{filas} filas de {args.tabla} exportadas", file=sys.stderr)
+    return 0
+
+
+def cmd_estadisticas(args):
+    print(f"En espera:            {db.consultas_en_espera()}")
+    print(f"Consultas de hoy:     {db.consultas_hoy()}")
+    print(f"Personal activo:      {db.personal_activo()}")
+    print(f"Recursos críticos:    {db.recursos_criticos()}")
+    for tipo, total, ocupadas in db.contadores_ocupacion():
+        print(f"{tipo + ':':<22}{ocupadas}/{total} ocupadas")
+    hasta = datetime.now()
+    print(f"\nEspera hasta la atención, últimos {args.dias} días (min):")
+    print(f"  {'Prioridad':<10}{'n':>8}{'p50':>8}{'p90':>8}{'p99':>8}")
+    for prioridad, n, p50, p90, p99 in db.distribucion_espera_prioridad(hasta - timedelta(days=args.dias), hasta):
+        print(f"  {prioridad or '-':<10}{n:>8}{p50:>8}{p90:>8}{p99:>8}")
+    import analitica  # pandas sólo para este resumen
+    resumen = analitica.ultimos_dias(args.dias)
+    print(f"\n{resumen.total} consultas en los últimos {args.dias} días (motor {analitica.motor_en_uso()})")
+    for medico, atendidas in resumen.por_medico.head(10).items():
+        print(f"  {medico:<30}{atendidas:>8}")
+    return 0
+
+
+def cmd_respaldo(args):
+    if args.accion == 'crear':
+        print(respaldos.crear_respaldo(directorio=args.directorio_respaldos))
+    elif args.accion == 'listar':
+        for ruta in respaldos.listar_respaldos(args.directorio_respaldos):
+            print(ruta)
+    else:
+        if not args.ruta:
+            print("Falta la ruta del respaldo a restaurar", file=sys.stderr)
+            return 2
+        previo = respaldos.restaurar_respaldo(args.ruta, directorio=args.directorio_respaldos)
+        print(f"Base restaurada desde {args.ruta}" + (f" (estado anterior en {previo})" if previo else ''))
+    return 0
+
+
+def cmd_archivar(args):
+    _iniciar_auditoria(args)
+    cantidad = db.archivar_consultas(args.antes, args.destino)
+    print(f"{cantidad} consultas anteriores a {args.antes:%Y-%m-%d} archivadas en {args.destino}")
+    return 0
+
+
+def cmd_integridad(args):
+    problemas = db.verificar_integridad(completa=not args.rapida)
+    for problema in problemas:
+        print(problema)
+    if problemas and args.reparar:
+        db.reparar_contadores()
+        problemas = db.verificar_integridad(completa=not args.rapida)
+        print(f"Contadores recalculados; quedan {len(problemas)} problemas")
+    elif not problemas:
+        print("Sin problemas")
+    return 1 if problemas else 0
+
+
+def cmd_sintomas(args):
+    import sintomas
+    pendiente = db.codificacion_pendiente()
+    if pendiente:
+        def progreso(alcanzado, hasta):
+            print(f"\rCodificando consultas: {alcanzado}/{hasta}", end='', file=sys.stderr, flush=True)
+        guardados = sintomas.codificar_historicas(args.procesos, args.lote, progreso)
+        print(f"\n{guardados} síntomas codificados en las consultas {pendiente[0] + 1} a {pendiente[1]}", file=sys.stderr)
+    hasta = args.hasta or datetime.now()
+    desde = args.desde or hasta - timedelta(days=args.dias)
+    print(f"Consultas por síntoma del {desde:%Y-%m-%d %H:%M} al {hasta:%Y-%m-%d %H:%M}:")
+    for sintoma in db.conteo_sintomas(desde, hasta):
+        if sintoma.cantidad:
+            print(f"  {sintoma.descripcion:<30}{sintoma.prioridad:<8}{sintoma.cantidad:>8}")
+    return 0
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(prog='guardia', description=__doc__.splitlines()[1],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-C', '--directorio', help="directorio de la base (por defecto, el actual)")
+    parser.add_argument('--usuario', default=getpass.getuser(), help="usuario que firma las escrituras en la auditoría")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p = sub.add_parser('init', help="crea las tablas y aplica las migraciones pendientes")
+    p.set_defaults(funcion=cmd_init)
+
+    p = sub.add_parser('importar', help="da de alta pacientes o consultas desde un CSV con encabezado")
+    p.add_argument('tabla', choices=('pacientes', 'consultas'))
+    p.add_argument('archivo')
+    p.add_argument('--separador', default=',')
+    p.add_argument('--codificacion', default='utf-8-sig')
+    p.set_defaults(funcion=cmd_importar)
+
+    p = sub.add_parser('exportar', help="escribe una tabla en CSV ('-' para la salida estándar)")
+    p.add_argument('tabla', choices=sorted(db.TABLAS_EXPORTACION))
+    p.add_argument('archivo')
+    p.add_argument('--desde', type=_fecha)
+    p.add_argument('--hasta', type=_fecha)
+    p.add_argument('--separador', default=',')
+    p.set_defaults(funcion=cmd_exportar)
+
+    p = sub.add_parser('estadisticas', help="estado actual y resumen de los últimos días")
+    p.add_argument('--dias', type=int, default=30)
+    p.set_defaults(funcion=cmd_estadisticas)
+
+    p = sub.add_parser('respaldo', help="crea, lista o restaura respaldos (ver respaldos.py)")
+    p.add_argument('accion', choices=('crear', 'listar', 'restaurar'))
+    p.add_argument('ruta', nargs='?')
+    p.add_argument('--directorio-respaldos', default=respaldos.DIRECTORIO_RESPALDOS)
+    p.set_defaults(funcion=cmd_respaldo)
+
+    p = sub.add_parser('archivar', help="mueve las consultas cerradas anteriores a una fecha a otra base")
+    p.add_argument('--antes', type=_fecha, required=True)
+    p.add_argument('--destino', default=ARCHIVO_DESTINO)
+    p.set_defaults(funcion=cmd_archivar)
+
+    p = sub.add_parser('integridad', help="verifica la base, las claves foráneas y los contadores")
+    p.add_argument('--rapida', action='store_true', help="quick_check en lugar de integrity_check")
+    p.add_argument('--reparar', action='store_true', help="recalcula los contadores que no coinciden")
+    p.set_defaults(funcion=cmd_integridad)
+
+    p = sub.add_parser('sintomas', help="codifica los síntomas de las consultas pendientes y los cuenta")
+    p.add_argument('--procesos', type=int, help="procesos para codificar (por defecto, uno menos que los núcleos)")
+    p.add_argument('--lote', type=int, default=5000, help="consultas por transacción")
+    p.add_argument('--desde', type=_fecha)
+    p.add_argument('--hasta', type=_fecha)
+    p.add_argument('--dias', type=int, default=30, help="período del conteo si no se da --desde")
+    p.set_defaults(funcion=cmd_sintomas)
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    if args.directorio:
+        os.chdir(args.directorio)
+    if args.comando not in ('init', 'respaldo') and not os.path.exists(db.DB_PATH):
+        print(f"No existe la base {os.path.abspath(db.DB_PATH)} (usar 'guardia init')", file=sys.stderr)
+        return 2
+    return args.funcion(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
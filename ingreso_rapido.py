@@ -0,0 +1,120 @@
+"""
+Ingreso masivo de víctimas (incidente con múltiples víctimas).
+Cada paciente se registra como provisorio, sin datos personales: un código que se
+escribe en la pulsera, sexo, edad estimada, motivo y prioridad inicial. El paciente y
+su consulta van juntos a la cola de escrituras del puesto (cola_escrituras.py), que
+responde al instante y los aplica a la base por tandas en una transacción cada una;
+así un solo puesto sostiene decenas de ingresos por minuto sin esperar a la base.
+Después se completan los datos reales o se fusiona el provisorio con el paciente
+que ya existía (db.actualizar_paciente con identificar=True, db.fusionar_pacientes).
+"""
+import hashlib
+import os
+import socket
+from datetime import datetime
+import db
+import triage
+from cola_escrituras import nueva_clave
+
+PREFIJO = 'NN'
+# Código del puesto en el código de pulsera; None: se deriva del nombre del equipo.
+# En los dos casos se reserva en la base (db.reservar_codigo_puesto) para que dos
+# equipos no usen el mismo.
+PUESTO = None
+# Sin 0/O ni 1/I para que el código se pueda dictar y copiar de la pulsera sin errores
+_ALFABETO = '23456789ABCDEFGHJKLMNPQRSTUVWXYZ'
+PRIORIDADES_TECLA = {'1': 'Alta', '2': 'Media', '3': 'Baja'}
+GENEROS_TECLA = {'m': 'Masculino', 'f': 'Femenino', 'o': 'Otro'}
+MOTIVO_SIN_DATOS = 'Ingreso masivo'
+
+
+def _candidatos(nombre):
+    # Tres caracteres que salen del nombre del equipo; si ya los tiene otro equipo, los siguientes
+    for intento in range(len(_ALFABETO) ** 3):
+        resumen = hashlib.sha1(f"{nombre}#{intento}".encode() if intento else nombre.encode()).digest()
+        yield ''.join(_ALFABETO[b % len(_ALFABETO)] for b in resumen[:3])
+
+
+def codigo_puesto(nombre=None):
+    """
+    PUESTO, o tres caracteres estables que salen del nombre del equipo, reservados en
+    la base a nombre del equipo: otro equipo nunca recibe el mismo código.
+    """
+    nombre = nombre or socket.gethostname()
+    codigo = db.reservar_codigo_puesto(nombre, [PUESTO] if PUESTO else _candidatos(nombre))
+    if codigo is None:
+        raise ValueError(f"El código de puesto {PUESTO} ya lo usa otro equipo; elegir otro en ingreso_rapido.PUESTO")
+    return codigo
+
+
+def nuevo_codigo(puesto, numero, ahora=None):
+    """
+    'NN-AAMMDD-PPP-NNN': día, puesto y número correlativo del día en el puesto. No
+    se repite entre puestos ni de un año a otro sin consultar la base, y los
+    códigos no se liberan nunca (el paciente identificado lo conserva).
+    """
+    ahora = ahora or datetime.now()
+    return f"{PREFIJO}-{ahora:%y%m%d}-{puesto}-{numero:03d}"
+
+
+class IngresoRapido:
+    """Registra provisorios en la cola del puesto y sigue el estado de los de esta sesión."""
+    def __init__(self, cola, puesto=None):
+        self.cola = cola
+        self.puesto = puesto or codigo_puesto()
+        # Último número usado, junto al diario de la cola: sobrevive a reinicios del puesto
+        self.archivo_contador = os.path.join(os.path.dirname(os.path.abspath(cola.archivo)), 'ingreso_rapido.contador')
+        self.registrados = []  # [(código, clave del paciente, clave de la consulta, prioridad)]
+
+    def _siguiente_numero(self, ahora):
+        dia, numero = f"{ahora:%y%m%d}", 0
+        if os.path.exists(self.archivo_contador):
+            with open(self.archivo_contador) as f:
+                guardado = f.read().split()
+            if len(guardado) == 2 and guardado[0] == dia:
+                numero = int(guardado[1])
+        numero += 1
+        temporal = self.archivo_contador + '.tmp'
+        with open(temporal, 'w') as f:
+            f.write(f"{dia} {numero}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.archivo_contador)
+        return numero
+
+    def registrar(self, prioridad=None, genero=None, edad=None, motivo=''):
+        """Encola el paciente provisorio y su consulta en espera; devuelve el código de la pulsera."""
+        motivo = (motivo or '').strip() or MOTIVO_SIN_DATOS
+        prioridad = prioridad or triage.sugerir_prioridad(motivo)
+        if prioridad not in triage.PRIORIDADES:
+            raise ValueError(f"Prioridad inválida: {prioridad}")
+        ahora = datetime.now()
+        codigo = nuevo_codigo(self.puesto, self._siguiente_numero(ahora), ahora)
+        clave_paciente, clave_consulta = nueva_clave(), nueva_clave()
+        # Con la hora local del ingreso en el puesto, como las demás fechas de la aplicación
+        paciente = {'nombre': PREFIJO, 'apellido': codigo, 'dni': None, 'edad': edad, 'genero': genero,
+                    'telefono': None, 'email': None, 'direccion': None, 'obra_social': None, 'numero_afiliado': None,
+                    'codigo_provisorio': codigo, 'fecha_registro': ahora}
+        # Sin médico: lo asigna quien toma al paciente de la cola de triage
+        consulta = {'paciente_clave': clave_paciente, 'fecha_consulta': ahora, 'motivo': motivo,
+                    'prioridad': prioridad, 'medico': None, 'estado': 'En espera'}
+        self.cola.encolar_varias([(clave_paciente, 'agregar_paciente', paciente),
+                                  (clave_consulta, 'agregar_consulta', consulta)])
+        self.registrados.append((codigo, clave_paciente, clave_consulta, prioridad))
+        return codigo
+
+    def estados(self):
+        """[(código, prioridad, estado)] de la sesión, el último primero; estado: Pendiente, Guardado o Rechazado."""
+        pendientes = self.cola.claves_pendientes()
+        rechazadas = {r['clave'] for r in self.cola.rechazadas}
+        resultado = []
+        for codigo, clave_paciente, clave_consulta, prioridad in reversed(self.registrados):
+            claves = {clave_paciente, clave_consulta}
+            if claves & rechazadas:
+                estado = 'Rechazado'
+            elif claves & pendientes:
+                estado = 'Pendiente'
+            else:
+                estado = 'Guardado'
+            resultado.append((codigo, prioridad, estado))
+        return resultado
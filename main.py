@@ -1,14 +1,31 @@
 import tkinter as tk
 import tkinter.ttk as ttk
-from tkinter import messagebox
+from tkinter import messagebox, simpledialog, filedialog
 from tkcalendar import Calendar, DateEntry
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import ttkbootstrap as tb
 from ttkbootstrap.constants import *
 from PIL import Image, ImageTk
-from datetime import datetime
+from datetime import datetime, timedelta
 import db  # Nuevo módulo para la base de datos
+from modelos import ConteoPrioridad
+import prediccion_stock
+import planificador_turnos
+import asignacion_medicos
+import triage
+import sintomas
+import analitica
+import prediccion_demanda
+import reportes
+import duplicados
+import respaldos
+import replica
+import cola_escrituras
+import ingreso_rapido
+import auditoria
+import sqlite3
+import threading
 import hashlib
 
 class HospitalGuardApp:
@@ -16,9 +33,11 @@ class HospitalGuardApp:
     Aplicación principal de guardia hospitalaria.
     Gestiona la interfaz gráfica y utiliza el módulo db para la lógica de datos.
     """
-    def __init__(self, root):
+    REFRESCO_COLA_TRIAGE_MS = 5000
+    def __init__(self, root, usuario=None):
         self.root = root
-        self.root.title("Sistema de Guardia Hospitalaria")
+        self.usuario = usuario
+        self.root.title("Sistema de Guardia Hospitalaria" + (f" - {usuario}" if usuario else ""))
         self.root.geometry("1400x800")
         self.root.configure(bg='#f0f0f0')
         
@@ -35,10 +54,26 @@ class HospitalGuardApp:
         }
         
         db.init_db()  # Inicializa la base de datos
+        db.establecer_usuario(usuario)
+        self.auditoria = auditoria.iniciar()
+        self.reportes = reportes.GestorReportes()
+        self.respaldos = respaldos.ProgramadorRespaldos()
+        self.respaldos.iniciar()
+        self.replica = replica.iniciar()
+        self.cola = cola_escrituras.ColaEscrituras().iniciar()
+        self.ingreso_rapido = ingreso_rapido.IngresoRapido(self.cola)  # provisorios registrados en esta sesión
+        self.medicos_conocidos = []  # última lista de médicos de guardia leída, para no esperar a la base
+        self.codificacion = sintomas.iniciar()  # síntomas de las consultas anteriores, si faltan
         
         # Crear el menú principal
         self.create_menu()
         
+        # Barra de estado de las escrituras pendientes de este puesto
+        self.estado_cola = ttk.Label(self.root, text="", anchor=tk.W, padding=(10, 2), cursor='hand2')
+        self.estado_cola.pack(side=tk.BOTTOM, fill=tk.X)
+        self.estado_cola.bind('<Button-1>', lambda e: self.mostrar_rechazadas())
+        self.actualizar_estado_cola()
+        
         # Frame principal con diseño moderno
         self.main_frame = tb.Frame(self.root, padding="20")
         self.main_frame.pack(fill=tk.BOTH, expand=True)
@@ -55,6 +90,10 @@ class HospitalGuardApp:
         menubar.add_cascade(label="Archivo", menu=file_menu)
         file_menu.add_command(label="Inicio", command=self.show_home)
         file_menu.add_separator()
+        file_menu.add_command(label="Crear Respaldo", command=self.crear_respaldo)
+        file_menu.add_command(label="Restaurar Respaldo...", command=self.restaurar_respaldo)
+        file_menu.add_command(label="Auditoría por Usuario", command=self.show_auditoria_usuario)
+        file_menu.add_separator()
         file_menu.add_command(label="Salir", command=self.root.quit)
         
         # Menú Pacientes
@@ -62,6 +101,10 @@ class HospitalGuardApp:
         menubar.add_cascade(label="Pacientes", menu=pacientes_menu)
         pacientes_menu.add_command(label="Nuevo Paciente", command=self.show_registro_paciente)
         pacientes_menu.add_command(label="Lista de Pacientes", command=self.show_lista_pacientes)
+        pacientes_menu.add_command(label="Posibles Duplicados", command=self.show_duplicados)
+        pacientes_menu.add_separator()
+        pacientes_menu.add_command(label="Ingreso Masivo", command=self.show_ingreso_masivo)
+        pacientes_menu.add_command(label="Identificar Provisorios", command=self.show_provisorios)
         
         # Menú Consultas
         consultas_menu = tk.Menu(menubar, tearoff=0)
@@ -82,10 +125,18 @@ class HospitalGuardApp:
         recursos_menu.add_command(label="Inventario", command=self.show_inventario)
         recursos_menu.add_command(label="Alertas", command=self.show_alertas)
         
+        # Menú Ubicaciones
+        ubicaciones_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Ubicaciones", menu=ubicaciones_menu)
+        ubicaciones_menu.add_command(label="Ocupación", command=self.show_ocupacion)
+        ubicaciones_menu.add_command(label="Nueva Ubicación", command=self.abrir_modal_nueva_ubicacion)
+        
         # Menú Reportes
         reportes_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Reportes", menu=reportes_menu)
         reportes_menu.add_command(label="Estadísticas", command=self.show_estadisticas)
+        reportes_menu.add_command(label="Análisis Histórico", command=self.show_analisis_historico)
+        reportes_menu.add_command(label="Generar Reporte...", command=self.abrir_modal_generar_reporte)
 
     def show_home(self):
         self.clear_main_frame()
@@ -103,6 +154,9 @@ class HospitalGuardApp:
         consultas_hoy = db.consultas_hoy()
         personal_activo = db.personal_activo()
         recursos_criticos = db.recursos_criticos()
+        por_agotarse = len(prediccion_stock.alertas_agotamiento())
+        contadores = db.contadores_ocupacion()
+        libres = sum(t.total - t.ocupadas for t in contadores)
         
         # Mostrar estadísticas en tarjetas
         stats_grid = tb.Frame(stats_frame)
@@ -111,14 +165,27 @@ class HospitalGuardApp:
         self.create_stat_card(stats_grid, "Consultas del Día", consultas_hoy, "📋", 1)
         self.create_stat_card(stats_grid, "Personal Activo", personal_activo, "👨‍⚕️", 2)
         self.create_stat_card(stats_grid, "Recursos Críticos", recursos_criticos, "⚠️", 3, color=self.colors['accent'] if recursos_criticos > 0 else self.colors['secondary'])
+        self.create_stat_card(stats_grid, f"Se agotan en {prediccion_stock.UMBRAL_HORAS} h", por_agotarse, "⏳", 4, color=self.colors['accent'] if por_agotarse > 0 else self.colors['secondary'])
+        if contadores:
+            self.create_stat_card(stats_grid, "Boxes/Camas Libres", libres, "🛏️", 5, color=self.colors['accent'] if libres == 0 else self.colors['secondary'])
+        
+        # Llegadas previstas para las próximas horas
+        prevision_frame = tb.Frame(stats_grid, padding="10")
+        prevision_frame.grid(row=0, column=6, padx=10, sticky='nsew')
+        ttk.Label(prevision_frame, text="Llegadas previstas", font=('Helvetica', 11, 'bold')).grid(row=0, column=0, columnspan=8)
+        for i, (hora, esperadas) in enumerate(prediccion_demanda.prevision_llegadas(horas=8)):
+            ttk.Label(prevision_frame, text=f"{hora:%H}h").grid(row=1, column=i, padx=4)
+            ttk.Label(prevision_frame, text=f"{esperadas:.0f}", font=('Helvetica', 14, 'bold'), foreground=self.colors['primary']).grid(row=2, column=i, padx=4)
         
         # Alertas visuales
-        if recursos_criticos > 0 or en_espera > 0:
+        if recursos_criticos > 0 or en_espera > 0 or por_agotarse > 0:
             alert_frame = tb.Frame(self.main_frame)
             alert_frame.pack(fill=tk.X, pady=10)
             msg = ""
             if recursos_criticos > 0:
                 msg += f"⚠️ Hay {recursos_criticos} recursos críticos. "
+            if por_agotarse > 0:
+                msg += f"⏳ {por_agotarse} recursos se agotarán en menos de {prediccion_stock.UMBRAL_HORAS} horas. "
             if en_espera > 0:
                 msg += f"🚨 Hay {en_espera} pacientes en espera."
             ttk.Label(alert_frame, text=msg, font=('Helvetica', 14, 'bold'), foreground=self.colors['accent']).pack()
@@ -173,6 +240,235 @@ class HospitalGuardApp:
         btn = tb.Button(parent, text=f"{icon}\n{text}", command=command, width=15)
         btn.grid(row=0, column=column, padx=10, pady=5)
 
+    def actualizar_estado_cola(self):
+        pendientes = self.cola.pendientes()
+        if self.cola.rechazadas:
+            texto, color = f"⚠ {len(self.cola.rechazadas)} registros rechazados por la base (clic para ver)", self.colors['accent']
+        elif pendientes and isinstance(self.cola.ultimo_error, sqlite3.Error):
+            texto, color = f"⏳ {pendientes} registros guardados en este puesto, esperando la base ({self.cola.ultimo_error})", '#e67e22'
+        elif pendientes and self.cola.ultimo_error:
+            texto, color = (f"⚠ {pendientes} registros guardados en este puesto no se pueden aplicar: "
+                            f"{type(self.cola.ultimo_error).__name__}: {self.cola.ultimo_error}", self.colors['accent'])
+        elif pendientes:
+            texto, color = f"⏳ Guardando {pendientes} registros...", 'gray'
+        else:
+            texto, color = "✔ Todo guardado", 'gray'
+        self.estado_cola.config(text=texto, foreground=color)
+        self.root.after(1000, self.actualizar_estado_cola)
+
+    def mostrar_rechazadas(self):
+        if not self.cola.rechazadas:
+            return
+        lineas = "\n".join(f"• {r['fecha'][:16]} {r['operacion']}: {r['error']}" for r in self.cola.rechazadas[-10:])
+        if messagebox.askyesno("Registros rechazados",
+                               f"La base rechazó estos registros (se conservan en {self.cola.archivo_rechazadas}):\n\n"
+                               f"{lineas}\n\n¿Marcarlos como revisados?"):
+            self.cola.descartar_rechazadas()
+
+    def _en_segundo_plano(self, tarea, al_terminar, progreso=None):
+        """Ejecuta tarea() en un hilo y llama a al_terminar(resultado, error) desde Tk al finalizar."""
+        resultado = {}
+        def ejecutar():
+            try:
+                resultado['valor'] = tarea()
+            except Exception as e:
+                resultado['error'] = e
+            resultado['listo'] = True
+        threading.Thread(target=ejecutar, daemon=True).start()
+        def seguir():
+            if 'listo' in resultado:
+                al_terminar(resultado.get('valor'), resultado.get('error'))
+            else:
+                if progreso:
+                    progreso()
+                self.root.after(300, seguir)
+        seguir()
+
+    def crear_tabla_listado(self, listado, columnas, etiquetas=None, page_size=50, rango=None, **opciones):
+        """
+        Treeview paginado sobre db.listado(): encabezados que ordenan al hacer clic y
+        una fila de filtros por columna. Sólo se pide a la base la página visible.
+        `columnas` es [(título, columna de db._LISTADOS o None, ancho)]; `etiquetas(fila)`
+        devuelve los tags de cada fila y `rango()` el período (desde, hasta) a mostrar
+        o None para todos. Devuelve (tree, recargar), donde recargar() vuelve a la primera página.
+        """
+        # cursores: el `despues` de db.listado con que empieza cada página hasta la actual
+        estado = {'cursores': [None], 'siguiente': None, 'orden': None, 'descendente': False, 'pendiente': None}
+        filtros = {}
+        filtros_frame = tb.Frame(self.main_frame)
+        filtros_frame.pack(fill=tk.X, padx=10)
+        style = ttk.Style()
+        style.configure("Treeview.Heading", font=("Helvetica", 11, "bold"), foreground=self.colors['primary'])
+        style.configure("Treeview", font=("Helvetica", 10), rowheight=28)
+        titulos = [titulo for titulo, _, _ in columnas]
+        tree = ttk.Treeview(self.main_frame, columns=titulos, show='headings', height=15, **opciones)
+        for titulo, clave, ancho in columnas:
+            tree.column(titulo, width=ancho)
+            if clave:
+                tree.heading(titulo, text=titulo, command=lambda clave=clave: ordenar(clave))
+            else:
+                tree.heading(titulo, text=titulo)
+            # Campo de filtro con el mismo ancho que la columna
+            campo = ttk.Entry(filtros_frame, width=max(4, ancho // 9))
+            campo.pack(side=tk.LEFT, padx=(0, 2))
+            if clave:
+                filtros[clave] = campo
+                campo.bind('<KeyRelease>', lambda e: programar())
+            else:
+                campo.config(state=tk.DISABLED)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        pag_frame = tb.Frame(self.main_frame)
+        pag_frame.pack(pady=10)
+        anterior = tb.Button(pag_frame, text="Anterior", bootstyle=tb.SECONDARY, command=lambda: ir(-1))
+        anterior.pack(side=tk.LEFT, padx=5)
+        pagina_label = ttk.Label(pag_frame, text="")
+        pagina_label.pack(side=tk.LEFT, padx=10)
+        siguiente = tb.Button(pag_frame, text="Siguiente", bootstyle=tb.SECONDARY, command=lambda: ir(1))
+        siguiente.pack(side=tk.LEFT, padx=5)
+
+        def recargar():
+            estado['pendiente'] = None
+            try:
+                filas, estado['siguiente'] = db.listado(listado, estado['orden'], estado['descendente'],
+                                                        {clave: campo.get() for clave, campo in filtros.items()},
+                                                        estado['cursores'][-1], page_size, rango() if rango else None)
+            except sqlite3.Error as e:
+                messagebox.showerror("Error", f"No se pudo leer {listado}: {e}")
+                return
+            tree.delete(*tree.get_children())
+            for fila in filas:
+                tree.insert('', tk.END, iid=str(fila[0]), values=fila, tags=etiquetas(fila) if etiquetas else ())
+            anterior.config(state=tk.NORMAL if len(estado['cursores']) > 1 else tk.DISABLED)
+            siguiente.config(state=tk.NORMAL if estado['siguiente'] is not None else tk.DISABLED)
+            pagina_label.config(text=f"Página {len(estado['cursores'])}")
+
+        def ordenar(clave):
+            if estado['orden'] == clave:
+                estado['descendente'] = not estado['descendente']
+            else:
+                estado['orden'], estado['descendente'] = clave, False
+            for titulo, otra, _ in columnas:
+                flecha = (' ▼' if estado['descendente'] else ' ▲') if otra == clave else ''
+                tree.heading(titulo, text=titulo + flecha)
+            estado['cursores'] = [None]
+            recargar()
+
+        def programar():
+            # Espera a que se deje de tipear antes de consultar
+            if estado['pendiente']:
+                self.root.after_cancel(estado['pendiente'])
+            estado['cursores'] = [None]
+            estado['pendiente'] = self.root.after(300, recargar)
+
+        def ir(paso):
+            if paso > 0 and estado['siguiente'] is not None:
+                estado['cursores'].append(estado['siguiente'])
+            elif paso < 0 and len(estado['cursores']) > 1:
+                estado['cursores'].pop()
+            recargar()
+
+        def desde_la_primera():
+            estado['cursores'] = [None]
+            recargar()
+
+        recargar()
+        return tree, desde_la_primera
+
+    def crear_selector_rango(self, padre, desde, hasta, al_cambiar, con_todo=False):
+        """
+        Fila con fecha y hora de inicio y de fin (el fin no se incluye) y atajos
+        (hoy, la última guardia nocturna, 7 y 30 días). Llama a al_cambiar(desde, hasta)
+        al aplicar; con con_todo=True, "Todo" llama a al_cambiar(None, None).
+        """
+        fila = tb.Frame(padre)
+        fila.pack(fill=tk.X, padx=10, pady=5)
+        campos = []
+        for texto, momento in (("Desde:", desde), ("Hasta:", hasta)):
+            ttk.Label(fila, text=texto).pack(side=tk.LEFT, padx=(10, 3))
+            fecha = DateEntry(fila, width=11, date_pattern='dd/mm/yyyy')
+            fecha.pack(side=tk.LEFT)
+            hora = ttk.Spinbox(fila, from_=0, to=23, width=3, format='%02.0f', wrap=True)
+            hora.pack(side=tk.LEFT, padx=(3, 0))
+            ttk.Label(fila, text="h").pack(side=tk.LEFT)
+            campos.append((fecha, hora))
+
+        def mostrar(desde, hasta):
+            for (fecha, hora), momento in zip(campos, (desde, hasta)):
+                if momento is not None:
+                    fecha.set_date(momento.date())
+                    hora.set(f"{momento.hour:02d}")
+
+        def aplicar():
+            try:
+                desde, hasta = [datetime.combine(fecha.get_date(), datetime.min.time()) + timedelta(hours=int(hora.get() or 0))
+                                for fecha, hora in campos]
+            except ValueError:
+                messagebox.showwarning("Fechas inválidas", "Revise las fechas y horas del período.")
+                return
+            if hasta <= desde:
+                messagebox.showwarning("Fechas inválidas", "El fin del período debe ser posterior al inicio.")
+                return
+            al_cambiar(desde, hasta)
+
+        def atajo(desde, hasta):
+            mostrar(desde, hasta)
+            al_cambiar(desde, hasta)
+
+        def guardia_nocturna():
+            # La última noche ya terminada según el roster (ver planificador_turnos.TURNOS)
+            hora, duracion = planificador_turnos.TURNOS['Noche']
+            ahora = datetime.now()
+            inicio = datetime.combine(ahora.date(), datetime.min.time()) + timedelta(hours=hora)
+            while inicio + timedelta(hours=duracion) > ahora:
+                inicio -= timedelta(days=1)
+            return inicio, inicio + timedelta(hours=duracion)
+
+        tb.Button(fila, text="Aplicar", bootstyle=tb.INFO, command=aplicar).pack(side=tk.LEFT, padx=10)
+        hoy = db.rango_dia()
+        atajos = [("Hoy", lambda: hoy), ("Guardia nocturna", guardia_nocturna),
+                  ("7 días", lambda: (hoy[1] - timedelta(days=7), hoy[1])), ("30 días", lambda: (hoy[1] - timedelta(days=30), hoy[1]))]
+        for texto, periodo in atajos:
+            tb.Button(fila, text=texto, bootstyle=tb.SECONDARY, command=lambda periodo=periodo: atajo(*periodo())).pack(side=tk.LEFT, padx=2)
+        if con_todo:
+            tb.Button(fila, text="Todo", bootstyle=tb.SECONDARY, command=lambda: al_cambiar(None, None)).pack(side=tk.LEFT, padx=2)
+        mostrar(desde or hoy[0], hasta or hoy[1])
+        return fila
+
+    def crear_respaldo(self):
+        avance = {'texto': 'Iniciando respaldo...'}
+        ventana = tk.Toplevel(self.root)
+        ventana.title("Respaldo")
+        ventana.transient(self.root)
+        etiqueta = ttk.Label(ventana, text=avance['texto'], padding=20)
+        etiqueta.pack()
+        def registrar(hechas, total):
+            avance['texto'] = f"Copiando base: {hechas * 100 // max(total, 1)}%"
+        def terminar(ruta, error):
+            ventana.destroy()
+            if error:
+                messagebox.showerror("Error", f"No se pudo crear el respaldo: {error}")
+            else:
+                messagebox.showinfo("Respaldo", f"Respaldo verificado y guardado en:\n{ruta}")
+        self._en_segundo_plano(lambda: self.respaldos.respaldar_ahora(progreso=registrar), terminar,
+                               progreso=lambda: etiqueta.config(text=avance['texto']))
+
+    def restaurar_respaldo(self):
+        ruta = filedialog.askopenfilename(title="Restaurar respaldo", initialdir=respaldos.DIRECTORIO_RESPALDOS,
+                                          filetypes=[("Respaldos", "*.db.gz")])
+        if not ruta:
+            return
+        if not messagebox.askyesno("Restaurar", "Se reemplazarán todos los datos actuales por los del respaldo "
+                                                "(antes se respalda el estado actual). ¿Continuar?"):
+            return
+        def terminar(previo, error):
+            if error:
+                messagebox.showerror("Error", f"No se pudo restaurar: {error}")
+                return
+            messagebox.showinfo("Restaurar", "Base restaurada. Reinicie la aplicación en los demás puestos."
+                                + (f"\nEl estado anterior quedó en {previo}" if previo else ''))
+            self.show_home()
+        self._en_segundo_plano(lambda: respaldos.restaurar_respaldo(ruta), terminar)
+
     def show_registro_paciente(self):
         self.clear_main_frame()
         ttk.Label(self.main_frame, text="Registro de Paciente", font=('Helvetica', 20, 'bold'), foreground=self.colors['primary']).pack(pady=10)
@@ -199,7 +495,9 @@ class HospitalGuardApp:
                     'obra_social': entries['obra_social'].get(),
                     'numero_afiliado': entries['numero_afiliado'].get()
                 }
-                db.agregar_paciente(datos)
+                if not self.confirmar_sin_duplicados(datos):
+                    return
+                self.cola.encolar('agregar_paciente', datos)
                 messagebox.showinfo("Éxito", "Paciente registrado correctamente")
                 self.show_home()
             except Exception as e:
@@ -262,10 +560,25 @@ class HospitalGuardApp:
         form_frame = tk.Frame(self.main_frame, padx=20, pady=20)
         form_frame.pack(fill=tk.BOTH, expand=True)
         ttk.Label(form_frame, text="Paciente:").grid(row=0, column=0, sticky=tk.W, pady=5)
-        pacientes = db.pacientes()
+        # Solo se cargan los pacientes que coinciden con lo escrito, nunca la tabla completa
+        pacientes = {}
         paciente_var = tk.StringVar()
         paciente_combo = ttk.Combobox(form_frame, textvariable=paciente_var, width=30)
-        paciente_combo['values'] = [f"{p[0]} - {p[1]} {p[2]} (DNI: {p[3]})" for p in pacientes]
+        # Pacientes dados de alta en este puesto que todavía esperan en la cola de escrituras
+        pendientes = {f"(pendiente) {d['apellido']}, {d['nombre']} - DNI {d['dni']}": (clave, d)
+                      for clave, d in self.cola.pacientes_pendientes()}
+        def buscar_pacientes(*args):
+            texto = paciente_var.get()
+            if ' - ' in texto:
+                return
+            try:
+                encontrados = db.pacientes_resumen(texto)
+            except sqlite3.Error:
+                encontrados = []
+            pacientes.update((p.id, p) for p in encontrados)
+            paciente_combo['values'] = [e for e in pendientes if texto.lower() in e.lower()] + [p.etiqueta() for p in encontrados]
+        buscar_pacientes()
+        paciente_combo.bind('<KeyRelease>', buscar_pacientes)
         paciente_combo.grid(row=0, column=1, pady=5)
         ttk.Label(form_frame, text="Motivo:").grid(row=1, column=0, sticky=tk.W, pady=5)
         motivo_entry = ttk.Entry(form_frame, width=30)
@@ -275,41 +588,80 @@ class HospitalGuardApp:
         prioridad_combo = ttk.Combobox(form_frame, textvariable=prioridad_var, width=27)
         prioridad_combo['values'] = ['Alta', 'Media', 'Baja']
         prioridad_combo.grid(row=2, column=1, pady=5)
+        sintomas_label = ttk.Label(form_frame, text="", foreground=self.colors['secondary'])
+        sintomas_label.grid(row=2, column=2, sticky=tk.W, padx=10)
         ttk.Label(form_frame, text="Médico:").grid(row=3, column=0, sticky=tk.W, pady=5)
         medico_var = tk.StringVar()
         medico_combo = ttk.Combobox(form_frame, textvariable=medico_var, width=27)
-        medico_combo['values'] = ['Dr. García', 'Dra. Martínez', 'Dr. Rodríguez']
+        # Médicos de guardia con su carga abierta; el sugerido se completa solo. Se muestra
+        # la última lista conocida y se actualiza en segundo plano: el formulario no espera a la base
+        medicos = list(self.medicos_conocidos)
+        medico_combo['values'] = [m.medico for m in medicos]
         medico_combo.grid(row=3, column=1, pady=5)
+        carga_label = ttk.Label(form_frame, text="", foreground=self.colors['secondary'])
+        carga_label.grid(row=3, column=2, sticky=tk.W, padx=10)
+        medico_elegido_a_mano = tk.BooleanVar(value=False)
+        def elegir_medico(*args):
+            medico_elegido_a_mano.set(True)
+            mostrar_carga()
+        def mostrar_carga():
+            for m in medicos:
+                if m.medico == medico_var.get():
+                    carga_label.config(text=f"{m.especialidad} · {m.abiertas} pacientes abiertos")
+                    return
+            carga_label.config(text="")
+        medico_combo.bind('<<ComboboxSelected>>', elegir_medico)
         def actualizar_prioridad(*args):
             # Obtener edad del paciente seleccionado
             edad = ''
-            if paciente_var.get():
-                paciente_id = paciente_var.get().split(' - ')[0]
-                for p in pacientes:
-                    if str(p[0]) == paciente_id:
-                        edad = p[4]  # La edad está en la columna 4
-                        break
-            sugerida = self.sugerir_prioridad(motivo_entry.get(), edad)
-            prioridad_var.set(sugerida)
+            if paciente_var.get() in pendientes:
+                edad = pendientes[paciente_var.get()][1]['edad']
+            elif ' - ' in paciente_var.get():
+                paciente_id = int(paciente_var.get().split(' - ')[0])
+                paciente = pacientes.get(paciente_id)
+                if paciente is None:
+                    try:
+                        paciente = db.paciente_resumen(paciente_id)
+                    except sqlite3.Error:
+                        paciente = None  # sin la edad sólo se pierde la sugerencia de Pediatría
+                if paciente:
+                    edad = paciente.edad
+            codigos = triage.codificar(motivo_entry.get())
+            prioridad_var.set(triage.prioridad_de(codigos))
+            sintomas_label.config(text=", ".join(triage.SINTOMAS[codigo][0] for codigo in codigos))
+            if not medico_elegido_a_mano.get():
+                especialidad = asignacion_medicos.especialidad_sugerida(motivo_entry.get(), edad)
+                medico_var.set(asignacion_medicos.sugerir_medico(especialidad, medicos) or '')
+                mostrar_carga()
         motivo_entry.bind('<KeyRelease>', actualizar_prioridad)
         paciente_combo.bind('<<ComboboxSelected>>', actualizar_prioridad)
         # Inicializar prioridad sugerida
         actualizar_prioridad()
+        def medicos_leidos(resultado, error):
+            if error is not None or not medico_combo.winfo_exists():
+                return  # se sigue con la lista anterior
+            self.medicos_conocidos = resultado
+            medicos[:] = resultado
+            medico_combo['values'] = [m.medico for m in medicos]
+            actualizar_prioridad()
+        self._en_segundo_plano(asignacion_medicos.medicos_disponibles, medicos_leidos)
         def guardar_consulta():
             if not all([paciente_var.get(), motivo_entry.get(), prioridad_var.get(), medico_var.get()]):
                 messagebox.showwarning("Advertencia", "Por favor complete todos los campos")
                 return
             try:
-                paciente_id = paciente_var.get().split(' - ')[0]
                 datos = {
-                    'paciente_id': paciente_id,
                     'fecha_consulta': datetime.now(),
                     'motivo': motivo_entry.get(),
                     'prioridad': prioridad_var.get(),
                     'medico': medico_var.get(),
                     'estado': 'En espera'
                 }
-                db.agregar_consulta(datos)
+                if paciente_var.get() in pendientes:
+                    datos['paciente_clave'] = pendientes[paciente_var.get()][0]
+                else:
+                    datos['paciente_id'] = int(paciente_var.get().split(' - ')[0])
+                self.cola.encolar('agregar_consulta', datos)
                 messagebox.showinfo("Éxito", "Consulta registrada correctamente")
                 self.show_home()
             except Exception as e:
@@ -319,33 +671,6 @@ class HospitalGuardApp:
         tb.Button(button_frame, text="Guardar", command=guardar_consulta).pack(side=tk.LEFT, padx=5)
         tb.Button(button_frame, text="Cancelar", command=self.show_home).pack(side=tk.LEFT, padx=5)
 
-    def sugerir_prioridad(self, motivo, edad):
-        motivo = motivo.lower()
-        try:
-            edad = int(edad)
-        except:
-            edad = None
-        sintomas_alta = [
-            'dolor de pecho', 'dificultad para respirar', 'convulsión', 'convulsiones', 'pérdida de conciencia', 'hemorragia',
-            'accidente', 'quemadura grave', 'parálisis', 'traumatismo', 'shock', 'inconsciente', 'infarto', 'ictus', 'ataque cardíaco',
-            'sangrado abundante', 'fractura expuesta', 'ahogo', 'paro cardíaco', 'dolor abdominal intenso', 'quemadura extensa', 'herida profunda'
-        ]
-        sintomas_media = [
-            'fiebre alta', 'vómitos persistentes', 'fractura', 'caída', 'dolor moderado', 'infección', 'diarrea', 'dolor abdominal',
-            'herida', 'dolor lumbar', 'mareo', 'tos persistente', 'dolor de oído', 'dolor de garganta', 'dolor de cabeza fuerte', 'bronquitis', 'asma', 'alergia', 'dolor articular'
-        ]
-        for sintoma in sintomas_alta:
-            if sintoma in motivo:
-                return 'Alta'
-        if edad is not None and (edad < 5 or edad > 70):
-            for sintoma in sintomas_media:
-                if sintoma in motivo:
-                    return 'Media'
-        for sintoma in sintomas_media:
-            if sintoma in motivo:
-                return 'Media'
-        return 'Baja'
-
     def show_triage(self):
         self.clear_main_frame()
         
@@ -361,7 +686,7 @@ class HospitalGuardApp:
         
         # Crear tabla
         columns = ('ID', 'Paciente', 'Motivo', 'Prioridad', 'Tiempo de Espera', 'Acciones')
-        tree = ttk.Treeview(wait_frame, columns=columns, show='headings', height=10)
+        tree = ttk.Treeview(wait_frame, columns=columns, show='headings', height=8)
         
         for col in columns:
             tree.heading(col, text=col)
@@ -374,11 +699,22 @@ class HospitalGuardApp:
         tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        # Cargar pacientes en espera
-        consultas = db.consultas_en_espera_lista()
+        # Cargar pacientes en espera; la lista se actualiza sola mientras esté en pantalla
+        def cargar():
+            if not tree.winfo_exists():
+                return
+            try:
+                consultas = db.consultas_en_espera_lista()
+            except sqlite3.Error:
+                consultas = None  # base ocupada: se conserva la lista anterior
+            if consultas is not None:
+                tree.delete(*tree.get_children())
+                for id_, paciente, motivo, prioridad, minutos in consultas:
+                    tree.insert('', tk.END, values=(id_, paciente, motivo, prioridad, f"{minutos} min"))
+            self.root.after(self.REFRESCO_COLA_TRIAGE_MS, cargar)
+        cargar()
         
-        for row in consultas:
-            tree.insert('', tk.END, values=row)
+        self.mostrar_historial_triage(self.main_frame)
         
         # Botones de acción
         action_frame = tb.Frame(self.main_frame)
@@ -387,14 +723,75 @@ class HospitalGuardApp:
         tb.Button(action_frame, text="Actualizar Lista", command=self.show_triage).pack(side=tk.LEFT, padx=5)
         tb.Button(action_frame, text="Volver al Inicio", command=self.show_home).pack(side=tk.LEFT, padx=5)
 
-    def show_estadisticas(self):
+    def mostrar_historial_triage(self, padre, page_size=50):
+        """Consultas de un período con su prioridad y espera; las anteriores se cargan al llegar al final."""
+        historial_frame = ttk.LabelFrame(padre, text="Historial de Triage", padding="10")
+        historial_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+        estado = {'rango': db.rango_dia(), 'antes': None, 'completa': False}
+        total_label = ttk.Label(historial_frame, text="", foreground='gray')
+        tabla = tb.Frame(historial_frame)
+        columns = ("ID", "Ingreso", "Paciente", "Motivo", "Prioridad", "Médico", "Estado", "Espera")
+        tree = ttk.Treeview(tabla, columns=columns, show='headings', height=8)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=220 if col == "Motivo" else 110)
+        scrollbar = ttk.Scrollbar(tabla, orient=tk.VERTICAL, command=tree.yview)
+
+        def cargar_mas():
+            if estado['completa']:
+                return
+            filas = db.historial_triage(*estado['rango'], antes=estado['antes'], limite=page_size)
+            for fila in filas:
+                tree.insert('', tk.END, values=(fila.id, fila.fecha_consulta[:16], fila.paciente, fila.motivo, fila.prioridad,
+                                                fila.medico, fila.estado, '' if fila.espera is None else f"{fila.espera} min"))
+            if filas:
+                estado['antes'] = (filas[-1].fecha_consulta, filas[-1].id)
+            estado['completa'] = len(filas) < page_size
+
+        def cambiar_periodo(desde, hasta):
+            estado.update(rango=(desde, hasta), antes=None, completa=False)
+            tree.delete(*tree.get_children())
+            total_label.config(text=f"{db.contar_consultas(desde, hasta)} consultas en el período")
+            cargar_mas()
+
+        def al_desplazar(primero, ultimo):
+            scrollbar.set(primero, ultimo)
+            if float(ultimo) >= 0.95:
+                cargar_mas()
+
+        self.crear_selector_rango(historial_frame, *estado['rango'], cambiar_periodo)
+        total_label.pack(anchor=tk.W, padx=10)
+        tabla.pack(fill=tk.BOTH, expand=True)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.configure(yscrollcommand=al_desplazar)
+        cambiar_periodo(*estado['rango'])
+
+    def show_estadisticas(self, desde=None, hasta=None):
         self.clear_main_frame()
+        if desde is None:
+            hasta = db.rango_dia()[1]
+            desde = hasta - timedelta(days=7)
         
         # Título
         ttk.Label(self.main_frame, 
                 text="Estadísticas",
                 font=('Helvetica', 20, 'bold'),
                 foreground=self.colors['primary']).pack(pady=10)
+        self.crear_selector_rango(self.main_frame, desde, hasta, self.show_estadisticas)
+        desfase = db.desfase_replica()
+        if desfase:
+            ttk.Label(self.main_frame, text=f"Datos actualizados hace {int(desfase)} s (réplica de lectura)",
+                      foreground='gray').pack()
+        cache = db.estadisticas_cache()
+        ttk.Label(self.main_frame, text=f"Caché de lecturas: {cache['aciertos']} aciertos, {cache['fallos']} consultas a la base "
+                                        f"({cache['tasa_aciertos']:.0%}), {cache['entradas']} resultados, {cache['bytes'] // 1024} KB",
+                  foreground='gray').pack()
+        # Agregados del período con el motor de analitica.py (DuckDB si está disponible)
+        resumen = analitica.resumen(desde, hasta)
+        ttk.Label(self.main_frame, text=f"{resumen.total} consultas, {resumen.estados_por_dia['canceladas'].sum() / resumen.total:.1%} canceladas "
+                                        f"(motor: {'DuckDB' if analitica.motor_en_uso() == 'duckdb' else 'SQLite'})"
+                  if resumen.total else "Sin consultas en el período", foreground='gray').pack()
         
         # Frame para gráficos
         stats_frame = tb.Frame(self.main_frame)
@@ -403,7 +800,7 @@ class HospitalGuardApp:
         # Crear figura para matplotlib
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
         
-        self.grafico_consultas_por_prioridad(ax1)
+        self.grafico_consultas_por_prioridad(ax1, resumen=resumen)
         self.grafico_recursos_por_estado(ax2)
         
         # Ajustar layout
@@ -414,10 +811,192 @@ class HospitalGuardApp:
         canvas.draw()
         canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         
+        # Tiempos puerta-médico del período
+        espera_frame = tb.LabelFrame(self.main_frame, text="Tiempo de espera hasta la atención (min)", padding="10")
+        espera_frame.pack(fill=tk.X, padx=20, pady=10)
+        columns = ("Prioridad", "Atendidas", "p50", "p90", "p99")
+        tree = ttk.Treeview(espera_frame, columns=columns, show='headings', height=4)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100)
+        tree.pack(fill=tk.X)
+        for row in db.distribucion_espera_prioridad(desde, hasta):
+            tree.insert('', tk.END, values=row)
+        
+        self.mostrar_sintomas(desde, hasta)
+        
         # Botón para volver
         tb.Button(self.main_frame, text="Volver al Inicio", command=self.show_home).pack(pady=10)
 
-    def show_lista_pacientes(self, page=1, page_size=50):
+    def mostrar_sintomas(self, desde, hasta, dias_tendencia=90):
+        """Síntomas más frecuentes del período contra el período anterior de igual duración y la tendencia diaria del elegido."""
+        sintomas_frame = tb.LabelFrame(self.main_frame, text="Síntomas", padding="10")
+        sintomas_frame.pack(fill=tk.X, padx=20, pady=10)
+        avance = self.codificacion.avance  # lo actualiza otro hilo: se lee una sola vez
+        if avance:
+            id_alcanzado, ultimo_id = avance
+            ttk.Label(sintomas_frame, text=f"Codificando consultas anteriores: {id_alcanzado * 100 // max(ultimo_id, 1)}% "
+                                           "(los conteos todavía no las incluyen todas)", foreground='gray').pack(anchor=tk.W)
+        columns = ("Síntoma", "Prioridad", "Consultas", "Período anterior", "Variación")
+        tree = ttk.Treeview(sintomas_frame, columns=columns, show='headings', height=6)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=120)
+        tree.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        anteriores = {s.codigo: s.cantidad for s in db.conteo_sintomas(desde - (hasta - desde), desde)}
+        for s in db.conteo_sintomas(desde, hasta):
+            if not s.cantidad and not anteriores.get(s.codigo):
+                continue
+            previa = anteriores.get(s.codigo, 0)
+            variacion = f"{(s.cantidad - previa) * 100 / previa:+.0f}%" if previa else "nuevo"
+            tree.insert('', tk.END, iid=s.codigo, values=(s.descripcion, s.prioridad, s.cantidad, previa, variacion))
+        fig, ax = plt.subplots(figsize=(5, 2))
+        canvas = FigureCanvasTkAgg(fig, master=sintomas_frame)
+        canvas.get_tk_widget().pack(side=tk.LEFT, fill=tk.BOTH, padx=10)
+        def graficar_tendencia(event=None):
+            ax.clear()
+            if tree.selection():
+                codigo = tree.selection()[0]
+                serie = db.tendencia_sintoma(codigo, hasta - timedelta(days=dias_tendencia), hasta)
+                if serie:
+                    ax.plot([datetime.strptime(dia, '%Y-%m-%d') for dia, _ in serie], [n for _, n in serie], color='#e74c3c')
+                    ax.tick_params(axis='x', rotation=30, labelsize=7)
+                ax.set_title(f"{triage.SINTOMAS.get(codigo, (codigo,))[0]} por día ({dias_tendencia} días)", fontsize=9)
+            fig.tight_layout()
+            canvas.draw()
+        tree.bind('<<TreeviewSelect>>', graficar_tendencia)
+        if tree.get_children():
+            tree.selection_set(tree.get_children()[0])
+        graficar_tendencia()
+
+    def show_analisis_historico(self, dias=90):
+        self.clear_main_frame()
+        ttk.Label(self.main_frame, 
+                text="Análisis Histórico",
+                font=('Helvetica', 20, 'bold'),
+                foreground=self.colors['primary']).pack(pady=10)
+        
+        # Selección del período
+        periodo_frame = tb.Frame(self.main_frame)
+        periodo_frame.pack(pady=5)
+        ttk.Label(periodo_frame, text="Período:").pack(side=tk.LEFT, padx=5)
+        periodos = {'Últimos 30 días': 30, 'Últimos 90 días': 90, 'Último año': 365}
+        periodo_var = tk.StringVar(value=next(k for k, v in periodos.items() if v == dias))
+        periodo_combo = ttk.Combobox(periodo_frame, textvariable=periodo_var, values=list(periodos), state='readonly', width=20)
+        periodo_combo.pack(side=tk.LEFT, padx=5)
+        periodo_combo.bind('<<ComboboxSelected>>', lambda e: self.show_analisis_historico(periodos[periodo_var.get()]))
+        
+        resumen = analitica.ultimos_dias(dias)
+        ttk.Label(periodo_frame, text=f"{resumen.total} consultas").pack(side=tk.LEFT, padx=15)
+        ttk.Label(periodo_frame, text=f"Motor: {'DuckDB' if analitica.motor_en_uso() == 'duckdb' else 'SQLite'}", foreground='gray').pack(side=tk.LEFT, padx=5)
+        
+        stats_frame = tb.Frame(self.main_frame)
+        stats_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(12, 7))
+        
+        # Mapa de calor de llegadas
+        im = ax1.imshow(resumen.mapa_calor, aspect='auto', cmap='Reds')
+        ax1.set_yticks(range(7), analitica.DIAS_SEMANA)
+        ax1.set_xticks(range(0, 24, 3))
+        ax1.set_xlabel('Hora de llegada')
+        ax1.set_title('Llegadas por día y hora')
+        fig.colorbar(im, ax=ax1)
+        
+        # Consultas atendidas por médico
+        top = resumen.por_medico.head(10)
+        ax2.barh(top.index.astype(str)[::-1], top.to_numpy()[::-1], color='#3498db')
+        ax2.set_title('Consultas atendidas por médico')
+        
+        # Mezcla de prioridades por semana
+        if not resumen.mix_prioridad.empty:
+            semanal = resumen.mix_prioridad.resample('W').sum()
+            ax3.stackplot(semanal.index, semanal.T.to_numpy(), labels=semanal.columns, colors=['#e74c3c', '#e67e22', '#2ecc71'])
+            ax3.legend(loc='upper left')
+            ax3.tick_params(axis='x', rotation=30)
+        ax3.set_title('Prioridades por semana')
+        
+        # Tasa de cancelación semanal
+        if not resumen.estados_por_dia.empty:
+            semanal = resumen.estados_por_dia.resample('W').sum()
+            ax4.plot(semanal.index, 100 * semanal['canceladas'] / semanal['total'], color='#95a5a6')
+            ax4.tick_params(axis='x', rotation=30)
+        ax4.set_title('Cancelaciones (%)')
+        
+        plt.tight_layout()
+        canvas = FigureCanvasTkAgg(fig, master=stats_frame)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        
+        tb.Button(self.main_frame, text="Volver al Inicio", command=self.show_home).pack(pady=10)
+
+    def abrir_modal_generar_reporte(self):
+        modal = tk.Toplevel(self.root)
+        modal.title("Generar Reporte")
+        modal.geometry("420x320")
+        modal.transient(self.root)
+        hoy = datetime.now().date()
+        ttk.Label(modal, text="Desde:").grid(row=0, column=0, sticky=tk.W, pady=7, padx=10)
+        desde_entry = DateEntry(modal, width=27, date_pattern='dd/mm/yyyy')
+        desde_entry.set_date(hoy.replace(month=1, day=1))
+        desde_entry.grid(row=0, column=1, pady=7)
+        ttk.Label(modal, text="Hasta:").grid(row=1, column=0, sticky=tk.W, pady=7, padx=10)
+        hasta_entry = DateEntry(modal, width=27, date_pattern='dd/mm/yyyy')
+        hasta_entry.set_date(hoy)
+        hasta_entry.grid(row=1, column=1, pady=7)
+        ttk.Label(modal, text="Formato:").grid(row=2, column=0, sticky=tk.W, pady=7, padx=10)
+        formato_var = tk.StringVar(value='PDF')
+        ttk.Combobox(modal, textvariable=formato_var, values=reportes.FORMATOS, state='readonly', width=27).grid(row=2, column=1, pady=7)
+        progreso = ttk.Progressbar(modal, maximum=1.0, length=380)
+        progreso.grid(row=3, column=0, columnspan=2, pady=(20, 5), padx=10)
+        estado_label = ttk.Label(modal, text="")
+        estado_label.grid(row=4, column=0, columnspan=2)
+        trabajo = {}
+        def seguir(t):
+            # Se consulta el avance sin bloquear: la guardia sigue usando la app mientras tanto
+            progreso['value'] = t.actualizar()
+            estado_label.config(text=f"Procesando {t.pasos_hechos} de {t.total_pasos} pasos...")
+            if not t.terminado:
+                modal.after(200, seguir, t)
+                return
+            generar_btn.config(state=tk.NORMAL)
+            if t.error:
+                estado_label.config(text="Error al generar el reporte.")
+                messagebox.showerror("Error", f"Error al generar el reporte: {t.error}", parent=modal)
+            elif t.cancelado:
+                estado_label.config(text="Reporte cancelado.")
+            else:
+                estado_label.config(text=f"Reporte guardado en {t.destino}")
+        def generar():
+            if 'actual' in trabajo and not trabajo['actual'].terminado:
+                return  # uno por vez: el botón queda deshabilitado hasta que termine
+            desde = datetime.combine(desde_entry.get_date(), datetime.min.time())
+            hasta = datetime.combine(hasta_entry.get_date(), datetime.min.time()) + timedelta(days=1)
+            if hasta <= desde:
+                messagebox.showwarning("Fechas inválidas", "La fecha 'Hasta' debe ser posterior a 'Desde'.", parent=modal)
+                return
+            extension = formato_var.get().lower()
+            destino = filedialog.asksaveasfilename(parent=modal, defaultextension=f".{extension}",
+                                                   filetypes=[(formato_var.get(), f"*.{extension}")],
+                                                   initialfile=f"reporte_guardia_{desde:%Y%m%d}_{hasta:%Y%m%d}.{extension}")
+            if not destino:
+                return
+            trabajo['actual'] = self.reportes.generar(desde, hasta, formato_var.get(), destino)
+            generar_btn.config(state=tk.DISABLED)
+            seguir(trabajo['actual'])
+        def cancelar():
+            if 'actual' in trabajo and not trabajo['actual'].terminado:
+                trabajo['actual'].cancelar()
+            else:
+                modal.destroy()
+        btn_frame = tb.Frame(modal)
+        btn_frame.grid(row=5, column=0, columnspan=2, pady=20)
+        generar_btn = tb.Button(btn_frame, text="Generar", bootstyle=tb.SUCCESS, command=generar)
+        generar_btn.pack(side=tk.LEFT, padx=10)
+        tb.Button(btn_frame, text="Cancelar", bootstyle=tb.SECONDARY, command=cancelar).pack(side=tk.LEFT, padx=10)
+        # Cerrar la ventana con un reporte en curso lo cancela, como el botón, en lugar de dejarlo corriendo sin avance a la vista
+        modal.protocol("WM_DELETE_WINDOW", cancelar)
+
+    def show_lista_pacientes(self, page_size=50):
         self.clear_main_frame()
         ttk.Label(self.main_frame, text="Lista de Pacientes", font=('Helvetica', 22, 'bold'), foreground=self.colors['primary']).pack(pady=(10, 0))
         actions_frame = tb.Frame(self.main_frame)
@@ -426,37 +1005,71 @@ class HospitalGuardApp:
         tb.Button(actions_frame, text="🔍 Buscar", bootstyle=tb.INFO, command=self.abrir_modal_buscar_paciente).pack(side=tk.LEFT, padx=5)
         tb.Button(actions_frame, text="✏️ Editar", bootstyle=tb.WARNING, command=lambda: self.abrir_modal_editar_paciente(self.get_selected_paciente(tree))).pack(side=tk.LEFT, padx=5)
         tb.Button(actions_frame, text="🗑️ Eliminar", bootstyle=tb.DANGER, command=lambda: self.eliminar_paciente(self.get_selected_paciente(tree))).pack(side=tk.LEFT, padx=5)
-        columns = ("ID", "Nombre", "Apellido", "DNI", "Edad", "Género", "Teléfono", "Email", "Dirección", "Obra Social", "N° Afiliado")
-        style = ttk.Style()
-        style.configure("Treeview.Heading", font=("Helvetica", 11, "bold"), foreground=self.colors['primary'])
-        style.configure("Treeview", font=("Helvetica", 10), rowheight=28)
-        tree = ttk.Treeview(self.main_frame, columns=columns, show='headings', height=15, bootstyle=tb.INFO)
+        tb.Button(actions_frame, text="🩺 Historia Clínica", bootstyle=tb.PRIMARY, command=lambda: self.mostrar_historia_paciente(self.get_selected_paciente(tree))).pack(side=tk.LEFT, padx=5)
+        tb.Button(actions_frame, text="📜 Historial", bootstyle=tb.SECONDARY, command=lambda: self.mostrar_historial('pacientes', (tree.selection() or [None])[0], "Paciente")).pack(side=tk.LEFT, padx=5)
+        tree, _ = self.crear_tabla_listado('pacientes', [
+            ("ID", 'id', 60), ("Nombre", 'nombre', 110), ("Apellido", 'apellido', 110), ("DNI", 'dni', 100),
+            ("Edad", 'edad', 60), ("Género", 'genero', 90), ("Teléfono", 'telefono', 110), ("Email", 'email', 140),
+            ("Dirección", 'direccion', 140), ("Obra Social", 'obra_social', 110), ("N° Afiliado", 'numero_afiliado', 110),
+        ], page_size=page_size, bootstyle=tb.INFO)
+        tree.bind('<Double-1>', lambda e: self.mostrar_historia_paciente(self.get_selected_paciente(tree)))
+        tb.Button(self.main_frame, text="Volver", bootstyle=tb.SECONDARY, command=self.show_home).pack(pady=10)
+
+    def mostrar_historia_paciente(self, paciente, page_size=30):
+        """Consultas del paciente, de la más reciente hacia atrás; las anteriores se cargan al llegar al final."""
+        if not paciente:
+            messagebox.showwarning("Selecciona un paciente", "Por favor selecciona un paciente.")
+            return
+        ventana = tk.Toplevel(self.root)
+        ventana.title(f"Historia clínica - {paciente[1]} {paciente[2]}")
+        ventana.geometry("900x550")
+        ttk.Label(ventana, text=f"{paciente[1]} {paciente[2]} (DNI: {paciente[3]})", font=('Helvetica', 16, 'bold'), foreground=self.colors['primary']).pack(pady=(10, 0))
+        total_label = ttk.Label(ventana, text="", foreground='gray')
+        total_label.pack()
+        tabla = tb.Frame(ventana)
+        tabla.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        columns = ("Fecha", "Prioridad", "Estado", "Motivo", "Médico")
+        tree = ttk.Treeview(tabla, columns=columns, show='headings', height=12)
         for col in columns:
             tree.heading(col, text=col)
-            tree.column(col, width=110)
-        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
-        # Paginación
-        pacientes = db.pacientes()
-        total = len(pacientes)
-        start = (page-1)*page_size
-        end = start+page_size
-        pacientes_pagina = pacientes[start:end]
-        for i in tree.get_children():
-            tree.delete(i)
-        for row in pacientes_pagina:
-            tree.insert('', tk.END, values=row)
-        pag_frame = tb.Frame(self.main_frame)
-        pag_frame.pack(pady=10)
-        def go_prev():
-            if page > 1:
-                self.show_lista_pacientes(page-1, page_size)
-        def go_next():
-            if end < total:
-                self.show_lista_pacientes(page+1, page_size)
-        tb.Button(pag_frame, text="Anterior", bootstyle=tb.SECONDARY, command=go_prev, state=tk.NORMAL if page > 1 else tk.DISABLED).pack(side=tk.LEFT, padx=5)
-        ttk.Label(pag_frame, text=f"Página {page} de {((total-1)//page_size)+1}").pack(side=tk.LEFT, padx=10)
-        tb.Button(pag_frame, text="Siguiente", bootstyle=tb.SECONDARY, command=go_next, state=tk.NORMAL if end < total else tk.DISABLED).pack(side=tk.LEFT, padx=5)
-        tb.Button(self.main_frame, text="Volver", bootstyle=tb.SECONDARY, command=self.show_home).pack(pady=10)
+            tree.column(col, width=240 if col == "Motivo" else 130)
+        scrollbar = ttk.Scrollbar(tabla, orient=tk.VERTICAL, command=tree.yview)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        detalle = tk.Text(ventana, height=6, wrap='word', state='disabled')
+        detalle.pack(fill=tk.X, padx=10, pady=5)
+        total = db.consultas_del_paciente(int(paciente[0]))
+        estado = {'antes': None, 'completa': False, 'filas': {}}
+
+        def cargar_mas():
+            if estado['completa']:
+                return
+            filas = db.historia_paciente(int(paciente[0]), antes=estado['antes'], limite=page_size)
+            for fila in filas:
+                estado['filas'][str(fila.id)] = fila
+                tree.insert('', tk.END, iid=str(fila.id), values=((fila.fecha_consulta or '')[:16], fila.prioridad, fila.estado, fila.motivo, fila.medico))
+            if filas:
+                estado['antes'] = (filas[-1].fecha_consulta, filas[-1].id)
+            estado['completa'] = len(filas) < page_size
+            total_label.config(text=f"{len(estado['filas'])} de {total} consultas")
+
+        def al_desplazar(primero, ultimo):
+            scrollbar.set(primero, ultimo)
+            if float(ultimo) >= 0.95:
+                cargar_mas()
+
+        def mostrar_detalle(event):
+            fila = estado['filas'].get((tree.selection() or [None])[0])
+            detalle.config(state='normal')
+            detalle.delete('1.0', tk.END)
+            if fila:
+                detalle.insert(tk.END, f"Motivo: {fila.motivo or ''}\nDiagnóstico: {fila.diagnostico or ''}\nTratamiento: {fila.tratamiento or ''}")
+            detalle.config(state='disabled')
+
+        tree.configure(yscrollcommand=al_desplazar)
+        tree.bind('<<TreeviewSelect>>', mostrar_detalle)
+        cargar_mas()
+        tb.Button(ventana, text="Cerrar", bootstyle=tb.SECONDARY, command=ventana.destroy).pack(pady=10)
 
     def get_selected_paciente(self, tree):
         selected = tree.selection()
@@ -473,7 +1086,8 @@ class HospitalGuardApp:
             return
         self.abrir_modal_paciente("Editar Paciente", paciente)
 
-    def abrir_modal_paciente(self, titulo, paciente=None):
+    def abrir_modal_paciente(self, titulo, paciente=None, identificar=False, al_guardar=None):
+        """Alta o edición; con identificar=True se completan los datos de un paciente provisorio."""
         modal = tk.Toplevel(self.root)
         modal.title(titulo)
         modal.geometry("500x600")
@@ -510,7 +1124,7 @@ class HospitalGuardApp:
                 if field == "genero":
                     entries[field].set(paciente[5])
                 else:
-                    entries[field].insert(0, paciente[idx+1])
+                    entries[field].insert(0, '' if paciente[idx+1] is None else paciente[idx+1])
         def guardar():
             edad = entries['edad'].get()
             if not edad or not edad.isdigit() or int(edad) <= 0:
@@ -531,18 +1145,275 @@ class HospitalGuardApp:
             if not all([datos['nombre'], datos['apellido'], datos['dni']]):
                 messagebox.showwarning("Campos obligatorios", "Nombre, Apellido y DNI son obligatorios.")
                 return
-            db.actualizar_paciente(paciente[0], datos)
+            if identificar:
+                if not self.confirmar_sin_duplicados(datos):
+                    return  # si ya estaba registrado, corresponde fusionarlo con ese paciente
+                db.actualizar_paciente(paciente[0], datos, identificar=True)
+            elif paciente:
+                db.actualizar_paciente(paciente[0], datos)
+            else:
+                if not self.confirmar_sin_duplicados(datos):
+                    return
+                self.cola.encolar('agregar_paciente', datos)
+                # Espera un momento a que la cola lo aplique para que la lista ya lo muestre
+                if not self.cola.esperar(timeout=0.5):
+                    messagebox.showinfo("Guardado en este puesto",
+                                        "El paciente quedó en la cola de escrituras; aparecerá en la lista cuando la base lo registre.")
+                    modal.destroy()
+                    (al_guardar or self.show_lista_pacientes)()
+                    return
             messagebox.showinfo("Éxito", "Paciente guardado correctamente.")
             modal.destroy()
-            self.show_lista_pacientes()
+            (al_guardar or self.show_lista_pacientes)()
         ttk.Button(modal, text="Guardar", command=guardar).grid(row=len(fields), column=0, pady=20, padx=10)
         ttk.Button(modal, text="Cancelar", command=modal.destroy).grid(row=len(fields), column=1, pady=20, padx=10)
 
+    def confirmar_sin_duplicados(self, datos):
+        """Avisa si el paciente parece ya registrado; devuelve True si se debe guardar igual."""
+        try:
+            candidatos = duplicados.buscar_candidatos(datos)
+        except sqlite3.Error:
+            return True  # sin base no se puede comparar; el alta queda en la cola del puesto
+        if not candidatos:
+            return True
+        lineas = "\n".join(f"• #{p.id} {p.apellido}, {p.nombre} - DNI {p.dni} - {p.edad} años ({puntaje:.0%})"
+                            for puntaje, p in candidatos[:5])
+        return messagebox.askyesno("Posible duplicado",
+                                   f"Se encontraron pacientes parecidos:\n\n{lineas}\n\n¿Registrar de todos modos?")
+
+    def show_duplicados(self):
+        self.clear_main_frame()
+        ttk.Label(self.main_frame, text="Posibles Duplicados", font=('Helvetica', 22, 'bold'), foreground=self.colors['primary']).pack(pady=(10, 0))
+        actions_frame = tb.Frame(self.main_frame)
+        actions_frame.pack(fill=tk.X, pady=10)
+        estado = ttk.Label(actions_frame, text="Buscando duplicados...")
+        columns = ("Similitud", "ID A", "Paciente A", "DNI A", "Edad A", "ID B", "Paciente B", "DNI B", "Edad B")
+        tree = ttk.Treeview(self.main_frame, columns=columns, show='headings', height=18, bootstyle=tb.INFO)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=90 if col.startswith(("ID", "Edad", "Similitud")) else 180)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        def fusionar():
+            seleccion = tree.selection()
+            if not seleccion:
+                messagebox.showwarning("Selecciona un par", "Por favor selecciona un par de pacientes.")
+                return
+            valores = tree.item(seleccion[0])['values']
+            conservar, duplicado = int(valores[1]), int(valores[5])
+            if messagebox.askyesno("Fusionar", f"Se conservará el paciente #{conservar} ({valores[2]}) y se le pasarán "
+                                               f"las consultas de #{duplicado} ({valores[6]}), que será eliminado. ¿Continuar?"):
+                db.fusionar_pacientes(conservar, duplicado)
+                # Quitar todos los pares en los que figuraba el paciente eliminado
+                for item in tree.get_children():
+                    if duplicado in (int(tree.item(item)['values'][1]), int(tree.item(item)['values'][5])):
+                        tree.delete(item)
+
+        tb.Button(actions_frame, text="🔗 Fusionar (conserva A)", bootstyle=tb.WARNING, command=fusionar).pack(side=tk.LEFT, padx=5)
+        estado.pack(side=tk.LEFT, padx=10)
+        tb.Button(self.main_frame, text="Volver", bootstyle=tb.SECONDARY, command=self.show_home).pack(pady=10)
+
+        # El reporte recorre toda la tabla: se calcula en un hilo y se consulta con after()
+        avance = {'bloques': 0}
+        def terminar(pares, error):
+            if not tree.winfo_exists():
+                return
+            if error:
+                estado.config(text=f"Error: {error}")
+                return
+            for puntaje, a, b in pares:
+                tree.insert('', tk.END, values=(f"{puntaje:.0%}", a.id, f"{a.apellido}, {a.nombre}", a.dni, a.edad,
+                                                b.id, f"{b.apellido}, {b.nombre}", b.dni, b.edad))
+            estado.config(text=f"{len(pares)} pares sospechosos")
+        def mostrar_avance():
+            if estado.winfo_exists():
+                estado.config(text=f"Buscando duplicados... ({avance['bloques']} grupos revisados)")
+        self._en_segundo_plano(lambda: duplicados.reporte_duplicados(progreso=lambda n: avance.update(bloques=n)),
+                               terminar, progreso=mostrar_avance)
+
+    def show_ingreso_masivo(self):
+        """Ingreso de víctimas sin identificar, todo desde el teclado, con la cola de triage a la vista."""
+        self.clear_main_frame()
+        ttk.Label(self.main_frame, text="Ingreso Masivo", font=('Helvetica', 22, 'bold'), foreground=self.colors['accent']).pack(pady=(10, 0))
+        ttk.Label(self.main_frame, text="Prioridad 1/2/3 (Alta/Media/Baja) · Sexo M/F/O · Edad estimada · Motivo (opcional) · "
+                                        "Enter registra · Esc limpia", foreground=self.colors['secondary']).pack(pady=(0, 10))
+        ingreso = self.ingreso_rapido
+        form_frame = ttk.Frame(self.main_frame, padding=10)
+        form_frame.pack(fill=tk.X)
+        prioridad_var, genero_var = tk.StringVar(), tk.StringVar()
+        campos = {}
+        for i, (etiqueta, campo, ancho, variable) in enumerate([("Prioridad", 'prioridad', 8, prioridad_var),
+                                                                 ("Sexo", 'genero', 12, genero_var),
+                                                                 ("Edad", 'edad', 6, None),
+                                                                 ("Motivo", 'motivo', 50, None)]):
+            ttk.Label(form_frame, text=etiqueta).grid(row=0, column=i, sticky=tk.W, padx=5)
+            campos[campo] = ttk.Entry(form_frame, width=ancho, textvariable=variable, font=('Helvetica', 14))
+            campos[campo].grid(row=1, column=i, padx=5)
+        codigo_label = ttk.Label(form_frame, text="", font=('Helvetica', 18, 'bold'), foreground=self.colors['primary'])
+        codigo_label.grid(row=1, column=4, padx=20)
+
+        def elegir(mapa, variable, siguiente):
+            # Una tecla elige la opción y pasa al campo siguiente; cualquier otra se ignora
+            def al_tipear(event):
+                if event.char and event.char.lower() in mapa:
+                    variable.set(mapa[event.char.lower()])
+                    campos[siguiente].focus_set()
+                return None if event.keysym in ('Tab', 'ISO_Left_Tab', 'Return', 'Escape') else 'break'
+            return al_tipear
+        campos['prioridad'].bind('<Key>', elegir(ingreso_rapido.PRIORIDADES_TECLA, prioridad_var, 'genero'))
+        campos['genero'].bind('<Key>', elegir(ingreso_rapido.GENEROS_TECLA, genero_var, 'edad'))
+
+        def limpiar(event=None):
+            prioridad_var.set('')
+            genero_var.set('')
+            campos['edad'].delete(0, tk.END)
+            campos['motivo'].delete(0, tk.END)
+            campos['prioridad'].focus_set()
+        def registrar(event=None):
+            edad = campos['edad'].get().strip()
+            if edad and not edad.isdigit():
+                messagebox.showwarning("Edad inválida", "La edad estimada debe ser un número (o quedar vacía).")
+                campos['edad'].focus_set()
+                return
+            codigo = ingreso.registrar(prioridad_var.get() or None, genero_var.get() or None,
+                                       int(edad) if edad else None, campos['motivo'].get())
+            codigo_label.config(text=f"Pulsera: {codigo}")
+            limpiar()
+            mostrar_sesion()
+        for campo in campos.values():
+            campo.bind('<Return>', registrar)
+            campo.bind('<Escape>', limpiar)
+
+        paneles = ttk.Frame(self.main_frame)
+        paneles.pack(fill=tk.BOTH, expand=True, pady=10)
+        sesion_frame = ttk.LabelFrame(paneles, text="Registrados en este puesto", padding=10)
+        sesion_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 5))
+        sesion_tree = ttk.Treeview(sesion_frame, columns=("Código", "Prioridad", "Estado"), show='headings', height=16)
+        for col in ("Código", "Prioridad", "Estado"):
+            sesion_tree.heading(col, text=col)
+            sesion_tree.column(col, width=120)
+        sesion_tree.tag_configure('Rechazado', foreground=self.colors['accent'])
+        sesion_tree.tag_configure('Pendiente', foreground='#e67e22')
+        sesion_tree.pack(fill=tk.BOTH, expand=True)
+        cola_frame = ttk.LabelFrame(paneles, text="Cola de Triage", padding=10)
+        cola_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(5, 0))
+        cola_tree = ttk.Treeview(cola_frame, columns=("Paciente", "Motivo", "Prioridad", "Espera"), show='headings', height=16)
+        for col, ancho in (("Paciente", 180), ("Motivo", 200), ("Prioridad", 80), ("Espera", 80)):
+            cola_tree.heading(col, text=col)
+            cola_tree.column(col, width=ancho)
+        cola_tree.pack(fill=tk.BOTH, expand=True)
+
+        def mostrar_sesion():
+            sesion_tree.delete(*sesion_tree.get_children())
+            for codigo, prioridad, estado in ingreso.estados():
+                sesion_tree.insert('', tk.END, values=(codigo, prioridad, estado), tags=(estado,))
+        def refrescar_sesion():
+            # Sólo mira la cola del puesto: no consulta la base
+            if sesion_tree.winfo_exists():
+                mostrar_sesion()
+                self.root.after(1000, refrescar_sesion)
+        def refrescar_cola():
+            if not cola_tree.winfo_exists():
+                return
+            try:
+                consultas = db.consultas_en_espera_lista()
+            except sqlite3.Error:
+                consultas = None
+            if consultas is not None:
+                cola_tree.delete(*cola_tree.get_children())
+                for _, paciente, motivo, prioridad, minutos in consultas:
+                    cola_tree.insert('', tk.END, values=(paciente, motivo, prioridad, f"{minutos} min"))
+            self.root.after(self.REFRESCO_COLA_TRIAGE_MS, refrescar_cola)
+        refrescar_sesion()
+        refrescar_cola()
+        botones = tb.Frame(self.main_frame)
+        botones.pack(pady=5)
+        tb.Button(botones, text="Identificar Provisorios", bootstyle=tb.INFO, command=self.show_provisorios).pack(side=tk.LEFT, padx=5)
+        tb.Button(botones, text="Volver", bootstyle=tb.SECONDARY, command=self.show_home).pack(side=tk.LEFT, padx=5)
+        campos['prioridad'].focus_set()
+
+    def show_provisorios(self):
+        """Pacientes del ingreso masivo sin identificar: se completan sus datos o se fusionan con el paciente real."""
+        self.clear_main_frame()
+        ttk.Label(self.main_frame, text="Pacientes sin Identificar", font=('Helvetica', 22, 'bold'), foreground=self.colors['primary']).pack(pady=10)
+        columns = ("ID", "Código", "Sexo", "Edad", "Ingreso", "Prioridad", "Estado", "Motivo")
+        tree = ttk.Treeview(self.main_frame, columns=columns, show='headings', height=18, bootstyle=tb.INFO)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=250 if col == "Motivo" else 140 if col in ("Código", "Ingreso") else 90)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        provisorios = {p.id: p for p in db.pacientes_provisorios()}
+        for p in provisorios.values():
+            tree.insert('', tk.END, values=(p.id, p.codigo, p.genero or '', '' if p.edad is None else p.edad,
+                                            p.fecha_registro[:16], p.prioridad or '', p.estado or '', p.motivo or ''))
+
+        def seleccionado():
+            seleccion = tree.selection()
+            if not seleccion:
+                messagebox.showwarning("Selecciona un paciente", "Por favor selecciona un paciente provisorio.")
+                return None
+            return provisorios[int(tree.item(seleccion[0])['values'][0])]
+        def completar():
+            p = seleccionado()
+            if p:
+                # Sólo se precargan sexo y edad estimada: 'NN' y el código no son datos del paciente
+                self.abrir_modal_paciente(f"Identificar {p.codigo}", (p.id, '', '', '', p.edad, p.genero or '', '', '', '', '', ''),
+                                          identificar=True, al_guardar=self.show_provisorios)
+        def fusionar():
+            p = seleccionado()
+            if p:
+                self.abrir_modal_fusionar_provisorio(p)
+        actions_frame = tb.Frame(self.main_frame)
+        actions_frame.pack(pady=10)
+        tb.Button(actions_frame, text="✏️ Completar datos", bootstyle=tb.PRIMARY, command=completar).pack(side=tk.LEFT, padx=5)
+        tb.Button(actions_frame, text="🔗 Es un paciente registrado...", bootstyle=tb.WARNING, command=fusionar).pack(side=tk.LEFT, padx=5)
+        tb.Button(actions_frame, text="Volver", bootstyle=tb.SECONDARY, command=self.show_home).pack(side=tk.LEFT, padx=5)
+
+    def abrir_modal_fusionar_provisorio(self, provisorio):
+        modal = tk.Toplevel(self.root)
+        modal.title(f"Identificar {provisorio.codigo}")
+        modal.geometry("520x420")
+        modal.transient(self.root)
+        modal.grab_set()
+        ttk.Label(modal, text="Buscar el paciente por Nombre, Apellido o DNI:").pack(pady=10)
+        buscar_var = tk.StringVar()
+        entry = ttk.Entry(modal, textvariable=buscar_var, width=40)
+        entry.pack()
+        tree = ttk.Treeview(modal, columns=("ID", "Paciente", "DNI", "Edad"), show='headings', height=10)
+        for col, ancho in (("ID", 60), ("Paciente", 220), ("DNI", 110), ("Edad", 60)):
+            tree.heading(col, text=col)
+            tree.column(col, width=ancho)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        def buscar(*args):
+            tree.delete(*tree.get_children())
+            if len(buscar_var.get().strip()) < 2:
+                return
+            for p in db.pacientes_resumen(buscar_var.get().strip()):
+                if p.id != provisorio.id:
+                    tree.insert('', tk.END, values=(p.id, f"{p.apellido}, {p.nombre}", p.dni or '', '' if p.edad is None else p.edad))
+        entry.bind('<KeyRelease>', buscar)
+        def fusionar():
+            seleccion = tree.selection()
+            if not seleccion:
+                messagebox.showwarning("Selecciona un paciente", "Por favor selecciona el paciente registrado.", parent=modal)
+                return
+            valores = tree.item(seleccion[0])['values']
+            if messagebox.askyesno("Fusionar", f"Las consultas de {provisorio.codigo} pasarán al paciente #{valores[0]} "
+                                               f"({valores[1]}) y se eliminará el registro provisorio. ¿Continuar?", parent=modal):
+                db.fusionar_pacientes(int(valores[0]), provisorio.id)
+                modal.destroy()
+                self.show_provisorios()
+        tb.Button(modal, text="Fusionar", bootstyle=tb.WARNING, command=fusionar).pack(side=tk.LEFT, padx=20, pady=10)
+        tb.Button(modal, text="Cancelar", bootstyle=tb.SECONDARY, command=modal.destroy).pack(side=tk.RIGHT, padx=20, pady=10)
+        entry.focus_set()
+
     def eliminar_paciente(self, paciente):
         if not paciente:
             messagebox.showwarning("Selecciona un paciente", "Por favor selecciona un paciente para eliminar.")
             return
-        if messagebox.askyesno("Confirmar", f"¿Seguro que deseas eliminar a {paciente[1]} {paciente[2]}?"):
+        cantidad = db.consultas_del_paciente(int(paciente[0]))
+        aviso = f"\n\nTambién se eliminarán sus {cantidad} consulta(s)." if cantidad else ""
+        if messagebox.askyesno("Confirmar", f"¿Seguro que deseas eliminar a {paciente[1]} {paciente[2]}?{aviso}"):
             db.eliminar_paciente(paciente[0])
             messagebox.showinfo("Éxito", "Paciente eliminado correctamente.")
             self.show_lista_pacientes()
@@ -616,29 +1487,16 @@ class HospitalGuardApp:
         tb.Button(actions_frame, text="🔍 Buscar", bootstyle=tb.INFO, command=self.abrir_modal_buscar_personal).pack(side=tk.LEFT, padx=5)
         tb.Button(actions_frame, text="✏️ Editar", bootstyle=tb.WARNING, command=lambda: self.abrir_modal_editar_personal(self.get_selected_personal(tree))).pack(side=tk.LEFT, padx=5)
         tb.Button(actions_frame, text="🗑️ Eliminar", bootstyle=tb.DANGER, command=lambda: self.eliminar_personal(self.get_selected_personal(tree))).pack(side=tk.LEFT, padx=5)
+        tb.Button(actions_frame, text="📜 Historial", bootstyle=tb.SECONDARY, command=lambda: self.mostrar_historial('personal', (tree.selection() or [None])[0], "Personal")).pack(side=tk.LEFT, padx=5)
         
         # Tabla de personal
-        columns = ("ID", "Nombre", "Apellido", "Especialidad", "Matrícula", "Turno", "Estado")
-        style = ttk.Style()
-        style.configure("Treeview.Heading", font=("Helvetica", 11, "bold"), foreground=self.colors['primary'])
-        style.configure("Treeview", font=("Helvetica", 10), rowheight=28)
-        tree = ttk.Treeview(self.main_frame, columns=columns, show='headings', height=15, bootstyle=tb.INFO)
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=110)
-        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
-        
-        self.cargar_personal_en_tabla(tree)
+        tree, _ = self.crear_tabla_listado('personal', [
+            ("ID", 'id', 60), ("Nombre", 'nombre', 110), ("Apellido", 'apellido', 110), ("Especialidad", 'especialidad', 130),
+            ("Matrícula", 'matricula', 110), ("Turno", 'turno', 100), ("Estado", 'estado', 110),
+        ], bootstyle=tb.INFO)
         
         tb.Button(self.main_frame, text="Volver", bootstyle=tb.SECONDARY, command=self.show_home).pack(pady=10)
 
-    def cargar_personal_en_tabla(self, tree):
-        for i in tree.get_children():
-            tree.delete(i)
-        personal = db.personal()
-        for row in personal:
-            tree.insert('', tk.END, values=row)
-
     def get_selected_personal(self, tree):
         selected = tree.selection()
         if selected:
@@ -767,18 +1625,133 @@ class HospitalGuardApp:
         self.clear_main_frame()
         ttk.Label(self.main_frame, text="Turnos del Personal", font=('Helvetica', 20, 'bold'), foreground=self.colors['primary']).pack(pady=10)
         
-        columns = ("ID", "Nombre", "Apellido", "Turno", "Estado")
-        tree = ttk.Treeview(self.main_frame, columns=columns, show='headings', height=15)
+        # Personal de guardia en este momento
+        guardia_frame = tb.LabelFrame(self.main_frame, text="De guardia ahora", padding="10")
+        guardia_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+        columns = ("ID", "Nombre", "Apellido", "Especialidad", "Turno", "Inicio", "Fin")
+        tree_guardia = ttk.Treeview(guardia_frame, columns=columns, show='headings', height=6)
+        for col in columns:
+            tree_guardia.heading(col, text=col)
+            tree_guardia.column(col, width=120)
+        tree_guardia.pack(fill=tk.BOTH, expand=True)
+        for row in db.personal_de_guardia():
+            tree_guardia.insert('', tk.END, values=row)
+        
+        # Roster de los próximos 7 días
+        hoy = datetime.combine(datetime.now().date(), datetime.min.time())
+        roster_frame = tb.LabelFrame(self.main_frame, text="Próximos 7 días", padding="10")
+        roster_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+        columns = ("ID", "Personal", "Especialidad", "Turno", "Inicio", "Fin")
+        tree = ttk.Treeview(roster_frame, columns=columns, show='headings', height=10)
         for col in columns:
             tree.heading(col, text=col)
             tree.column(col, width=120)
-        tree.pack(fill=tk.BOTH, expand=True)
-        
-        personal = db.personal()
-        for row in personal:
+        scrollbar = ttk.Scrollbar(roster_frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        for row in db.turnos_rango(hoy, hoy + timedelta(days=7)):
             tree.insert('', tk.END, values=row)
         
-        tb.Button(self.main_frame, text="Volver", command=self.show_home).pack(pady=10)
+        btn_frame = tb.Frame(self.main_frame)
+        btn_frame.pack(pady=10)
+        tb.Button(btn_frame, text="Generar roster...", bootstyle=tb.SUCCESS, command=self.abrir_modal_roster).pack(side=tk.LEFT, padx=5)
+        tb.Button(btn_frame, text="Volver", command=self.show_home).pack(side=tk.LEFT, padx=5)
+
+    def abrir_modal_roster(self):
+        """Semanas, cobertura por turno y especialidad y días no disponibles de cada persona antes de generar el roster."""
+        personal = [p for p in db.personal() if p.estado == 'Activo']
+        cobertura = planificador_turnos.cobertura_por_defecto(personal)
+        especialidades = sorted({esp for por_tipo in cobertura.values() for esp in por_tipo})
+        no_disponible = {}  # personal_id -> {fechas}
+        modal = tk.Toplevel(self.root)
+        modal.title("Generar roster")
+        modal.geometry("720x620")
+        modal.transient(self.root)
+        modal.grab_set()
+
+        fila = tb.Frame(modal)
+        fila.pack(fill=tk.X, padx=10, pady=5)
+        ttk.Label(fila, text="Semanas:").pack(side=tk.LEFT)
+        semanas_entry = ttk.Spinbox(fila, from_=1, to=8, width=4)
+        semanas_entry.set(4)
+        semanas_entry.pack(side=tk.LEFT, padx=5)
+
+        # Personas por turno y especialidad (por defecto, según la dotación activa)
+        cobertura_frame = tb.LabelFrame(modal, text="Cobertura (personas por turno)", padding="10")
+        cobertura_frame.pack(fill=tk.X, padx=10, pady=5)
+        for j, tipo in enumerate(planificador_turnos.TURNOS, start=1):
+            ttk.Label(cobertura_frame, text=tipo).grid(row=0, column=j, padx=5)
+        cantidades = {}
+        for i, especialidad in enumerate(especialidades, start=1):
+            ttk.Label(cobertura_frame, text=especialidad).grid(row=i, column=0, sticky=tk.W, padx=5)
+            for j, tipo in enumerate(planificador_turnos.TURNOS, start=1):
+                entrada = ttk.Spinbox(cobertura_frame, from_=0, to=50, width=4)
+                entrada.set(cobertura[tipo].get(especialidad, 0))
+                entrada.grid(row=i, column=j, padx=5, pady=2)
+                cantidades[(tipo, especialidad)] = entrada
+
+        # Días en que cada persona no puede tomar turnos
+        disponibilidad_frame = tb.LabelFrame(modal, text="No disponible", padding="10")
+        disponibilidad_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        columns = ("ID", "Personal", "Especialidad", "Días no disponible")
+        tree = ttk.Treeview(disponibilidad_frame, columns=columns, show='headings', height=8)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=280 if col == "Días no disponible" else 120)
+        tree.pack(fill=tk.BOTH, expand=True)
+        for p in personal:
+            tree.insert('', tk.END, iid=str(p.id), values=(p.id, f"{p.nombre} {p.apellido}", p.especialidad or 'General', ''))
+        acciones = tb.Frame(disponibilidad_frame)
+        acciones.pack(fill=tk.X, pady=5)
+        fecha_entry = DateEntry(acciones, width=11, date_pattern='dd/mm/yyyy')
+        fecha_entry.pack(side=tk.LEFT)
+
+        def mostrar_dias(personal_id):
+            tree.set(str(personal_id), "Días no disponible",
+                     ', '.join(f"{dia:%d/%m}" for dia in sorted(no_disponible.get(personal_id, ()))))
+
+        def cambiar_dia(agregar):
+            if not tree.selection():
+                messagebox.showwarning("Selecciona personal", "Selecciona una o más personas.", parent=modal)
+                return
+            for iid in tree.selection():
+                dias = no_disponible.setdefault(int(iid), set())
+                if agregar:
+                    dias.add(fecha_entry.get_date())
+                else:
+                    dias.clear()
+                mostrar_dias(int(iid))
+        tb.Button(acciones, text="Agregar día", bootstyle=tb.WARNING, command=lambda: cambiar_dia(True)).pack(side=tk.LEFT, padx=5)
+        tb.Button(acciones, text="Quitar días", bootstyle=tb.SECONDARY, command=lambda: cambiar_dia(False)).pack(side=tk.LEFT, padx=5)
+
+        def generar():
+            try:
+                semanas = int(semanas_entry.get())
+                elegida = {tipo: {} for tipo in planificador_turnos.TURNOS}
+                for (tipo, especialidad), entrada in cantidades.items():
+                    cantidad = int(entrada.get() or 0)
+                    if cantidad > 0:
+                        elegida[tipo][especialidad] = cantidad
+            except ValueError:
+                messagebox.showwarning("Valores inválidos", "Las semanas y la cobertura deben ser números enteros.", parent=modal)
+                return
+            # Desde el próximo turno: los que ya empezaron no se tocan
+            desde = planificador_turnos.proximo_turno(datetime.now())
+            if not messagebox.askyesno("Generar roster", f"Se reemplazarán los turnos de {semanas} semanas a partir del "
+                                                         f"{desde:%d/%m/%Y %H:%M}. ¿Continuar?", parent=modal):
+                return
+            previos = db.turnos_personal(desde - timedelta(hours=planificador_turnos.DESCANSO_MINIMO_HORAS), desde)
+            roster = planificador_turnos.generar_roster(personal, desde, semanas=semanas, cobertura=elegida,
+                                                        no_disponible=no_disponible, previos=previos)
+            roster.guardar()
+            msg = f"Se asignaron {len(roster.asignaciones)} turnos en {roster.segundos:.1f} s."
+            if roster.faltantes:
+                msg += f"\nQuedaron {len(roster.faltantes)} turnos con cobertura incompleta."
+            messagebox.showinfo("Roster generado", msg, parent=modal)
+            modal.destroy()
+            self.show_turnos()
+        tb.Button(modal, text="Generar", bootstyle=tb.SUCCESS, command=generar).pack(pady=10)
 
     def show_inventario(self):
         self.clear_main_frame()
@@ -792,32 +1765,40 @@ class HospitalGuardApp:
         tb.Button(actions_frame, text="🔍 Buscar", bootstyle=tb.INFO, command=self.abrir_modal_buscar_recurso).pack(side=tk.LEFT, padx=5)
         tb.Button(actions_frame, text="✏️ Editar", bootstyle=tb.WARNING, command=lambda: self.abrir_modal_editar_recurso(self.get_selected_recurso(tree))).pack(side=tk.LEFT, padx=5)
         tb.Button(actions_frame, text="🗑️ Eliminar", bootstyle=tb.DANGER, command=lambda: self.eliminar_recurso(self.get_selected_recurso(tree))).pack(side=tk.LEFT, padx=5)
+        tb.Button(actions_frame, text="➖ Consumir", bootstyle=tb.PRIMARY, command=lambda: self.mover_stock_recurso(self.get_selected_recurso(tree), 'consumo')).pack(side=tk.LEFT, padx=5)
+        tb.Button(actions_frame, text="📥 Reponer", bootstyle=tb.PRIMARY, command=lambda: self.mover_stock_recurso(self.get_selected_recurso(tree), 'reposicion')).pack(side=tk.LEFT, padx=5)
+        tb.Button(actions_frame, text="📜 Historial", bootstyle=tb.SECONDARY, command=lambda: self.mostrar_historial('recursos', (tree.selection() or [None])[0], "Recurso")).pack(side=tk.LEFT, padx=5)
         
         # Tabla de recursos
-        columns = ("ID", "Tipo", "Nombre", "Cantidad", "Estado")
-        style = ttk.Style()
-        style.configure("Treeview.Heading", font=("Helvetica", 11, "bold"), foreground=self.colors['primary'])
-        style.configure("Treeview", font=("Helvetica", 10), rowheight=28)
-        tree = ttk.Treeview(self.main_frame, columns=columns, show='headings', height=15, bootstyle=tb.INFO)
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=120)
-        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
-        
-        self.cargar_recursos_en_tabla(tree)
+        tree, _ = self.crear_tabla_listado('recursos', [
+            ("ID", 'id', 60), ("Tipo", 'tipo', 120), ("Nombre", 'nombre', 140), ("Cantidad", 'cantidad', 100),
+            ("Estado", 'estado', 120), ("Mínimo", 'stock_minimo', 100),
+        ], etiquetas=self.etiquetas_recurso, bootstyle=tb.INFO)
+        tree.tag_configure('critico', background='#ffcccc')
         
         tb.Button(self.main_frame, text="Volver", bootstyle=tb.SECONDARY, command=self.show_home).pack(pady=10)
 
-    def cargar_recursos_en_tabla(self, tree):
-        for i in tree.get_children():
-            tree.delete(i)
-        recursos = db.recursos()
-        for row in recursos:
-            tags = ()
-            if row[3] is not None and row[3] <= 5:
-                tags = ('critico',)
-            tree.insert('', tk.END, values=row, tags=tags)
-        tree.tag_configure('critico', background='#ffcccc')
+    @staticmethod
+    def etiquetas_recurso(row):
+        if row.cantidad is not None and row.cantidad <= row.stock_minimo:
+            return ('critico',)
+        return ()
+
+    def mover_stock_recurso(self, recurso, tipo):
+        if not recurso:
+            messagebox.showwarning("Selecciona un recurso", "Por favor selecciona un recurso.")
+            return
+        accion = "consumir" if tipo == 'consumo' else "reponer"
+        cantidad = simpledialog.askinteger("Stock", f"Cantidad a {accion} de '{recurso[2]}':", parent=self.root, minvalue=1)
+        if not cantidad:
+            return
+        if tipo == 'consumo':
+            if not db.consumir_recurso(recurso[0], cantidad):
+                messagebox.showwarning("Stock insuficiente", f"No hay stock suficiente de '{recurso[2]}'.")
+                return
+        else:
+            db.reponer_recurso(recurso[0], cantidad)
+        self.show_inventario()
 
     def get_selected_recurso(self, tree):
         selected = tree.selection()
@@ -845,7 +1826,8 @@ class HospitalGuardApp:
             ("Tipo:", "tipo"),
             ("Nombre:", "nombre"),
             ("Cantidad:", "cantidad"),
-            ("Estado:", "estado")
+            ("Estado:", "estado"),
+            ("Stock mínimo:", "stock_minimo")
         ]
         entries = {}
         for i, (label, field) in enumerate(fields):
@@ -872,17 +1854,22 @@ class HospitalGuardApp:
                 'tipo': entries['tipo'].get(),
                 'nombre': entries['nombre'].get(),
                 'cantidad': entries['cantidad'].get(),
-                'estado': entries['estado'].get()
+                'estado': entries['estado'].get(),
+                'stock_minimo': entries['stock_minimo'].get() or 5
             }
             if not all([datos['tipo'], datos['nombre'], datos['cantidad']] ):
                 messagebox.showwarning("Campos obligatorios", "Tipo, Nombre y Cantidad son obligatorios.")
                 return
             try:
-                cantidad_int = int(datos['cantidad'])
+                datos['cantidad'] = int(datos['cantidad'])
+                datos['stock_minimo'] = int(datos['stock_minimo'])
             except ValueError:
-                messagebox.showwarning("Cantidad inválida", "La cantidad debe ser un número entero.")
+                messagebox.showwarning("Cantidad inválida", "La cantidad y el stock mínimo deben ser números enteros.")
                 return
-            db.actualizar_recurso(recurso[0], datos)
+            if recurso:
+                db.actualizar_recurso(recurso[0], datos)
+            else:
+                db.agregar_recurso(datos)
             messagebox.showinfo("Éxito", "Recurso guardado correctamente.")
             modal.destroy()
             self.show_inventario()
@@ -924,7 +1911,7 @@ class HospitalGuardApp:
         actions_frame = tb.Frame(self.main_frame)
         actions_frame.pack(fill=tk.X, pady=10)
         tb.Button(actions_frame, text="Volver a lista completa", bootstyle=tb.SECONDARY, command=self.show_inventario).pack(side=tk.LEFT, padx=5)
-        columns = ("ID", "Tipo", "Nombre", "Cantidad", "Estado")
+        columns = ("ID", "Tipo", "Nombre", "Cantidad", "Estado", "Mínimo")
         style = ttk.Style()
         style.configure("Treeview.Heading", font=("Helvetica", 11, "bold"), foreground=self.colors['primary'])
         style.configure("Treeview", font=("Helvetica", 10), rowheight=28)
@@ -935,17 +1922,14 @@ class HospitalGuardApp:
         tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         recursos = db.recursos_filtrado(valor)
         for row in recursos:
-            tags = ()
-            if row[3] is not None and row[3] <= 5:
-                tags = ('critico',)
-            tree.insert('', tk.END, values=row, tags=tags)
+            tree.insert('', tk.END, values=row, tags=self.etiquetas_recurso(row))
         tree.tag_configure('critico', background='#ffcccc')
         tb.Button(self.main_frame, text="Volver", bootstyle=tb.SECONDARY, command=self.show_home).pack(pady=10)
 
     def show_alertas(self):
         self.clear_main_frame()
         ttk.Label(self.main_frame, text="Alertas de Recursos", font=('Helvetica', 22, 'bold'), foreground=self.colors['accent']).pack(pady=(10, 0))
-        columns = ("ID", "Tipo", "Nombre", "Cantidad", "Estado")
+        columns = ("ID", "Tipo", "Nombre", "Cantidad", "Estado", "Mínimo")
         style = ttk.Style()
         style.configure("Treeview.Heading", font=("Helvetica", 11, "bold"), foreground=self.colors['accent'])
         style.configure("Treeview", font=("Helvetica", 10), rowheight=28)
@@ -957,49 +1941,59 @@ class HospitalGuardApp:
         recursos = db.recursos_criticos_lista()
         for row in recursos:
             tree.insert('', tk.END, values=row)
+        # Pronóstico: recursos que todavía tienen stock pero se agotarán pronto
+        ttk.Label(self.main_frame, text=f"Se agotarán en las próximas {prediccion_stock.UMBRAL_HORAS} horas", font=('Helvetica', 16, 'bold'), foreground=self.colors['accent']).pack(pady=(10, 0))
+        columns = ("ID", "Tipo", "Nombre", "Cantidad", "Consumo/hora", "Se agota en")
+        tree_pronostico = ttk.Treeview(self.main_frame, columns=columns, show='headings', height=8, bootstyle=tb.WARNING)
+        for col in columns:
+            tree_pronostico.heading(col, text=col)
+            tree_pronostico.column(col, width=120)
+        tree_pronostico.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        for id_, tipo, nombre, cantidad, tasa, horas in prediccion_stock.alertas_agotamiento():
+            tree_pronostico.insert('', tk.END, values=(id_, tipo, nombre, cantidad, f"{tasa:.1f}", f"{horas:.1f} h"))
         tb.Button(self.main_frame, text="Volver", bootstyle=tb.SECONDARY, command=self.show_home).pack(pady=10)
 
-    def show_lista_consultas(self, page=1, page_size=50):
+    def show_lista_consultas(self, page_size=50):
         self.clear_main_frame()
         ttk.Label(self.main_frame, text="Lista de Consultas", font=('Helvetica', 22, 'bold'), foreground=self.colors['primary']).pack(pady=(10, 0))
-        columns = ("ID", "Paciente", "Fecha", "Motivo", "Prioridad", "Médico", "Estado")
-        style = ttk.Style()
-        style.configure("Treeview.Heading", font=("Helvetica", 11, "bold"), foreground=self.colors['primary'])
-        style.configure("Treeview", font=("Helvetica", 10), rowheight=28)
-        tree = ttk.Treeview(self.main_frame, columns=columns, show='headings', height=15)
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=120)
-        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
-        consultas = db.consultas()
-        total = len(consultas)
-        start = (page-1)*page_size
-        end = start+page_size
-        consultas_pagina = consultas[start:end]
-        for row in consultas_pagina:
-            tree.insert('', tk.END, values=row)
+        # Por defecto las consultas de los últimos 7 días; "Todo" vuelve a la lista completa
+        periodo = {'rango': (datetime.now() - timedelta(days=7), db.rango_dia()[1])}
+        def cambiar_periodo(desde, hasta):
+            periodo['rango'] = (desde, hasta) if desde else None
+            recargar_lista()
+        self.crear_selector_rango(self.main_frame, *periodo['rango'], cambiar_periodo, con_todo=True)
+        tree, recargar_lista = self.crear_tabla_listado('consultas', [
+            ("ID", 'id', 70), ("Paciente", 'paciente', 160), ("Fecha", 'fecha_consulta', 150), ("Motivo", 'motivo', 160),
+            ("Prioridad", 'prioridad', 90), ("Médico", 'medico', 130), ("Estado", 'estado', 100),
+        ], page_size=page_size, rango=lambda: periodo['rango'], selectmode='extended')
+        tree.bind('<Control-a>', lambda e: tree.selection_set(tree.get_children()))
+
+        # --- Cambios sobre todas las consultas seleccionadas (Ctrl/Shift + clic, Ctrl+A) ---
+        def seleccionadas():
+            ids = [int(iid) for iid in tree.selection()]
+            if not ids:
+                messagebox.showwarning("Selecciona una consulta", "Por favor selecciona una o más consultas.")
+            return ids
 
-        # --- Botón para marcar como atendido ---
         def cambiar_estado(nuevo_estado):
-            selected = tree.selection()
-            if not selected:
-                messagebox.showwarning("Selecciona una consulta", "Por favor selecciona una consulta.")
+            ids = seleccionadas()
+            if not ids:
                 return
-            consulta = tree.item(selected[0])['values']
-            db.actualizar_estado_consulta(consulta[0], nuevo_estado)
-            messagebox.showinfo("Éxito", f"Consulta marcada como {nuevo_estado}.")
-            self.show_lista_consultas(page, page_size)
+            cambiadas = db.actualizar_estado_consultas(ids, nuevo_estado)
+            # Refrescar sólo las filas tocadas, sin reconstruir la vista
+            for fila in db.consultas_por_ids(ids):
+                tree.item(str(fila.id), values=fila)
+            resultado_label.config(text=f"{cambiadas} consulta(s) marcadas como {nuevo_estado}.")
 
         def eliminar_consulta():
-            selected = tree.selection()
-            if not selected:
-                messagebox.showwarning("Selecciona una consulta", "Por favor selecciona una consulta para eliminar.")
+            ids = seleccionadas()
+            if not ids:
                 return
-            consulta = tree.item(selected[0])['values']
-            if messagebox.askyesno("Confirmar", f"¿Seguro que deseas eliminar la consulta de {consulta[1]}?"):
-                db.eliminar_consulta(consulta[0])
-                messagebox.showinfo("Eliminado", "Consulta eliminada correctamente.")
-                self.show_lista_consultas(page, page_size)
+            detalle = tree.item(str(ids[0]))['values'][1] if len(ids) == 1 else f"{len(ids)} consultas"
+            if messagebox.askyesno("Confirmar", f"¿Seguro que deseas eliminar {'la consulta de ' if len(ids) == 1 else ''}{detalle}?"):
+                eliminadas = db.eliminar_consultas(ids)
+                tree.delete(*[str(i) for i in ids])
+                resultado_label.config(text=f"{eliminadas} consulta(s) eliminadas.")
 
         btn_frame = tb.Frame(self.main_frame)
         btn_frame.pack(pady=5)
@@ -1007,30 +2001,212 @@ class HospitalGuardApp:
         tb.Button(btn_frame, text="En Espera", bootstyle=tb.INFO, command=lambda: cambiar_estado("En espera")).pack(side=tk.LEFT, padx=5)
         tb.Button(btn_frame, text="Cancelada", bootstyle=tb.WARNING, command=lambda: cambiar_estado("Cancelada")).pack(side=tk.LEFT, padx=5)
         tb.Button(btn_frame, text="Eliminar", bootstyle=tb.DANGER, command=eliminar_consulta).pack(side=tk.LEFT, padx=5)
+        tb.Button(btn_frame, text="📜 Historial", bootstyle=tb.SECONDARY, command=lambda: self.mostrar_historial('consultas', (tree.selection() or [None])[0], "Consulta")).pack(side=tk.LEFT, padx=5)
+        resultado_label = ttk.Label(btn_frame, text="", foreground=self.colors['secondary'])
+        resultado_label.pack(side=tk.LEFT, padx=10)
 
-        # Paginación y volver (igual que antes)
-        pag_frame = tb.Frame(self.main_frame)
-        pag_frame.pack(pady=10)
-        def go_prev():
-            if page > 1:
-                self.show_lista_consultas(page-1, page_size)
-        def go_next():
-            if end < total:
-                self.show_lista_consultas(page+1, page_size)
-        tb.Button(pag_frame, text="Anterior", bootstyle=tb.SECONDARY, command=go_prev, state=tk.NORMAL if page > 1 else tk.DISABLED).pack(side=tk.LEFT, padx=5)
-        ttk.Label(pag_frame, text=f"Página {page} de {((total-1)//page_size)+1}").pack(side=tk.LEFT, padx=10)
-        tb.Button(pag_frame, text="Siguiente", bootstyle=tb.SECONDARY, command=go_next, state=tk.NORMAL if end < total else tk.DISABLED).pack(side=tk.LEFT, padx=5)
         tb.Button(self.main_frame, text="Volver", bootstyle=tb.SECONDARY, command=self.show_home).pack(pady=10)
 
+    def show_ocupacion(self):
+        self.clear_main_frame()
+        ttk.Label(self.main_frame, text="Ocupación de Boxes y Camas", font=('Helvetica', 22, 'bold'), foreground=self.colors['primary']).pack(pady=(10, 0))
+        
+        # Contadores por tipo (mantenidos por la base, no se recorre el historial)
+        contadores = tb.Frame(self.main_frame)
+        contadores.pack(pady=10)
+        for i, (tipo, total, ocupadas) in enumerate(db.contadores_ocupacion()):
+            self.create_stat_card(contadores, f"{tipo}: libres de {total}", total - ocupadas, "🛏️", i,
+                                  color=self.colors['accent'] if ocupadas >= total else self.colors['secondary'])
+        
+        # Una tarjeta por ubicación: clic en una libre para ubicar a un paciente en espera, en una ocupada para liberarla
+        grilla = tb.Frame(self.main_frame)
+        grilla.pack(fill=tk.X, padx=20, pady=10)
+        for i, u in enumerate(db.ubicaciones_estado()):
+            if u.ocupacion_id is None:
+                texto, estilo = f"{u.nombre}\nLibre", tb.SUCCESS
+                accion = lambda u=u: self.asignar_ubicacion(u)
+            else:
+                texto, estilo = f"{u.nombre}\n{u.paciente or 'Ocupada'}\n{u.prioridad or ''} · desde {u.desde[11:16]}", tb.DANGER
+                accion = lambda u=u: self.liberar_ubicacion(u)
+            tb.Button(grilla, text=texto, bootstyle=estilo, width=18, command=accion).grid(row=i // 6, column=i % 6, padx=5, pady=5, sticky='nsew')
+        
+        # Consulta histórica: quién ocupaba qué en un momento dado
+        momento_frame = tb.Frame(self.main_frame)
+        momento_frame.pack(pady=5)
+        ttk.Label(momento_frame, text="Ocupadas en (AAAA-MM-DD HH:MM):").pack(side=tk.LEFT, padx=5)
+        momento_entry = ttk.Entry(momento_frame, width=18)
+        momento_entry.insert(0, datetime.now().strftime('%Y-%m-%d %H:%M'))
+        momento_entry.pack(side=tk.LEFT, padx=5)
+        def buscar_momento():
+            try:
+                momento = datetime.strptime(momento_entry.get().strip(), '%Y-%m-%d %H:%M')
+            except ValueError:
+                messagebox.showerror("Fecha inválida", "Usa el formato AAAA-MM-DD HH:MM.")
+                return
+            ventana = tk.Toplevel(self.root)
+            ventana.title(f"Ocupadas el {momento:%d/%m/%Y %H:%M}")
+            ventana.geometry("800x350")
+            columns = ("Ubicación", "Tipo", "Paciente", "Prioridad", "Desde", "Hasta")
+            tree = ttk.Treeview(ventana, columns=columns, show='headings', height=12)
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, width=130)
+            tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+            for o in db.ocupadas_en(momento):
+                tree.insert('', tk.END, values=(o.ubicacion, o.tipo, o.paciente or '', o.prioridad or '', o.desde[:16], (o.hasta or '')[:16]))
+            tb.Button(ventana, text="Cerrar", bootstyle=tb.SECONDARY, command=ventana.destroy).pack(pady=10)
+        tb.Button(momento_frame, text="Buscar", bootstyle=tb.INFO, command=buscar_momento).pack(side=tk.LEFT, padx=5)
+        
+        # Ocupación de las últimas 24 horas
+        grafico_frame = tb.Frame(self.main_frame)
+        grafico_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
+        hasta = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        serie = db.ocupacion_en_el_tiempo(hasta - timedelta(hours=24), hasta, timedelta(minutes=30))
+        fig, ax = plt.subplots(figsize=(12, 3))
+        for tipo in sorted({tipo for _, por_tipo in serie for tipo in por_tipo}):
+            ax.step([m for m, _ in serie], [por_tipo.get(tipo, 0) for _, por_tipo in serie], where='post', label=tipo)
+        ax.set_title('Ubicaciones ocupadas (últimas 24 h)')
+        if serie:
+            ax.legend(loc='upper left')
+        plt.tight_layout()
+        canvas = FigureCanvasTkAgg(fig, master=grafico_frame)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        
+        btn_frame = tb.Frame(self.main_frame)
+        btn_frame.pack(pady=10)
+        tb.Button(btn_frame, text="➕ Nueva Ubicación", bootstyle=tb.SUCCESS, command=self.abrir_modal_nueva_ubicacion).pack(side=tk.LEFT, padx=5)
+        tb.Button(btn_frame, text="Actualizar", bootstyle=tb.INFO, command=self.show_ocupacion).pack(side=tk.LEFT, padx=5)
+        tb.Button(btn_frame, text="Volver", bootstyle=tb.SECONDARY, command=self.show_home).pack(side=tk.LEFT, padx=5)
+
+    def asignar_ubicacion(self, ubicacion):
+        en_espera = db.consultas_en_espera_lista()
+        if not en_espera:
+            messagebox.showinfo("Sin pacientes", "No hay pacientes en espera.")
+            return
+        modal = tk.Toplevel(self.root)
+        modal.title(f"Ubicar en {ubicacion.nombre}")
+        modal.geometry("600x350")
+        columns = ('ID', 'Paciente', 'Motivo', 'Prioridad', 'Espera')
+        tree = ttk.Treeview(modal, columns=columns, show='headings', height=10)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=110)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        for id_, paciente, motivo, prioridad, minutos in en_espera:
+            tree.insert('', tk.END, iid=str(id_), values=(id_, paciente, motivo, prioridad, f"{minutos} min"))
+        def ubicar():
+            if not tree.selection():
+                messagebox.showwarning("Selecciona una consulta", "Por favor selecciona un paciente.", parent=modal)
+                return
+            try:
+                if db.ocupar_ubicacion(ubicacion.id, int(tree.selection()[0])) is None:
+                    messagebox.showerror("Ocupada", f"{ubicacion.nombre} fue ocupada desde otro puesto.", parent=modal)
+            except ValueError:
+                messagebox.showerror("Dada de baja", f"{ubicacion.nombre} fue dada de baja desde otro puesto.", parent=modal)
+            modal.destroy()
+            self.show_ocupacion()
+        tb.Button(modal, text="Ubicar", bootstyle=tb.SUCCESS, command=ubicar).pack(pady=10)
+
+    def liberar_ubicacion(self, ubicacion):
+        if messagebox.askyesno("Liberar", f"¿Liberar {ubicacion.nombre} ({ubicacion.paciente or 'sin paciente'})?"):
+            db.liberar_ubicacion(ubicacion.id)
+            self.show_ocupacion()
+
+    def abrir_modal_nueva_ubicacion(self):
+        modal = tk.Toplevel(self.root)
+        modal.title("Nueva Ubicación")
+        modal.geometry("350x220")
+        ttk.Label(modal, text="Nombre:").grid(row=0, column=0, padx=10, pady=5, sticky='w')
+        nombre = ttk.Entry(modal)
+        nombre.grid(row=0, column=1, padx=10, pady=5)
+        ttk.Label(modal, text="Tipo:").grid(row=1, column=0, padx=10, pady=5, sticky='w')
+        tipo = ttk.Combobox(modal, values=db.TIPOS_UBICACION, state='readonly')
+        tipo.set(db.TIPOS_UBICACION[0])
+        tipo.grid(row=1, column=1, padx=10, pady=5)
+        ttk.Label(modal, text="Sector:").grid(row=2, column=0, padx=10, pady=5, sticky='w')
+        sector = ttk.Entry(modal)
+        sector.grid(row=2, column=1, padx=10, pady=5)
+        def guardar():
+            if not nombre.get().strip():
+                messagebox.showerror("Error", "El nombre es obligatorio.", parent=modal)
+                return
+            try:
+                db.agregar_ubicacion({'nombre': nombre.get().strip(), 'tipo': tipo.get(), 'sector': sector.get().strip() or None})
+            except sqlite3.IntegrityError:
+                messagebox.showerror("Error", "Ya existe una ubicación con ese nombre.", parent=modal)
+                return
+            modal.destroy()
+            self.show_ocupacion()
+        tb.Button(modal, text="Guardar", bootstyle=tb.SUCCESS, command=guardar).grid(row=3, column=0, columnspan=2, pady=15)
+
+    def mostrar_historial(self, tabla, registro_id, titulo):
+        """Cambios registrados en la auditoría para un registro."""
+        if registro_id is None:
+            messagebox.showwarning("Selecciona un registro", "Por favor selecciona un registro.")
+            return
+        ventana = tk.Toplevel(self.root)
+        ventana.title(f"Historial - {titulo}")
+        ventana.geometry("900x400")
+        self.tabla_auditoria(ventana, db.historial_registro(tabla, int(registro_id)))
+        tb.Button(ventana, text="Cerrar", bootstyle=tb.SECONDARY, command=ventana.destroy).pack(pady=10)
+
+    def show_auditoria_usuario(self, dias=7):
+        self.clear_main_frame()
+        ttk.Label(self.main_frame, text="Auditoría por usuario", font=('Helvetica', 22, 'bold'), foreground=self.colors['primary']).pack(pady=(10, 0))
+        filtro = tb.Frame(self.main_frame)
+        filtro.pack(pady=10)
+        ttk.Label(filtro, text="Usuario:").pack(side=tk.LEFT, padx=5)
+        usuario = ttk.Entry(filtro, width=20)
+        usuario.insert(0, db.usuario_actual() or '')
+        usuario.pack(side=tk.LEFT, padx=5)
+        ttk.Label(filtro, text="Últimos días:").pack(side=tk.LEFT, padx=5)
+        dias_entry = ttk.Spinbox(filtro, from_=1, to=365, width=5)
+        dias_entry.set(dias)
+        dias_entry.pack(side=tk.LEFT, padx=5)
+        resultados = tb.Frame(self.main_frame)
+        def buscar():
+            for widget in resultados.winfo_children():
+                widget.destroy()
+            hasta = datetime.now() + timedelta(seconds=1)
+            desde = hasta - timedelta(days=int(dias_entry.get() or dias))
+            self.tabla_auditoria(resultados, db.acciones_usuario(usuario.get().strip(), desde, hasta), con_registro=True)
+        tb.Button(filtro, text="Buscar", bootstyle=tb.INFO, command=buscar).pack(side=tk.LEFT, padx=5)
+        resultados.pack(fill=tk.BOTH, expand=True)
+        buscar()
+        tb.Button(self.main_frame, text="Volver", bootstyle=tb.SECONDARY, command=self.show_home).pack(pady=10)
+
+    def tabla_auditoria(self, padre, entradas, con_registro=False):
+        columns = ("Fecha", "Usuario") + (("Registro",) if con_registro else ()) + ("Acción", "Cambios")
+        tree = ttk.Treeview(padre, columns=columns, show='headings', height=12)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=500 if col == "Cambios" else 140)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        for e in entradas:
+            if e.accion == 'modificacion' and e.antes and e.despues:
+                cambios = ", ".join(f"{campo}: {e.antes.get(campo)} → {valor}" for campo, valor in e.despues.items())
+            else:
+                cambios = ", ".join(f"{campo}: {valor}" for campo, valor in (e.despues or e.antes or {}).items())
+            registro = ((f"{e.tabla} {e.registro_id or ''}",) if con_registro else ())
+            tree.insert('', tk.END, values=(e.fecha[:19], e.usuario or '') + registro + (e.accion, cambios))
+        return tree
+
     def clear_main_frame(self):
         for widget in self.main_frame.winfo_children():
             widget.destroy()
 
-    def grafico_consultas_por_prioridad(self, ax):
-        """Dibuja un gráfico de barras de consultas por prioridad en el eje ax."""
-        prioridades = db.obtener_estadisticas_prioridad()
-        prioridades_labels = [p[0] for p in prioridades]
-        cantidades = [p[1] for p in prioridades]
+    def grafico_consultas_por_prioridad(self, ax, desde=None, hasta=None, resumen=None):
+        """
+        Dibuja un gráfico de barras de consultas por prioridad en [desde, hasta) (por defecto,
+        hoy) en el eje ax; con `resumen` (analitica.Resumen), las de su período.
+        """
+        if resumen is not None:
+            prioridades = [ConteoPrioridad(p, int(n)) for p, n in resumen.mix_prioridad.sum().items()]
+        else:
+            prioridades = db.obtener_estadisticas_prioridad(desde, hasta)
+        prioridades_labels = [p.prioridad for p in prioridades]
+        cantidades = [p.cantidad for p in prioridades]
         ax.clear()
         ax.bar(prioridades_labels, cantidades, color='#3498db')
         ax.set_title('Consultas por Prioridad')
@@ -1039,8 +2215,8 @@ class HospitalGuardApp:
     def grafico_recursos_por_estado(self, ax):
         """Dibuja un gráfico de torta de recursos por estado en el eje ax."""
         recursos_estado = db.obtener_estadisticas_recursos_estado()
-        labels = [r[0] for r in recursos_estado]
-        sizes = [r[1] for r in recursos_estado]
+        labels = [r.estado for r in recursos_estado]
+        sizes = [r.cantidad for r in recursos_estado]
         colors = ['#2ecc71','#e67e22','#e74c3c','#95a5a6']
         ax.clear()
         if sizes:
@@ -1081,7 +2257,7 @@ class LoginWindow:
         password = self.pass_entry.get()
         if db.verificar_usuario(usuario, password):
             self.frame.destroy()
-            self.on_login_success()
+            self.on_login_success(usuario)
         else:
             messagebox.showerror("Error", "Usuario o contraseña incorrectos")
 
@@ -1100,7 +2276,7 @@ if __name__ == "__main__":
     import db
     db.init_db()  # Inicializa la base de datos y todas las tablas antes de cualquier operación
     root = tk.Tk()
-    def start_app():
-        app = HospitalGuardApp(root)
+    def start_app(usuario):
+        app = HospitalGuardApp(root, usuario)
     LoginWindow(root, start_app)
     root.mainloop()
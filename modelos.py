@@ -0,0 +1,232 @@
+"""
+Tipos de fila que devuelve db.py.
+Son NamedTuple: se acceden por nombre (p.edad, r.cantidad) pero siguen siendo
+tuplas, sin diccionario por instancia, y se pueden pasar tal cual a un Treeview.
+"""
+from typing import NamedTuple, Optional, Union
+
+
+class Paciente(NamedTuple):
+    id: int
+    nombre: str
+    apellido: str
+    dni: Optional[str]
+    edad: Optional[int]
+    genero: Optional[str]
+    telefono: Optional[str]
+    email: Optional[str]
+    direccion: Optional[str]
+    obra_social: Optional[str]
+    numero_afiliado: Optional[str]
+
+
+class PacienteResumen(NamedTuple):
+    """Lo mínimo para elegir un paciente en un formulario."""
+    id: int
+    nombre: str
+    apellido: str
+    dni: Optional[str]
+    edad: Optional[int]
+
+    def etiqueta(self):
+        return f"{self.id} - {self.nombre} {self.apellido} (DNI: {self.dni})"
+
+
+class Consulta(NamedTuple):
+    id: int
+    paciente: str
+    fecha_consulta: str
+    motivo: str
+    prioridad: str
+    medico: str
+    estado: str
+
+
+class ConsultaReciente(NamedTuple):
+    id: int
+    paciente: str
+    fecha_consulta: str
+    motivo: str
+    prioridad: str
+    estado: str
+
+
+class ConsultaPaciente(NamedTuple):
+    """Una consulta en la historia clínica de un paciente."""
+    id: int
+    fecha_consulta: Optional[str]
+    motivo: Optional[str]
+    diagnostico: Optional[str]
+    tratamiento: Optional[str]
+    medico: Optional[str]
+    estado: Optional[str]
+    prioridad: Optional[str]
+
+
+class ConsultaEnEspera(NamedTuple):
+    id: int
+    paciente: str
+    motivo: str
+    prioridad: str
+    minutos_espera: int
+
+
+class Personal(NamedTuple):
+    id: int
+    nombre: str
+    apellido: str
+    especialidad: Optional[str]
+    matricula: Optional[str]
+    turno: Optional[str]
+    estado: Optional[str]
+
+
+class Recurso(NamedTuple):
+    id: int
+    tipo: str
+    nombre: str
+    cantidad: Optional[int]
+    estado: Optional[str]
+    stock_minimo: int
+
+
+class CargaMedico(NamedTuple):
+    medico: str
+    especialidad: Optional[str]
+    abiertas: int
+    carga: int
+
+
+class EntradaAuditoria(NamedTuple):
+    """Un cambio registrado en auditoria; antes y después son dicts (sólo los campos que cambiaron en una modificación)."""
+    id: int
+    fecha: str
+    usuario: Optional[str]
+    tabla: str
+    registro_id: Optional[int]
+    accion: str
+    antes: Optional[dict]
+    despues: Optional[dict]
+
+
+class Ubicacion(NamedTuple):
+    """Box, cama o sillón con quien la ocupa ahora (campos de la ocupación en None si está libre)."""
+    id: int
+    nombre: str
+    tipo: str
+    sector: Optional[str]
+    ocupacion_id: Optional[int]
+    consulta_id: Optional[int]
+    paciente: Optional[str]
+    prioridad: Optional[str]
+    desde: Optional[str]
+
+
+class Ocupacion(NamedTuple):
+    ubicacion_id: int
+    ubicacion: str
+    tipo: str
+    sector: Optional[str]
+    ocupacion_id: int
+    consulta_id: Optional[int]
+    paciente: Optional[str]
+    prioridad: Optional[str]
+    desde: str
+    hasta: Optional[str]
+
+
+class ConteoSintoma(NamedTuple):
+    codigo: str
+    descripcion: str
+    prioridad: str
+    cantidad: int
+
+
+class ConsultaTriage(NamedTuple):
+    """Una consulta en el historial de triage, con los minutos hasta su primera atención (None si no fue atendida)."""
+    id: int
+    paciente: str
+    fecha_consulta: str
+    motivo: Optional[str]
+    prioridad: Optional[str]
+    medico: Optional[str]
+    estado: Optional[str]
+    espera: Optional[int]
+
+
+class PacienteProvisorio(NamedTuple):
+    """Paciente ingresado sin identificar (ingreso masivo) con su última consulta."""
+    id: int
+    codigo: str
+    genero: Optional[str]
+    edad: Optional[int]
+    fecha_registro: str
+    prioridad: Optional[str]
+    estado: Optional[str]
+    motivo: Optional[str]
+
+
+class EventoConsulta(NamedTuple):
+    estado_anterior: Optional[str]
+    estado_nuevo: str
+    prioridad: Optional[str]
+    fecha: str
+
+
+class DistribucionEspera(NamedTuple):
+    """Minutos hasta la atención de un grupo (prioridad u hora de ingreso)."""
+    grupo: Union[str, int, None]
+    atendidas: int
+    p50: float
+    p90: float
+    p99: float
+
+
+class ContadorOcupacion(NamedTuple):
+    tipo: str
+    total: int
+    ocupadas: int
+
+
+class Turno(NamedTuple):
+    id: int
+    personal: str
+    especialidad: Optional[str]
+    tipo: str
+    inicio: str
+    fin: str
+
+
+class TurnoPersonal(NamedTuple):
+    personal_id: int
+    inicio: str
+    fin: str
+    tipo: str
+
+
+class PersonalDeGuardia(NamedTuple):
+    id: int
+    nombre: str
+    apellido: str
+    especialidad: Optional[str]
+    turno: str
+    inicio: str
+    fin: str
+
+
+class MovimientoRecurso(NamedTuple):
+    id: int
+    tipo: str
+    cantidad: int
+    usuario: Optional[str]
+    fecha: str
+
+
+class ConteoPrioridad(NamedTuple):
+    prioridad: Optional[str]
+    cantidad: int
+
+
+class ConteoEstado(NamedTuple):
+    estado: Optional[str]
+    cantidad: int
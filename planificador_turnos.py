@@ -0,0 +1,217 @@
+"""
+Generación automática del roster de turnos del personal.
+Asigna personal a los turnos Mañana/Tarde/Noche cubriendo los requisitos por
+especialidad, respetando disponibilidad, descanso mínimo y tope semanal.
+"""
+import math
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime, timedelta
+import db
+
+# Hora de inicio y duración (horas) de cada turno
+TURNOS = {
+    'Mañana': (7, 8),
+    'Tarde': (15, 8),
+    'Noche': (23, 8),
+}
+DESCANSO_MINIMO_HORAS = 12
+MAX_TURNOS_SEMANA = 5
+PRESUPUESTO_SEGUNDOS = 5.0
+
+
+class Roster:
+    """Resultado de la planificación: turnos asignados y cobertura faltante."""
+    def __init__(self, desde, hasta, asignaciones, faltantes, segundos):
+        self.desde = desde
+        self.hasta = hasta
+        self.asignaciones = asignaciones  # (personal_id, inicio, fin, tipo)
+        self.faltantes = faltantes  # (inicio, tipo, especialidad, cantidad faltante)
+        self.segundos = segundos
+
+    def guardar(self):
+        db.guardar_turnos(self.asignaciones, self.desde, self.hasta)
+
+
+def proximo_turno(momento):
+    """Inicio del primer turno que empieza en `momento` o después (el roster nuevo no toca los turnos en curso)."""
+    dia = datetime.combine(momento.date(), datetime.min.time())
+    return min(inicio for inicio in (dia + timedelta(days=d, hours=hora) for d in (0, 1) for hora, _ in TURNOS.values())
+               if inicio >= momento)
+
+
+def cobertura_por_defecto(personal):
+    """Requisito por turno y especialidad según la dotación activa (reparte MAX_TURNOS_SEMANA por persona)."""
+    por_especialidad = defaultdict(int)
+    for p in personal:
+        if p.estado == 'Activo':
+            por_especialidad[p.especialidad or 'General'] += 1
+    turnos_semana = 7 * len(TURNOS)
+    requisito = {esp: max(1, math.floor(n * MAX_TURNOS_SEMANA / turnos_semana)) for esp, n in por_especialidad.items()}
+    return {tipo: dict(requisito) for tipo in TURNOS}
+
+
+class _Planificador:
+    def __init__(self, personal, desde, semanas, cobertura, no_disponible):
+        # `desde` puede ser una fecha o un momento: los turnos que empiezan antes no se planifican
+        self.comienzo = desde if isinstance(desde, datetime) else datetime.combine(desde, datetime.min.time())
+        self.desde = datetime.combine(self.comienzo.date(), datetime.min.time())
+        self.semanas = semanas
+        self.cobertura = cobertura
+        self.no_disponible = no_disponible
+        self.descanso = timedelta(hours=DESCANSO_MINIMO_HORAS)
+        self.preferencia = {}
+        self.por_especialidad = defaultdict(list)
+        for p in personal:
+            if p.estado != 'Activo':
+                continue
+            self.por_especialidad[p.especialidad or 'General'].append(p.id)
+            self.preferencia[p.id] = p.turno
+        self.agenda = defaultdict(list)  # personal_id -> [(inicio, fin, tipo)] ordenada
+        self.por_semana = defaultdict(int)  # (personal_id, semana) -> turnos
+        self.total = defaultdict(int)
+        self.cubiertos = defaultdict(list)  # (inicio, tipo, especialidad) -> [personal_id]
+
+    def franjas(self):
+        for dia in range(self.semanas * 7):
+            fecha = self.desde + timedelta(days=dia)
+            for tipo, (hora, duracion) in TURNOS.items():
+                inicio = fecha + timedelta(hours=hora)
+                if inicio >= self.comienzo:
+                    yield inicio, inicio + timedelta(hours=duracion), tipo
+
+    def _semana(self, inicio):
+        return (inicio - self.desde).days // 7
+
+    def puede(self, personal_id, inicio, fin):
+        if inicio.date() in self.no_disponible.get(personal_id, ()):
+            return False
+        if self.por_semana[(personal_id, self._semana(inicio))] >= MAX_TURNOS_SEMANA:
+            return False
+        agenda = self.agenda[personal_id]
+        i = bisect_left(agenda, (inicio,))
+        if i > 0 and agenda[i - 1][1] + self.descanso > inicio:
+            return False
+        if i < len(agenda) and fin + self.descanso > agenda[i][0]:
+            return False
+        return True
+
+    def costo(self, personal_id, inicio, tipo):
+        # Menos turnos en la semana y en total primero; luego respetar el turno preferido
+        return (self.por_semana[(personal_id, self._semana(inicio))], self.total[personal_id],
+                0 if self.preferencia.get(personal_id) == tipo else 1)
+
+    def fijar(self, previos):
+        """
+        Turnos que se conservan (los que empiezan antes del comienzo): cuentan para el
+        descanso y el tope semanal, pero no están en `cubiertos` ni en `total`, así que
+        la nivelación de mejorar() no los mueve.
+        """
+        for personal_id, inicio, fin, tipo in previos:
+            inicio, fin = _fecha(inicio), _fecha(fin)
+            insort(self.agenda[personal_id], (inicio, fin, tipo))
+            if inicio >= self.desde:
+                self.por_semana[(personal_id, self._semana(inicio))] += 1
+
+    def asignar(self, personal_id, inicio, fin, tipo, especialidad):
+        insort(self.agenda[personal_id], (inicio, fin, tipo))
+        self.por_semana[(personal_id, self._semana(inicio))] += 1
+        self.total[personal_id] += 1
+        self.cubiertos[(inicio, tipo, especialidad)].append(personal_id)
+
+    def quitar(self, personal_id, inicio, fin, tipo, especialidad):
+        self.agenda[personal_id].remove((inicio, fin, tipo))
+        self.por_semana[(personal_id, self._semana(inicio))] -= 1
+        self.total[personal_id] -= 1
+        self.cubiertos[(inicio, tipo, especialidad)].remove(personal_id)
+
+    def voraz(self):
+        """Recorre los turnos en orden cronológico y elige a los candidatos de menor costo."""
+        for inicio, fin, tipo in self.franjas():
+            for especialidad, cantidad in self.cobertura.get(tipo, {}).items():
+                candidatos = [pid for pid in self.por_especialidad.get(especialidad, ())
+                              if self.puede(pid, inicio, fin)]
+                candidatos.sort(key=lambda pid: self.costo(pid, inicio, tipo))
+                for pid in candidatos[:cantidad]:
+                    self.asignar(pid, inicio, fin, tipo, especialidad)
+
+    def mejorar(self, limite):
+        """
+        Búsqueda local con tope de tiempo: cubre huecos y traslada turnos del más
+        cargado al menos cargado de cada especialidad mientras haya mejora.
+        """
+        franjas = list(self.franjas())
+        hubo_mejora = True
+        while hubo_mejora and time.monotonic() < limite:
+            hubo_mejora = False
+            # 1) Cubrir faltantes relajando la preferencia de turno
+            for inicio, fin, tipo in franjas:
+                for especialidad, cantidad in self.cobertura.get(tipo, {}).items():
+                    asignados = self.cubiertos[(inicio, tipo, especialidad)]
+                    if len(asignados) >= cantidad:
+                        continue
+                    for pid in sorted(self.por_especialidad.get(especialidad, ()), key=self.total.__getitem__):
+                        if pid not in asignados and self.puede(pid, inicio, fin):
+                            self.asignar(pid, inicio, fin, tipo, especialidad)
+                            hubo_mejora = True
+                            if len(asignados) >= cantidad:
+                                break
+                if time.monotonic() >= limite:
+                    return
+            # 2) Nivelar la carga dentro de cada especialidad
+            for especialidad, ids in self.por_especialidad.items():
+                if len(ids) < 2:
+                    continue
+                mas = max(ids, key=self.total.__getitem__)
+                menos = min(ids, key=self.total.__getitem__)
+                if self.total[mas] - self.total[menos] < 2:
+                    continue
+                for inicio, fin, tipo in list(self.agenda[mas]):
+                    asignados = self.cubiertos.get((inicio, tipo, especialidad), ())
+                    if mas not in asignados or menos in asignados:
+                        continue  # turno fijado (previos) o que el otro ya cubre
+                    self.quitar(mas, inicio, fin, tipo, especialidad)
+                    if self.puede(menos, inicio, fin):
+                        self.asignar(menos, inicio, fin, tipo, especialidad)
+                        hubo_mejora = True
+                        break
+                    self.asignar(mas, inicio, fin, tipo, especialidad)
+
+    def resultado(self):
+        asignaciones = []
+        faltantes = []
+        for inicio, fin, tipo in self.franjas():
+            for especialidad, cantidad in self.cobertura.get(tipo, {}).items():
+                asignados = self.cubiertos[(inicio, tipo, especialidad)]
+                asignaciones.extend((pid, inicio, fin, tipo) for pid in asignados)
+                if len(asignados) < cantidad:
+                    faltantes.append((inicio, tipo, especialidad, cantidad - len(asignados)))
+        return asignaciones, faltantes
+
+
+def _fecha(valor):
+    return valor if isinstance(valor, datetime) else datetime.fromisoformat(valor)
+
+
+def generar_roster(personal, desde, semanas=4, cobertura=None, no_disponible=None, previos=(),
+                   presupuesto_segundos=PRESUPUESTO_SEGUNDOS):
+    """
+    Genera el roster de `semanas` semanas a partir de `desde`: una fecha (desde las 00:00)
+    o un momento, p. ej. proximo_turno(ahora), y entonces sólo los turnos que empiezan
+    después; al guardarlo se reemplazan los turnos desde ese momento.
+
+    `personal` son filas de db.personal(); `cobertura` es {tipo_turno: {especialidad: cantidad}}
+    (por defecto, cobertura_por_defecto); `no_disponible` es {personal_id: {fechas}};
+    `previos` son los turnos (personal_id, inicio, fin, tipo) que se conservan antes de
+    `desde` (db.turnos_personal), para respetar el descanso de quien sale de guardia.
+    """
+    comienzo = time.monotonic()
+    cobertura = cobertura or cobertura_por_defecto(personal)
+    planificador = _Planificador(personal, desde, semanas, cobertura, no_disponible or {})
+    planificador.fijar(previos)
+    planificador.voraz()
+    planificador.mejorar(comienzo + presupuesto_segundos)
+    asignaciones, faltantes = planificador.resultado()
+    hasta = planificador.desde + timedelta(days=semanas * 7)
+    return Roster(planificador.comienzo, hasta, asignaciones, faltantes, time.monotonic() - comienzo)
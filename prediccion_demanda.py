@@ -0,0 +1,94 @@
+"""
+Previsión de llegadas por hora para el tablero de inicio.
+Modelo estacional día de la semana x hora con suavizado exponencial: cada hora
+cerrada actualiza solo su casilla, así que refrescar cuesta lo que cuesta leer
+las horas nuevas desde la última actualización.
+"""
+from datetime import datetime, timedelta
+import numpy as np
+import db
+
+ALFA = 0.2
+SEMANAS_AJUSTE = 8
+HORAS_NIVEL = 3
+HORAS_SEMANA = 7 * 24
+UNA_HORA = timedelta(hours=1)
+
+
+def _truncar_hora(momento):
+    return momento.replace(minute=0, second=0, microsecond=0)
+
+
+def _franjas(desde, horas):
+    """Índice (día de la semana * 24 + hora) de cada hora a partir de `desde`."""
+    base = desde.weekday() * 24 + desde.hour
+    return (base + np.arange(horas)) % HORAS_SEMANA
+
+
+def _conteos(desde, hasta):
+    horas = int((hasta - desde) / UNA_HORA)
+    conteos = np.zeros(horas)
+    for hora, cantidad in db.llegadas_por_hora(desde, hasta):
+        conteos[int((datetime.strptime(hora, '%Y-%m-%d %H') - desde) / UNA_HORA)] = cantidad
+    return conteos
+
+
+class PrevisionLlegadas:
+    def __init__(self, alfa=ALFA, semanas_ajuste=SEMANAS_AJUSTE):
+        self.alfa = alfa
+        self.semanas_ajuste = semanas_ajuste
+        self.estacional = None  # llegadas esperadas por (día de la semana, hora), 7 x 24
+        self._hasta = None  # primera hora todavía no incorporada al modelo
+        self._recientes = np.zeros(HORAS_NIVEL)
+        self._esperadas_recientes = np.zeros(HORAS_NIVEL)
+
+    def ajustar(self, ahora=None):
+        """Ajuste inicial: promedio de cada franja en las últimas semanas."""
+        hasta = _truncar_hora(ahora or datetime.now())
+        desde = hasta - timedelta(weeks=self.semanas_ajuste)
+        conteos = _conteos(desde, hasta)
+        franjas = _franjas(desde, len(conteos))
+        promedio = np.bincount(franjas, weights=conteos, minlength=HORAS_SEMANA) / np.bincount(franjas, minlength=HORAS_SEMANA)
+        self.estacional = promedio.reshape(7, 24)
+        self._hasta = hasta
+        self._recientes = conteos[-HORAS_NIVEL:]
+        self._esperadas_recientes = promedio[franjas[-HORAS_NIVEL:]]
+
+    def actualizar(self, ahora=None):
+        """Incorpora las horas cerradas desde la última actualización."""
+        if self.estacional is None:
+            self.ajustar(ahora)
+            return
+        hasta = _truncar_hora(ahora or datetime.now())
+        if hasta <= self._hasta:
+            return
+        conteos = _conteos(self._hasta, hasta)
+        franjas = _franjas(self._hasta, len(conteos))
+        plano = self.estacional.reshape(-1)
+        esperadas = np.empty_like(conteos)
+        # De a una semana por vez: dentro de una semana ninguna franja se repite
+        for inicio in range(0, len(conteos), HORAS_SEMANA):
+            tramo = slice(inicio, inicio + HORAS_SEMANA)
+            esperadas[tramo] = plano[franjas[tramo]]
+            plano[franjas[tramo]] = self.alfa * conteos[tramo] + (1 - self.alfa) * esperadas[tramo]
+        self._hasta = hasta
+        self._recientes = np.concatenate([self._recientes, conteos])[-HORAS_NIVEL:]
+        self._esperadas_recientes = np.concatenate([self._esperadas_recientes, esperadas])[-HORAS_NIVEL:]
+
+    def nivel(self):
+        """Factor de ajuste por demanda reciente por encima o por debajo de lo habitual."""
+        return float(np.clip((self._recientes.sum() + 1) / (self._esperadas_recientes.sum() + 1), 0.5, 2.0))
+
+    def prevision(self, horas=8, ahora=None):
+        """Llegadas esperadas en cada una de las próximas `horas`: [(hora, esperadas)]."""
+        ahora = ahora or datetime.now()
+        self.actualizar(ahora)
+        desde = _truncar_hora(ahora)
+        esperadas = self.estacional.reshape(-1)[_franjas(desde, horas)] * self.nivel()
+        return [(desde + i * UNA_HORA, float(valor)) for i, valor in enumerate(esperadas)]
+
+
+_prevision = PrevisionLlegadas()
+
+def prevision_llegadas(horas=8):
+    return _prevision.prevision(horas)
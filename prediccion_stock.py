@@ -0,0 +1,106 @@
+"""
+Pronóstico de agotamiento de recursos.
+Calcula tasas de consumo por recurso a partir del libro de movimientos y proyecta
+en cuántas horas se quedará sin stock cada uno.
+"""
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import db
+from modelos import Recurso
+
+VENTANA_LARGA_HORAS = 72
+VENTANA_CORTA_HORAS = 6
+UMBRAL_HORAS = 12
+INTERVALO_REFRESCO = 180  # segundos
+
+
+class PronosticoStock:
+    """
+    Mantiene en memoria los consumos de la ventana larga y solo pide a la base los
+    movimientos nuevos (id mayor al último visto). El resultado se guarda hasta que
+    vence el intervalo de refresco.
+    """
+    def __init__(self, ventana_larga_horas=VENTANA_LARGA_HORAS, ventana_corta_horas=VENTANA_CORTA_HORAS,
+                 intervalo_refresco=INTERVALO_REFRESCO):
+        self.ventana_larga = ventana_larga_horas
+        self.ventana_corta = ventana_corta_horas
+        self.intervalo_refresco = intervalo_refresco
+        self._consumos = pd.DataFrame({
+            'recurso_id': pd.Series(dtype='int64'),
+            'unidades': pd.Series(dtype='float64'),
+            'fecha': pd.Series(dtype='datetime64[ns]'),
+        })
+        self._ultimo_id = 0
+        self._primer_consumo = None
+        self._ultimo_refresco = 0.0
+        self._resultado = None
+
+    def _cargar_consumos(self, ahora):
+        inicio = ahora - timedelta(hours=self.ventana_larga)
+        nuevos = db.consumos_desde(self._ultimo_id, inicio.isoformat(sep=' '))
+        if nuevos:
+            ids, recursos, unidades, fechas = zip(*nuevos)
+            self._ultimo_id = ids[-1]
+            nuevos_df = pd.DataFrame({
+                'recurso_id': np.asarray(recursos, dtype='int64'),
+                'unidades': np.asarray(unidades, dtype='float64'),
+                'fecha': pd.to_datetime(pd.Series(fechas), format='ISO8601'),
+            })
+            self._consumos = pd.concat([self._consumos, nuevos_df], ignore_index=True)
+            if self._primer_consumo is None:
+                self._primer_consumo = nuevos_df['fecha'].min()
+        # Descartar lo que salió de la ventana larga
+        vigentes = self._consumos['fecha'] >= pd.Timestamp(inicio)
+        if not vigentes.all():
+            self._consumos = self._consumos[vigentes].reset_index(drop=True)
+
+    def _horas_observadas(self, ventana, ahora):
+        # Con poco historial se divide por el tiempo realmente observado, no por toda la ventana
+        if self._primer_consumo is None:
+            return float(ventana)
+        observadas = (pd.Timestamp(ahora) - self._primer_consumo) / pd.Timedelta(hours=1)
+        return float(np.clip(observadas, 1.0, ventana))
+
+    def _calcular(self, ahora):
+        recursos = db.recursos()
+        stock = pd.DataFrame(recursos, columns=Recurso._fields)
+        if stock.empty:
+            return stock.assign(tasa_hora=[], horas_restantes=[])
+        consumos = self._consumos
+        corte = pd.Timestamp(ahora - timedelta(hours=self.ventana_corta))
+        larga = consumos.groupby('recurso_id')['unidades'].sum() / self._horas_observadas(self.ventana_larga, ahora)
+        corta = consumos[consumos['fecha'] >= corte].groupby('recurso_id')['unidades'].sum() \
+            / self._horas_observadas(self.ventana_corta, ahora)
+        # Se toma la mayor de las dos tasas: una noche movida adelanta la alerta
+        tasa = np.maximum(larga.reindex(stock['id'], fill_value=0.0).to_numpy(),
+                          corta.reindex(stock['id'], fill_value=0.0).to_numpy())
+        cantidad = stock['cantidad'].fillna(0).to_numpy(dtype='float64')
+        horas = np.full(len(stock), np.inf)
+        np.divide(cantidad, tasa, out=horas, where=tasa > 0)
+        return stock.assign(tasa_hora=tasa, horas_restantes=horas).sort_values('horas_restantes')
+
+    def pronostico(self, forzar=False):
+        """Devuelve un DataFrame con la tasa de consumo y las horas restantes de cada recurso."""
+        if forzar or self._resultado is None or time.monotonic() - self._ultimo_refresco >= self.intervalo_refresco:
+            ahora = datetime.now()
+            self._cargar_consumos(ahora)
+            self._resultado = self._calcular(ahora)
+            self._ultimo_refresco = time.monotonic()
+        return self._resultado
+
+    def alertas(self, umbral_horas=UMBRAL_HORAS):
+        """
+        Recursos que se agotarán dentro de `umbral_horas`: (id, tipo, nombre, cantidad, tasa_hora, horas_restantes).
+        Los ya agotados no: figuran en los recursos críticos y no se cuentan dos veces.
+        """
+        df = self.pronostico()
+        df = df[(df['horas_restantes'] <= umbral_horas) & (df['cantidad'] > 0)]
+        return list(df[['id', 'tipo', 'nombre', 'cantidad', 'tasa_hora', 'horas_restantes']].itertuples(index=False, name=None))
+
+
+_pronostico = PronosticoStock()
+
+def alertas_agotamiento(umbral_horas=UMBRAL_HORAS):
+    return _pronostico.alertas(umbral_horas)
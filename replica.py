@@ -0,0 +1,197 @@
+"""
+Réplica de lectura de la base para reportes, listados y búsquedas.
+Cada INTERVALO_SEGUNDOS se copia la base principal con la API de backup a una
+base nueva (en archivo, o en memoria) y se pasa a leer de esa copia, así las
+consultas pesadas no compiten con los puestos que escriben. Cada copia tiene su
+propio nombre: una lectura larga que empezó en la anterior la sigue leyendo
+entera. La primera copia se hace en segundo plano; mientras tanto se lee de la
+base principal.
+
+En memoria hay hasta dos copias completas de la base a la vez; sólo conviene
+con bases chicas.
+
+Copiar una base de varios GB cada minuto es caro: si la base principal no cambió
+desde la última copia (PRAGMA data_version) no se copia, y entre copias se espera
+lo necesario para no pasar más de FRACCION_COPIANDO del tiempo copiando.
+
+Desfase: los datos de la réplica tienen a lo sumo el intervalo entre copias más lo
+que tarde una copia (ver Replica.desfase_maximo()). Lo escrito desde este mismo proceso se
+lee siempre actualizado: después de una escritura local db.py vuelve a leer de
+la base principal hasta el siguiente refresco.
+"""
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import db
+import respaldos
+
+MODO = 'archivo'  # 'archivo', 'memoria' o None para no usar réplica
+INTERVALO_SEGUNDOS = 60
+FRACCION_COPIANDO = 0.1  # con bases grandes el intervalo crece con lo que tarda la copia
+ARCHIVO_REPLICA = 'replica_guardia.db'
+
+
+class Replica:
+    def __init__(self, db_path=db.DB_PATH, archivo=None, intervalo=INTERVALO_SEGUNDOS):
+        self.db_path = db_path
+        self.archivo = archivo  # None: en memoria
+        self.intervalo = intervalo
+        self.refrescada_en = None  # time.time() del comienzo de la copia vigente
+        self.duracion_refresco = 0.0
+        self.error = None
+        self._copias = 0  # numera las copias: cada una con su propia URI
+        self._activa = None  # URI de la copia vigente
+        self._numero_activa = None
+        self._anclas = {}  # mantiene viva cada base en memoria mientras se usa
+        self._anteriores = []  # archivos de copias reemplazadas, se borran cuando se puede
+        self._escritura_local = 0.0
+        self._monitor = None  # conexión propia a la base principal para PRAGMA data_version
+        self._version_copiada = None  # data_version de la base principal al tomar la copia vigente
+        self._bloqueo = threading.Lock()
+        self._detener = threading.Event()
+        self._copiada = threading.Event()  # ya hay una primera copia
+        self._hilo = None
+
+    def _ruta(self, numero):
+        return f'{self.archivo}.{os.getpid()}.{numero}'
+
+    def _uri(self, numero):
+        if self.archivo is None:
+            return f'file:replica_guardia_{id(self)}_{numero}?mode=memory&cache=shared'
+        return Path(self._ruta(numero)).resolve().as_uri()
+
+    def _borrar_anteriores(self):
+        for ruta in list(self._anteriores):
+            try:
+                for sufijo in ('', '-wal', '-shm'):
+                    if os.path.exists(ruta + sufijo):
+                        os.remove(ruta + sufijo)
+            except OSError:
+                continue  # todavía abierta por una lectura (Windows): se reintenta en el próximo refresco
+            self._anteriores.remove(ruta)
+
+    def _version_principal(self):
+        # Cambia sólo si otra conexión (de este u otro proceso) confirmó cambios, y consultarlo no toca el disco
+        if self._monitor is None:
+            self._monitor = sqlite3.connect(Path(self.db_path).resolve().as_uri() + '?mode=ro', uri=True,
+                                            check_same_thread=False)
+        return self._monitor.execute('PRAGMA data_version').fetchone()[0]
+
+    def _sin_cambios(self):
+        """True si la base principal no cambió desde la última copia: la copia vigente sigue al día."""
+        if self._version_copiada is None:
+            return False
+        marca = time.time()
+        if self._version_principal() != self._version_copiada:
+            return False
+        with self._bloqueo:
+            self.refrescada_en = marca
+        return True
+
+    def refrescar(self):
+        """Copia la base principal en una base nueva y la pone en uso."""
+        inicio = time.time()
+        version = self._version_principal()  # antes de copiar: un cambio durante la copia fuerza la siguiente
+        self._copias += 1
+        numero = self._copias
+        uri = self._uri(numero)
+        destino = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        try:
+            with db.get_db_connection(self.db_path, solo_lectura=True) as origen:
+                respaldos.copiar_base(origen, destino)
+        except Exception:
+            destino.close()
+            if self.archivo is not None:
+                self._anteriores.append(self._ruta(numero))
+            raise
+        with self._bloqueo:
+            anterior = self._numero_activa
+            ancla = self._anclas.pop(self._activa, None)
+            if self.archivo is None:
+                self._anclas[uri] = destino
+            else:
+                destino.close()
+            self._activa, self._numero_activa = uri, numero
+            self.refrescada_en = inicio
+            self._version_copiada = version
+        self._copiada.set()
+        if ancla is not None:
+            ancla.close()  # las lecturas en curso la mantienen abierta hasta terminar
+        if anterior is not None and self.archivo is not None:
+            # En POSIX las lecturas que la tienen abierta terminan igual
+            self._anteriores.append(self._ruta(anterior))
+        self._borrar_anteriores()
+        self.duracion_refresco = time.time() - inicio
+
+    def esperar(self, timeout=None):
+        """Espera la primera copia (p. ej. en los benchmarks); devuelve True si ya está."""
+        return self._copiada.wait(timeout)
+
+    def disponible(self):
+        """True si hay una copia vigente y no hubo escrituras de este proceso posteriores a ella."""
+        return self._activa is not None and self._escritura_local < self.refrescada_en
+
+    def escritura_local(self):
+        self._escritura_local = time.time()
+
+    def conectar(self):
+        with self._bloqueo:
+            uri = self._activa
+        conn = sqlite3.connect(uri if self.archivo is None else uri + '?mode=ro', uri=True)
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def desfase(self):
+        """Antigüedad en segundos de los datos de la réplica (None si todavía no se copió)."""
+        return None if self.refrescada_en is None else time.time() - self.refrescada_en
+
+    def _espera(self):
+        return max(self.intervalo, self.duracion_refresco / FRACCION_COPIANDO)
+
+    def desfase_maximo(self):
+        return self._espera() + self.duracion_refresco
+
+    def _ejecutar(self):
+        # La primera copia al arrancar, sin demorar el inicio de la aplicación
+        espera = 0
+        while not self._detener.wait(espera):
+            try:
+                if not self._sin_cambios():
+                    self.refrescar()
+                self.error = None
+            except Exception as e:
+                self.error = e  # se sigue con la copia anterior; desfase() lo refleja
+            espera = self._espera()
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ejecutar, name='replica', daemon=True)
+            self._hilo.start()
+        return self
+
+    def detener(self, timeout=5.0):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)  # que un refresco en curso no deje una copia después de limpiar
+        for conn in self._anclas.values():
+            conn.close()
+        self._anclas.clear()
+        if self._monitor is not None:
+            self._monitor.close()
+            self._monitor = None
+        if self.archivo is not None and self._numero_activa is not None:
+            self._anteriores.append(self._ruta(self._numero_activa))
+            self._activa = self._numero_activa = None
+        self._borrar_anteriores()
+
+
+def iniciar(modo=MODO, intervalo=INTERVALO_SEGUNDOS, db_path=db.DB_PATH):
+    """Crea la réplica según `modo`, la pone en uso en db.py y la devuelve (None si está desactivada)."""
+    if modo is None:
+        db.usar_replica(None)
+        return None
+    replica = Replica(db_path, ARCHIVO_REPLICA if modo == 'archivo' else None, intervalo).iniciar()
+    db.usar_replica(replica)
+    return replica
@@ -0,0 +1,166 @@
+"""
+Generación de reportes en segundo plano.
+Cada reporte se parte por mes; los meses se calculan en un pool de procesos con
+conexiones de solo lectura y prioridad baja, y luego se combinan y se escriben
+a PDF o XLSX también fuera del proceso de la interfaz.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import db
+import analitica
+
+FORMATOS = ('PDF', 'XLSX')
+PRIORIDAD_TRABAJADORES = 10  # incremento de nice: la guardia tiene prioridad sobre los reportes
+
+
+def _inicializar_trabajador():
+    if hasattr(os, 'nice'):
+        os.nice(PRIORIDAD_TRABAJADORES)
+
+
+def particionar_por_mes(desde, hasta):
+    """Divide [desde, hasta) en tramos que no cruzan el límite de un mes."""
+    tramos = []
+    inicio = desde
+    while inicio < hasta:
+        siguiente_mes = datetime(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+        fin = min(siguiente_mes, hasta)
+        tramos.append((inicio, fin))
+        inicio = fin
+    return tramos
+
+
+def _resumen_tramo(db_path, desde, hasta):
+    return analitica.calcular_resumen(desde, hasta, db_path=db_path, solo_lectura=True)
+
+
+def _escribir_xlsx(resumen, destino):
+    import pandas as pd
+    with pd.ExcelWriter(destino, engine='openpyxl') as writer:
+        pd.DataFrame({
+            'Indicador': ['Desde', 'Hasta', 'Consultas', 'Canceladas'],
+            'Valor': [str(resumen.desde), str(resumen.hasta), resumen.total,
+                      int(resumen.estados_por_dia['canceladas'].sum()) if not resumen.estados_por_dia.empty else 0],
+        }).to_excel(writer, sheet_name='Resumen', index=False)
+        pd.DataFrame(resumen.mapa_calor, index=analitica.DIAS_SEMANA).to_excel(writer, sheet_name='Llegadas por hora')
+        resumen.por_medico.rename('Atendidas').to_excel(writer, sheet_name='Por médico')
+        resumen.mix_prioridad.to_excel(writer, sheet_name='Prioridades por día')
+        resumen.estados_por_dia.assign(tasa=resumen.tasa_cancelacion).to_excel(writer, sheet_name='Cancelaciones')
+
+
+def _escribir_pdf(resumen, destino):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+    estilos = getSampleStyleSheet()
+    estilo_tabla = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ])
+    elementos = [
+        Paragraph("Reporte de Guardia", estilos['Title']),
+        Paragraph(f"Período: {resumen.desde:%d/%m/%Y} - {resumen.hasta:%d/%m/%Y} · {resumen.total} consultas", estilos['Normal']),
+        Spacer(1, 12),
+        Paragraph("Consultas atendidas por médico", estilos['Heading2']),
+        Table([['Médico', 'Atendidas']] + [[str(m), int(n)] for m, n in resumen.por_medico.items()], style=estilo_tabla),
+        Spacer(1, 12),
+        Paragraph("Prioridades por mes", estilos['Heading2']),
+    ]
+    mensual = resumen.mix_prioridad.resample('MS').sum() if not resumen.mix_prioridad.empty else resumen.mix_prioridad
+    elementos.append(Table([['Mes'] + list(mensual.columns)] +
+                           [[f"{mes:%m/%Y}"] + [int(v) for v in fila] for mes, fila in mensual.iterrows()], style=estilo_tabla))
+    SimpleDocTemplate(destino, pagesize=A4).build(elementos)
+
+
+def _escribir_reporte(resumen, formato, destino):
+    if formato == 'XLSX':
+        _escribir_xlsx(resumen, destino)
+    else:
+        _escribir_pdf(resumen, destino)
+    return destino
+
+
+class TrabajoReporte:
+    """
+    Reporte en curso. La interfaz llama a actualizar() periódicamente (con
+    root.after) para avanzar de etapa sin bloquearse.
+    """
+    def __init__(self, pool, desde, hasta, formato, destino, db_path):
+        self._pool = pool
+        self.desde = desde
+        self.hasta = hasta
+        self.formato = formato
+        self.destino = destino
+        self._tramos = [pool.submit(_resumen_tramo, db_path, inicio, fin)
+                        for inicio, fin in particionar_por_mes(desde, hasta)]
+        self._escritura = None
+        self.cancelado = False
+        self.error = None
+
+    @property
+    def total_pasos(self):
+        return len(self._tramos) + 1
+
+    @property
+    def pasos_hechos(self):
+        hechos = sum(f.done() for f in self._tramos)
+        return hechos + (1 if self._escritura is not None and self._escritura.done() else 0)
+
+    @property
+    def terminado(self):
+        return self.cancelado or self.error is not None or (self._escritura is not None and self._escritura.done())
+
+    def actualizar(self):
+        """Avanza el trabajo si corresponde; devuelve la fracción completada (0 a 1)."""
+        if self.terminado:
+            return 1.0
+        try:
+            if self._escritura is None and all(f.done() for f in self._tramos):
+                resumen = analitica.Resumen(self.desde, self.hasta)
+                for futuro in self._tramos:
+                    resumen.combinar(futuro.result())
+                self._escritura = self._pool.submit(_escribir_reporte, resumen.ordenar(), self.formato, self.destino)
+            elif self._escritura is not None and self._escritura.done():
+                self._escritura.result()
+        except Exception as e:
+            self.error = e
+        return self.pasos_hechos / self.total_pasos
+
+    def cancelar(self):
+        """Cancela los meses pendientes; los que ya están corriendo terminan pero se descartan."""
+        self.cancelado = True
+        for futuro in self._tramos:
+            futuro.cancel()
+        if self._escritura is not None:
+            self._escritura.cancel()
+
+
+class GestorReportes:
+    """Mantiene un único pool de procesos para todos los reportes de la sesión."""
+    def __init__(self, max_trabajadores=None):
+        self.max_trabajadores = max_trabajadores or max(1, (os.cpu_count() or 2) - 1)
+        self._pool = None
+
+    def _obtener_pool(self):
+        if self._pool is None:
+            # spawn: los trabajadores no heredan Tk ni conexiones abiertas del proceso principal
+            self._pool = ProcessPoolExecutor(max_workers=self.max_trabajadores,
+                                             mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_inicializar_trabajador)
+        return self._pool
+
+    def generar(self, desde, hasta, formato, destino, db_path=db.DB_PATH):
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato no soportado: {formato}")
+        return TrabajoReporte(self._obtener_pool(), desde, hasta, formato, destino, os.path.abspath(db_path))
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
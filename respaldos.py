@@ -0,0 +1,243 @@
+"""
+Respaldos en caliente de la base de la guardia.
+Copia la base con la API de backup de SQLite por tramos de páginas, con una
+pausa entre tramos para que los puestos que registran datos puedan escribir,
+verifica la copia con integrity_check, la comprime y conserva sólo las últimas.
+
+Uso por línea de comandos:
+    python respaldos.py crear
+    python respaldos.py listar
+    python respaldos.py restaurar respaldos/hospital_guard-20260101-120000.db.gz
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+import db
+
+DIRECTORIO_RESPALDOS = 'respaldos'
+MAX_RESPALDOS = 14
+INTERVALO_HORAS = 6
+PAGINAS_POR_PASO = 1024  # 4 MB con páginas de 4 KB
+PAUSA_SEGUNDOS = 0.05
+MAX_REINICIOS = 5
+
+
+class RespaldoError(Exception):
+    pass
+
+
+def _nombre_base(db_path):
+    return os.path.splitext(os.path.basename(db_path))[0]
+
+
+def _verificar(ruta):
+    conn = sqlite3.connect(ruta)
+    try:
+        resultado = conn.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        conn.close()
+    if resultado != 'ok':
+        raise RespaldoError(f"La copia {ruta} no pasó la verificación de integridad: {resultado}")
+
+
+def copiar_base(origen, destino, paginas=PAGINAS_POR_PASO, pausa=PAUSA_SEGUNDOS, progreso=None):
+    """
+    Copia `origen` en `destino` (conexiones abiertas) por tramos de `paginas`, con
+    `pausa` segundos entre tramos y llamando a `progreso(copiadas, total)`. En modo
+    WAL se copia dentro de una transacción de lectura: todos los tramos leen la misma
+    foto sin bloquear a los que escriben y la copia no se reinicia. Con el journal
+    clásico esa transacción bloquearía las escrituras, así que se copia sin ella y,
+    si las escrituras la reinician demasiadas veces, se termina en un solo paso.
+    """
+    wal = origen.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal'
+    estado = {'restantes': None, 'reinicios': 0, 'total': None}
+
+    def paso(status, restantes, total):
+        if estado['restantes'] is not None and restantes > estado['restantes']:
+            estado['reinicios'] += 1
+            if estado['reinicios'] > MAX_REINICIOS:
+                raise RespaldoError('reiniciado')
+        estado['restantes'], estado['total'] = restantes, total
+        if progreso:
+            progreso(total - restantes, total)
+        time.sleep(pausa)
+
+    if wal:
+        origen.execute('BEGIN')
+        origen.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()  # fija la foto
+        try:
+            origen.backup(destino, pages=paginas, progress=paso)
+        finally:
+            origen.execute('COMMIT')
+        return
+    try:
+        origen.backup(destino, pages=paginas, progress=paso)
+    except RespaldoError:
+        origen.backup(destino)
+        if progreso:
+            progreso(estado['total'], estado['total'])
+
+
+def _comprimir(origen, destino, bloque=8 * 1024 * 1024):
+    # Bajar a disco de a poco: si se acumulan cientos de MB sin escribir, el
+    # fsync del próximo commit de la guardia tiene que esperar a que se vuelquen.
+    with open(origen, 'rb') as entrada, open(destino, 'wb') as archivo:
+        with gzip.GzipFile(fileobj=archivo, mode='wb', compresslevel=6) as salida:
+            while datos := entrada.read(bloque):
+                salida.write(datos)
+                archivo.flush()
+                os.fsync(archivo.fileno())
+        archivo.flush()
+        os.fsync(archivo.fileno())
+
+
+def _borrar_gradual(ruta, paso=4 * 1024 * 1024):
+    # Liberar un archivo de varios GB de una vez frena el journal del sistema de
+    # archivos (y con él los commits de la base); se achica de a poco antes de borrarlo.
+    tamano = os.path.getsize(ruta)
+    while tamano > paso:
+        tamano -= paso
+        os.truncate(ruta, tamano)
+        time.sleep(PAUSA_SEGUNDOS)
+    os.remove(ruta)
+
+
+def crear_respaldo(db_path=db.DB_PATH, directorio=DIRECTORIO_RESPALDOS, paginas=PAGINAS_POR_PASO,
+                   pausa=PAUSA_SEGUNDOS, conservar=MAX_RESPALDOS, progreso=None):
+    """Crea un respaldo comprimido y verificado; devuelve su ruta."""
+    os.makedirs(directorio, exist_ok=True)
+    marca = datetime.now().strftime('%Y%m%d-%H%M%S')
+    temporal = os.path.join(directorio, f'.{_nombre_base(db_path)}-{marca}.db.tmp')
+    ruta = os.path.join(directorio, f'{_nombre_base(db_path)}-{marca}.db.gz')
+    try:
+        destino = sqlite3.connect(temporal)
+        try:
+            with db.get_db_connection(db_path, solo_lectura=True) as origen:
+                copiar_base(origen, destino, paginas, pausa, progreso)
+        finally:
+            destino.close()
+        _verificar(temporal)
+        _comprimir(temporal, ruta + '.part')
+        os.replace(ruta + '.part', ruta)
+    finally:
+        for sobrante in (temporal, ruta + '.part'):
+            if os.path.exists(sobrante):
+                _borrar_gradual(sobrante)
+    rotar(directorio, conservar, _nombre_base(db_path))
+    return ruta
+
+
+def listar_respaldos(directorio=DIRECTORIO_RESPALDOS, db_path=db.DB_PATH):
+    """Respaldos disponibles, del más reciente al más antiguo."""
+    if not os.path.isdir(directorio):
+        return []
+    prefijo = _nombre_base(db_path) + '-'
+    return sorted((os.path.join(directorio, f) for f in os.listdir(directorio)
+                   if f.startswith(prefijo) and f.endswith('.db.gz')), reverse=True)
+
+
+def rotar(directorio=DIRECTORIO_RESPALDOS, conservar=MAX_RESPALDOS, nombre_base=None):
+    nombre_base = nombre_base or _nombre_base(db.DB_PATH)
+    for viejo in listar_respaldos(directorio, nombre_base + '.db')[conservar:]:
+        os.remove(viejo)
+
+
+def restaurar_respaldo(ruta, db_path=db.DB_PATH, directorio=DIRECTORIO_RESPALDOS):
+    """
+    Reemplaza el contenido de la base por el del respaldo. Antes se respalda el
+    estado actual, y la copia se hace con la API de backup para que las demás
+    conexiones vean la base restaurada y no un archivo a medio escribir.
+    """
+    temporal = os.path.join(directorio, '.restauracion.db.tmp')
+    os.makedirs(directorio, exist_ok=True)
+    try:
+        with gzip.open(ruta, 'rb') as entrada, open(temporal, 'wb') as salida:
+            shutil.copyfileobj(entrada, salida, 1024 * 1024)
+        _verificar(temporal)
+        previo = crear_respaldo(db_path, directorio) if os.path.exists(db_path) else None
+        origen = sqlite3.connect(temporal)
+        destino = sqlite3.connect(db_path)
+        try:
+            origen.backup(destino)
+        finally:
+            origen.close()
+            destino.close()
+    finally:
+        if os.path.exists(temporal):
+            _borrar_gradual(temporal)
+    return previo
+
+
+class ProgramadorRespaldos:
+    """Hilo que crea un respaldo cada `intervalo_horas` mientras la aplicación está abierta."""
+    def __init__(self, intervalo_horas=INTERVALO_HORAS, db_path=db.DB_PATH, directorio=DIRECTORIO_RESPALDOS):
+        self.intervalo = intervalo_horas * 3600
+        self.db_path = db_path
+        self.directorio = directorio
+        self.ultimo = None
+        self.error = None
+        self._bloqueo = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def _tiempo_desde_ultimo(self):
+        respaldos = listar_respaldos(self.directorio, self.db_path)
+        return time.time() - os.path.getmtime(respaldos[0]) if respaldos else None
+
+    def respaldar_ahora(self, progreso=None):
+        # Un solo respaldo a la vez, venga del hilo o de la interfaz
+        with self._bloqueo:
+            try:
+                self.ultimo = crear_respaldo(self.db_path, self.directorio, progreso=progreso)
+                self.error = None
+            except Exception as e:
+                self.error = e
+                raise
+            return self.ultimo
+
+    def _ejecutar(self):
+        transcurrido = self._tiempo_desde_ultimo()
+        espera = 0 if transcurrido is None else max(0, self.intervalo - transcurrido)
+        while not self._detener.wait(espera):
+            try:
+                self.respaldar_ahora()
+            except Exception:
+                pass  # queda en self.error; se reintenta en el próximo intervalo
+            espera = self.intervalo
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ejecutar, name='respaldos', daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+
+def _main(argv):
+    if not argv or argv[0] not in ('crear', 'listar', 'restaurar'):
+        print(__doc__)
+        return 2
+    if argv[0] == 'crear':
+        ruta = crear_respaldo(progreso=lambda hechas, total: print(f"\r{hechas}/{total} páginas", end='', file=sys.stderr))
+        print(file=sys.stderr)
+        print(ruta)
+    elif argv[0] == 'listar':
+        for ruta in listar_respaldos():
+            print(ruta)
+    else:
+        if len(argv) < 2:
+            print("Falta la ruta del respaldo a restaurar")
+            return 2
+        previo = restaurar_respaldo(argv[1])
+        print(f"Base restaurada desde {argv[1]}" + (f" (estado anterior en {previo})" if previo else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_main(sys.argv[1:]))
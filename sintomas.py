@@ -0,0 +1,104 @@
+"""
+Codificación de síntomas de las consultas históricas.
+Las consultas nuevas se codifican al guardarlas (db.py con triage.py); las que ya
+estaban, o todas si cambió el catálogo de triage.SINTOMAS, quedan pendientes y se
+codifican acá por tandas: los motivos se codifican en un pool de procesos con
+prioridad baja mientras este proceso lee la tanda siguiente y escribe, en orden,
+las ya codificadas. Cada tanda es una transacción corta que deja registrado hasta
+dónde se llegó, así que se puede cortar y retomar en cualquier momento.
+
+    python -m guardia sintomas [--procesos N]
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import db
+import triage
+
+TAMANO_LOTE = 5000
+PRIORIDAD_TRABAJADORES = 10  # incremento de nice, como en reportes.py
+
+
+def _inicializar_trabajador():
+    if hasattr(os, 'nice'):
+        os.nice(PRIORIDAD_TRABAJADORES)
+
+
+def codificar_historicas(procesos=None, tamano_lote=TAMANO_LOTE, progreso=None, detener=None):
+    """
+    Codifica las consultas pendientes; devuelve cuántos síntomas guardó. `progreso`
+    se llama con (id alcanzado, último id pendiente) al empezar y después de cada
+    tanda; si `detener` (threading.Event) se activa se para al terminar la tanda en curso.
+    """
+    pendiente = db.codificacion_pendiente()
+    if pendiente is None:
+        return 0
+    desde, hasta = pendiente
+    procesos = procesos or max(1, (os.cpu_count() or 2) - 1)
+    if progreso:
+        progreso(desde, hasta)
+
+    def tandas(pool):
+        """Tandas ya codificadas, en orden de id, con hasta dos por proceso en vuelo: el pool no espera a la base."""
+        inicio = desde
+        en_curso = deque()
+        try:
+            while not (detener is not None and detener.is_set()):
+                while len(en_curso) < 2 * procesos and inicio < hasta:
+                    filas = db.consultas_a_codificar(inicio, hasta, tamano_lote)
+                    fin = filas[-1][0] if len(filas) == tamano_lote else hasta
+                    en_curso.append((inicio, fin, pool.submit(triage.codificar_lote, filas)))
+                    inicio = fin
+                if not en_curso:
+                    return
+                tramo_desde, tramo_hasta, futuro = en_curso.popleft()
+                yield tramo_desde, tramo_hasta, futuro.result()
+        finally:
+            for _, _, futuro in en_curso:
+                futuro.cancel()
+
+    # spawn: los trabajadores sólo importan triage, no heredan Tk ni conexiones abiertas
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_inicializar_trabajador) as pool:
+        return db.guardar_codificacion(tandas(pool), progreso and (lambda alcanzado: progreso(alcanzado, hasta)))
+
+
+class CodificacionEnSegundoPlano:
+    """Corre codificar_historicas en un hilo de la aplicación; la interfaz consulta `avance`."""
+    def __init__(self, procesos=None):
+        self.procesos = procesos
+        self.avance = None  # (id alcanzado, último id) mientras hay pendientes
+        self.error = None
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def _ejecutar(self):
+        try:
+            codificar_historicas(self.procesos, progreso=self._registrar_avance, detener=self._detener)
+        except Exception as e:  # base bloqueada o pool caído: se retoma en la próxima sesión
+            self.error = e
+        finally:
+            self.avance = None
+
+    def _registrar_avance(self, alcanzado, hasta):
+        self.avance = (alcanzado, hasta)
+
+    def iniciar(self):
+        if self._hilo is None and db.codificacion_pendiente() is not None:
+            self._hilo = threading.Thread(target=self._ejecutar, name='sintomas', daemon=True)
+            self._hilo.start()
+            atexit.register(self.detener)
+        return self
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=30)
+
+
+def iniciar(procesos=None):
+    """Empieza a codificar en segundo plano lo pendiente (si hay algo) y devuelve el trabajo."""
+    return CodificacionEnSegundoPlano(procesos).iniciar()
@@ -0,0 +1,91 @@
+"""
+Codificación de síntomas del motivo de consulta y prioridad sugerida de triage.
+Funciones puras (sin acceso a la base) para que db.py pueda guardar los códigos
+en la misma transacción en que se guarda la consulta y para que la codificación
+de las consultas históricas corra en otros procesos (ver sintomas.py).
+"""
+import hashlib
+import re
+from fonetica import normalizar
+
+PRIORIDADES = ('Alta', 'Media', 'Baja')
+
+# código: (descripción, prioridad, expresiones del motivo que lo indican)
+SINTOMAS = {
+    'DOLOR_PECHO': ('Dolor de pecho', 'Alta', ('dolor de pecho', 'dolor en el pecho', 'dolor toracico', 'dolor precordial')),
+    'DISNEA': ('Dificultad para respirar', 'Alta', ('dificultad para respirar', 'ahogo', 'falta de aire', 'disnea')),
+    'CONVULSION': ('Convulsiones', 'Alta', ('convulsion', 'convulsiones')),
+    'PERDIDA_CONCIENCIA': ('Pérdida de conciencia', 'Alta', ('perdida de conciencia', 'inconsciente')),
+    'HEMORRAGIA': ('Hemorragia', 'Alta', ('hemorragia', 'sangrado abundante')),
+    'ACCIDENTE': ('Accidente', 'Alta', ('accidente',)),
+    'QUEMADURA_GRAVE': ('Quemadura grave', 'Alta', ('quemadura grave', 'quemadura extensa')),
+    'PARALISIS': ('Parálisis', 'Alta', ('paralisis',)),
+    'TRAUMATISMO': ('Traumatismo', 'Alta', ('traumatismo',)),
+    'SHOCK': ('Shock', 'Alta', ('shock',)),
+    'INFARTO': ('Infarto', 'Alta', ('infarto', 'ataque cardiaco')),
+    'PARO_CARDIACO': ('Paro cardíaco', 'Alta', ('paro cardiaco',)),
+    'ACV': ('Accidente cerebrovascular', 'Alta', ('ictus', 'accidente cerebrovascular', 'acv')),
+    'FRACTURA_EXPUESTA': ('Fractura expuesta', 'Alta', ('fractura expuesta',)),
+    'DOLOR_ABDOMINAL_INTENSO': ('Dolor abdominal intenso', 'Alta', ('dolor abdominal intenso',)),
+    'HERIDA_PROFUNDA': ('Herida profunda', 'Alta', ('herida profunda',)),
+    'FIEBRE_ALTA': ('Fiebre alta', 'Media', ('fiebre alta',)),
+    'VOMITOS_PERSISTENTES': ('Vómitos persistentes', 'Media', ('vomitos persistentes',)),
+    'FRACTURA': ('Fractura', 'Media', ('fractura',)),
+    'CAIDA': ('Caída', 'Media', ('caida',)),
+    'DOLOR_MODERADO': ('Dolor moderado', 'Media', ('dolor moderado',)),
+    'INFECCION': ('Infección', 'Media', ('infeccion',)),
+    'DIARREA': ('Diarrea', 'Media', ('diarrea',)),
+    'DOLOR_ABDOMINAL': ('Dolor abdominal', 'Media', ('dolor abdominal',)),
+    'HERIDA': ('Herida', 'Media', ('herida',)),
+    'DOLOR_LUMBAR': ('Dolor lumbar', 'Media', ('dolor lumbar',)),
+    'MAREO': ('Mareo', 'Media', ('mareo',)),
+    'TOS_PERSISTENTE': ('Tos persistente', 'Media', ('tos persistente',)),
+    'OTALGIA': ('Dolor de oído', 'Media', ('dolor de oido',)),
+    'ODINOFAGIA': ('Dolor de garganta', 'Media', ('dolor de garganta',)),
+    'CEFALEA_INTENSA': ('Dolor de cabeza fuerte', 'Media', ('dolor de cabeza fuerte',)),
+    'BRONQUITIS': ('Bronquitis', 'Media', ('bronquitis',)),
+    'ASMA': ('Asma', 'Media', ('asma',)),
+    'ALERGIA': ('Alergia', 'Media', ('alergia',)),
+    'DOLOR_ARTICULAR': ('Dolor articular', 'Media', ('dolor articular',)),
+    # No cambian la prioridad, pero se cuentan en las estadísticas
+    'FIEBRE': ('Fiebre', 'Baja', ('fiebre',)),
+    'VOMITOS': ('Vómitos', 'Baja', ('vomitos',)),
+    'CEFALEA': ('Dolor de cabeza', 'Baja', ('dolor de cabeza', 'cefalea')),
+    'TOS': ('Tos', 'Baja', ('tos',)),
+}
+
+# Expresión normalizada -> código. Las más largas primero: una mención ya usada
+# por 'dolor abdominal intenso' no cuenta además como 'dolor abdominal'.
+_CODIGO_POR_EXPRESION = {normalizar(expresion): codigo
+                         for codigo, (_, _, expresiones) in SINTOMAS.items() for expresion in expresiones}
+# Al comienzo de una palabra, pero admite plurales ('heridas', 'fracturas')
+_EXPRESIONES = re.compile(r'\b(?:' + '|'.join(re.escape(e) for e in sorted(_CODIGO_POR_EXPRESION, key=len, reverse=True)) + ')')
+
+
+def version_catalogo():
+    """Cambia si cambia SINTOMAS: db.py vuelve a codificar las consultas con el catálogo nuevo."""
+    return hashlib.sha1(repr(sorted(SINTOMAS.items())).encode()).hexdigest()[:12]
+
+
+def codificar(motivo):
+    """Códigos de los síntomas mencionados en el motivo, sin repetir, en orden de aparición."""
+    codigos = []
+    for encontrada in _EXPRESIONES.finditer(normalizar(motivo)):
+        codigo = _CODIGO_POR_EXPRESION[encontrada.group()]
+        if codigo not in codigos:
+            codigos.append(codigo)
+    return codigos
+
+
+def codificar_lote(filas):
+    """[(consulta_id, motivo)] -> [(consulta_id, motivo, códigos)]; es lo que corre en el pool de sintomas.py."""
+    return [(consulta_id, motivo, codificar(motivo)) for consulta_id, motivo in filas]
+
+
+def prioridad_de(codigos):
+    """La prioridad más alta entre las de los síntomas; 'Baja' si no hay ninguno."""
+    return min((SINTOMAS[codigo][1] for codigo in codigos), key=PRIORIDADES.index, default='Baja')
+
+
+def sugerir_prioridad(motivo):
+    return prioridad_de(codificar(motivo))